@@ -7,3 +7,8 @@ class WorkflowEngineConfig(AppConfig):
 
     def ready(self):
         import ESSArch_Core.WorkflowEngine.signals  # noqa
+
+        from celery.signals import worker_process_init
+        from ESSArch_Core.essxml.util import warm_up_validation
+
+        worker_process_init.connect(warm_up_validation)
@@ -0,0 +1,291 @@
+"""
+    ESSArch is an open source archiving and digital preservation system
+
+    ESSArch Core
+    Copyright (C) 2005-2017 ES Solutions AB
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+    Contact information:
+    Web - http://www.essolutions.se
+    Email - essarch@essolutions.se
+"""
+
+from __future__ import absolute_import
+
+import datetime
+
+from celery import states as celery_states
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Q
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from ESSArch_Core.ip.models import EventIP
+from ESSArch_Core.util import chunks
+from ESSArch_Core.WorkflowEngine.fields import EncodedObject, get_blob_fields, get_blob_reference
+from ESSArch_Core.WorkflowEngine.models import (
+    ArchivedProcessTask,
+    ProcessBlob,
+    ProcessStep,
+    ProcessStepSummary,
+    ProcessTask,
+)
+
+DEFAULT_BATCH_SIZE = 500
+
+# blobs stored more recently than this may be about to be referenced by a
+# value that isn't saved yet and are never deleted
+BLOB_GRACE_PERIOD = datetime.timedelta(hours=1)
+
+DATA_FIELDS = ('args', 'params', 'result_params', 'result', 'meta', 'log')
+TASK_FIELDS = (
+    'id', 'name', 'status', 'processstep_id', 'processstep_pos',
+    'information_package_id', 'responsible_id', 'undone_id', 'retried_id',
+    'undo_type', 'hidden', 'progress', 'time_created', 'time_started',
+    'time_done', 'traceback', 'exception',
+) + DATA_FIELDS
+
+
+def get_retention():
+    return getattr(settings, 'WORKFLOW_TASK_RETENTION', None)  # days
+
+
+def get_batch_size():
+    return getattr(settings, 'WORKFLOW_ARCHIVE_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+
+
+def get_archivable_steps(retention=None):
+    """
+    Gets the ids of all steps with tasks that can be archived.
+
+    All tasks of a step must be finished for it to be archivable, and
+    either the information package of the step is archived or none of its
+    tasks finished during the retention period.
+
+    Args:
+        retention: A timedelta, steps with tasks finished more recently than
+            this are only archived if their information package is archived
+    """
+
+    unfinished = ProcessTask.objects.filter(processstep__isnull=False).exclude(
+        status__in=celery_states.READY_STATES
+    ).values('processstep')
+
+    finished = ProcessStep.objects.filter(tasks__isnull=False).exclude(pk__in=unfinished)
+
+    steps = set(finished.filter(
+        Q(information_package__archived=True) |
+        Q(tasks__information_package__archived=True)
+    ).values_list('pk', flat=True))
+
+    if retention is not None:
+        recent = ProcessTask.objects.filter(
+            processstep__isnull=False, time_done__gte=timezone.now() - retention
+        ).values('processstep')
+
+        steps |= set(finished.exclude(pk__in=recent).values_list('pk', flat=True))
+
+    return steps
+
+
+def get_archivable_tasks(retention=None):
+    """
+    Gets the finished tasks that doesn't belong to any step and that can be
+    archived
+    """
+
+    condition = Q(information_package__archived=True)
+
+    if retention is not None:
+        condition |= Q(time_done__lt=timezone.now() - retention)
+
+    return ProcessTask.objects.filter(
+        condition, processstep__isnull=True,
+        status__in=celery_states.READY_STATES,
+    )
+
+
+def update_summary(step_id, tasks):
+    """
+    Adds the given tasks to the summary of the step, the summary contains
+    the values needed to calculate the state of the step once the tasks
+    are gone
+    """
+
+    summary_id = ProcessStep.objects.select_for_update().values_list('summary', flat=True).get(pk=step_id)
+
+    if summary_id is None:
+        summary = ProcessStepSummary.objects.create()
+        ProcessStep.objects.filter(pk=step_id).update(summary=summary)
+    else:
+        summary = ProcessStepSummary.objects.get(pk=summary_id)
+
+    for t in tasks:
+        if t['undo_type'] or t['retried_id'] is not None:
+            continue
+
+        summary.task_count += 1
+
+        if t['undone_id'] is None:
+            summary.task_progress += t['progress']
+
+            if t['status'] == celery_states.FAILURE:
+                summary.failed = True
+        else:
+            summary.undone = True
+
+        if t['time_started'] is not None and (summary.time_started is None or t['time_started'] < summary.time_started):
+            summary.time_started = t['time_started']
+
+        if t['time_done'] is not None and (summary.time_done is None or t['time_done'] > summary.time_done):
+            summary.time_done = t['time_done']
+
+    summary.save()
+
+
+@transaction.atomic
+def archive_batch(pks):
+    """
+    Moves the given tasks to the archive in a single transaction. Events
+    created by the tasks are kept and referred to by the archived tasks
+    instead
+    """
+
+    tasks = list(ProcessTask.objects.filter(pk__in=pks).values(*TASK_FIELDS))
+    events = dict(EventIP.objects.filter(eventApplication__in=pks).values_list('eventApplication', 'pk'))
+
+    ArchivedProcessTask.objects.bulk_create([
+        ArchivedProcessTask(
+            id=t['id'], name=t['name'], status=t['status'],
+            processstep_id=t['processstep_id'],
+            processstep_pos=t['processstep_pos'],
+            information_package_id=t['information_package_id'],
+            event_id=events.get(t['id']),
+            responsible_id=t['responsible_id'], undone=t['undone_id'],
+            retried=t['retried_id'], undo_type=t['undo_type'],
+            hidden=t['hidden'], progress=t['progress'],
+            time_created=t['time_created'], time_started=t['time_started'],
+            time_done=t['time_done'], traceback=t['traceback'],
+            exception=t['exception'],
+            data=dict((f, t[f]) for f in DATA_FIELDS),
+        ) for t in tasks
+    ])
+
+    step_ids = set(t['processstep_id'] for t in tasks if t['processstep_id'] is not None)
+    for step_id in step_ids:
+        update_summary(step_id, [t for t in tasks if t['processstep_id'] == step_id])
+
+    EventIP.objects.filter(pk__in=events.values()).update(eventApplication=None)
+    ProcessTask.objects.filter(pk__in=pks).delete()
+
+    return len(tasks)
+
+
+def archive_step(step, batch_size=None):
+    """
+    Archives all tasks of the step, batch_size tasks at a time
+    """
+
+    if batch_size is None:
+        batch_size = get_batch_size()
+
+    # undone and retried always refer to newer tasks, archiving the oldest
+    # tasks first makes sure that those references are archived intact
+    pks = list(step.tasks.order_by('time_created').values_list('pk', flat=True))
+    archived = sum(archive_batch(batch) for batch in chunks(pks, batch_size))
+
+    step.clear_cache()
+    return archived
+
+
+def delete_unreferenced_blobs(batch_size=None):
+    """
+    Deletes the blobs that no field refers to anymore, such as the results
+    of archived tasks, which are stored again as part of the data of the
+    archived tasks, and the results of deleted tasks
+
+    Returns:
+        The number of deleted blobs
+    """
+
+    if batch_size is None:
+        batch_size = get_batch_size()
+
+    digests = ProcessBlob.objects.filter(
+        time_created__lt=timezone.now() - BLOB_GRACE_PERIOD
+    ).order_by('digest').values_list('digest', flat=True)
+
+    deleted = 0
+
+    for batch in chunks(list(digests), batch_size):
+        references = dict((get_blob_reference(digest), digest) for digest in batch)
+        referenced = set()
+
+        for model, field in get_blob_fields():
+            referenced.update(model.objects.filter(**{
+                '%s__in' % field.name: [EncodedObject(ref) for ref in references],
+            }).annotate(
+                reference=Cast(field.name, models.TextField())
+            ).values_list('reference', flat=True))
+
+        unreferenced = [digest for ref, digest in references.items() if ref not in referenced]
+        deleted += ProcessBlob.objects.filter(digest__in=unreferenced).delete()[0]
+
+    return deleted
+
+
+def archive_tasks(retention=None, batch_size=None):
+    """
+    Moves finished tasks out of the ProcessTask table and into the
+    ArchivedProcessTask table, a summary of the archived tasks of each step
+    is stored in the ProcessStepSummary table. Blobs no longer referenced
+    are deleted once the tasks are archived.
+
+    Each batch is archived in its own transaction, which makes it possible
+    to stop and resume the archival at any time.
+
+    Args:
+        retention: The number of days to keep finished tasks, defaults to
+            the WORKFLOW_TASK_RETENTION setting. If None, only tasks
+            belonging to archived information packages are archived
+        batch_size: The number of tasks to archive in each transaction,
+            defaults to the WORKFLOW_ARCHIVE_BATCH_SIZE setting
+
+    Returns:
+        The number of archived tasks
+    """
+
+    if retention is None:
+        retention = get_retention()
+
+    if retention is not None:
+        retention = datetime.timedelta(days=retention)
+
+    if batch_size is None:
+        batch_size = get_batch_size()
+
+    archived = 0
+
+    for step in ProcessStep.objects.filter(pk__in=get_archivable_steps(retention)).iterator():
+        archived += archive_step(step, batch_size)
+
+    pks = list(get_archivable_tasks(retention).order_by('time_created').values_list('pk', flat=True))
+    archived += sum(archive_batch(batch) for batch in chunks(pks, batch_size))
+
+    delete_unreferenced_blobs(batch_size)
+
+    return archived
@@ -24,8 +24,7 @@
 
 from __future__ import absolute_import, division
 
-from _version import get_versions
-
+import logging
 import time
 
 from billiard.einfo import ExceptionInfo
@@ -44,15 +43,20 @@ from django.db import (
 )
 from django.utils import timezone
 
-from ESSArch_Core.ip.models import EventIP
+from ESSArch_Core.ip.models import EventIP, update_step_summaries
 
+from ESSArch_Core.WorkflowEngine.events import event_buffer, get_event_version
 from ESSArch_Core.WorkflowEngine.models import ProcessStep, ProcessTask
-from ESSArch_Core.WorkflowEngine.util import get_result
+from ESSArch_Core.WorkflowEngine.progress import ProgressChannel
+from ESSArch_Core.WorkflowEngine.stream import record_state_change
+from ESSArch_Core.WorkflowEngine.util import get_results, normalize_pk
 
 from ESSArch_Core.util import (
     truncate
 )
 
+logger = logging.getLogger('code.exceptions')
+
 
 class DBTask(Task):
     args = []
@@ -65,8 +69,15 @@ class DBTask(Task):
     step = None
     step_pos = None
     chunk = False
+    progress_channel = None
 
     def __call__(self, *args, **kwargs):
+        # events are written in batches once the outermost task or step
+        # running in this thread is done, see EventBuffer
+        with event_buffer.batch():
+            return self._call(*args, **kwargs)
+
+    def _call(self, *args, **kwargs):
         options = kwargs.pop('_options', {})
         self.chunk = options.get('chunk', False)
 
@@ -80,6 +91,7 @@ class DBTask(Task):
         self.result_params = options.get('result_params', {}) or {}
         self.task_id = options.get('task_id') or self.request.id
         self.eager = options.get('eager') or self.request.is_eager
+        self.progress_channel = None
 
         if self.chunk:
             res = []
@@ -119,6 +131,10 @@ class DBTask(Task):
                             time_done=timezone.now(),
                             progress=100
                         )
+                        record_state_change(
+                            self.task_id, celery_states.SUCCESS, self.step,
+                            a_options.get('ip'), 100
+                        )
                         res.append(retval)
                         if self.event_type:
                             event = self.create_event(self.task_id, celery_states.SUCCESS, self.args, a, retval, None)
@@ -137,14 +153,20 @@ class DBTask(Task):
                     transaction.commit()
                     transaction.set_autocommit(True)
 
+        results = get_results(self.result_params.values(), self.eager)
         for k, v in self.result_params.iteritems():
-            kwargs[k] = get_result(v, self.eager)
+            try:
+                kwargs[k] = results[normalize_pk(v)]
+            except KeyError:
+                raise ProcessTask.DoesNotExist()
 
         ProcessTask.objects.filter(pk=self.task_id).update(
             hidden=self.hidden,
             status=celery_states.STARTED,
             time_started=timezone.now()
         )
+        record_state_change(self.task_id, celery_states.STARTED, self.step, self.ip)
+        self.update_step_state()
 
         return self._run(*args, **kwargs)
 
@@ -178,6 +200,18 @@ class DBTask(Task):
             return res
 
     def after_return(self, status, retval, task_id, args, kwargs, einfo):
+        self.update_step_state()
+
+    def update_step_state(self):
+        """
+        Clears the cached state of the step of the task and applies the
+        change to the summaries of the affected IPs. The summaries are only
+        kept for display, failing to update them never fails the task.
+        """
+
+        if self.step is None:
+            return
+
         try:
             step = ProcessStep.objects.get(pk=self.step)
         except ProcessStep.DoesNotExist:
@@ -186,6 +220,12 @@ class DBTask(Task):
         with cache.lock(step.cache_lock_key, timeout=60):
             step.clear_cache()
 
+        # the ancestors of the step were all loaded when clearing the cache
+        try:
+            update_step_summaries(step)
+        except Exception:
+            logger.exception('Failed to update the summaries of the IPs of step %s', step.pk)
+
     def create_event(self, task_id, status, args, kwargs, retval, einfo):
         if status == celery_states.SUCCESS:
             outcome = 0
@@ -197,7 +237,8 @@ class DBTask(Task):
 
         return EventIP(
             eventType_id=self.event_type, eventOutcome=outcome,
-            eventVersion=get_versions()['version'],
+            eventDateTime=timezone.now(),
+            eventVersion=get_event_version(),
             eventOutcomeDetailNote=truncate(outcome_detail_note, 1024),
             eventApplication_id=task_id,
             linkingAgentIdentifierValue_id=self.responsible,
@@ -212,6 +253,9 @@ class DBTask(Task):
         timestamps
         '''
 
+        if self.progress_channel is not None:
+            self.progress_channel.flush()
+
         time_done = timezone.now()
         tb = einfo.traceback
         exception = "%s: %s" % (einfo.type.__name__, einfo.exception)
@@ -233,13 +277,11 @@ class DBTask(Task):
                 time_done=time_done,
             )
 
+        record_state_change(task_id, celery_states.FAILURE, self.step, self.ip)
+
         if not self.chunk and self.event_type:
             event = self.create_event(task_id, celery_states.FAILURE, args, kwargs, None, einfo)
-            try:
-                with transaction.atomic():
-                    event.save(force_insert=True)
-            except IntegrityError as e:
-                pass
+            event_buffer.add(event)
 
     def success(self, retval, task_id, args, kwargs):
         '''
@@ -268,28 +310,33 @@ class DBTask(Task):
                 time_done=time_done,
             )
 
+        record_state_change(task_id, celery_states.SUCCESS, self.step, self.ip, 100)
+
         if self.event_type:
             event = self.create_event(task_id, celery_states.SUCCESS, args, kwargs, None, retval)
-            try:
-                with transaction.atomic():
-                    event.save(force_insert=True)
-            except IntegrityError as e:
-                pass
+            event_buffer.add(event)
 
     def set_progress(self, progress, total=None):
-        if not self.eager:
-            self.update_state(state=celery_states.PENDING,
-                              meta={'current': progress, 'total': total})
-
-        percent = (progress/total) * 100
-
         if self.chunk:
-            self.progress = percent
-        else:
-            ProcessTask.objects.filter(pk=self.task_id).update(
-                progress=percent
+            self.progress = (progress/total) * 100
+            return
+
+        if self.progress_channel is None or self.progress_channel.task_id != self.task_id:
+            callback = None if self.eager else self.publish_progress
+            self.progress_channel = ProgressChannel(
+                self.task_id, callback=callback, on_persist=self.record_progress
             )
 
+        self.progress_channel.update(progress, total)
+
+    def publish_progress(self, progress, total):
+        self.update_state(state=celery_states.PENDING,
+                          meta={'current': progress, 'total': total})
+
+    def record_progress(self, percent):
+        record_state_change(self.task_id, celery_states.STARTED, self.step, self.ip, int(percent))
+        self.update_step_state()
+
     def event_outcome_success(self, *args, **kwargs):
         raise NotImplementedError()
 
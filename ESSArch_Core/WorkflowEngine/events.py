@@ -0,0 +1,137 @@
+"""
+    ESSArch is an open source archiving and digital preservation system
+
+    ESSArch Core
+    Copyright (C) 2005-2017 ES Solutions AB
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+    Contact information:
+    Web - http://www.essolutions.se
+    Email - essarch@essolutions.se
+"""
+
+from __future__ import absolute_import
+
+import threading
+
+from contextlib import contextmanager
+
+from _version import get_versions
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from ESSArch_Core.ip.models import EventIP
+
+DEFAULT_BATCH_SIZE = 100
+
+_version = None
+_version_lock = threading.Lock()
+
+
+def get_event_version():
+    """
+    Gets the version stored on events. Resolving the version can require
+    running git so it is only done once per process
+    """
+
+    global _version
+
+    if _version is None:
+        with _version_lock:
+            if _version is None:
+                _version = get_versions()['version']
+
+    return _version
+
+
+def get_batch_size():
+    return getattr(settings, 'WORKFLOW_EVENT_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+
+
+def write_events(events):
+    """
+    Writes the events to the database using as few queries as possible.
+
+    A task can only be the application of a single event, only the first
+    event of each task is written and events of tasks that already have an
+    event are skipped.
+    """
+
+    applications = set()
+    unique = []
+
+    for event in events:
+        if event.eventApplication_id is not None:
+            if event.eventApplication_id in applications:
+                continue
+
+            applications.add(event.eventApplication_id)
+
+        unique.append(event)
+
+    if not unique:
+        return
+
+    try:
+        with transaction.atomic():
+            EventIP.objects.bulk_create(unique)
+    except IntegrityError:
+        for event in unique:
+            try:
+                with transaction.atomic():
+                    event.save(force_insert=True)
+            except IntegrityError:
+                pass
+
+
+class EventBuffer(threading.local):
+    """
+    Buffers the events created by tasks in the current thread.
+
+    The events are written when the outermost batch is done, i.e. once a
+    step run in the current thread or a task and all tasks started by it
+    are done, or when the buffer is full. Events keep the time they were
+    created at, not the time they are written.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.depth = 0
+
+    def add(self, event):
+        self.events.append(event)
+
+        if self.depth == 0 or len(self.events) >= get_batch_size():
+            self.flush()
+
+    def flush(self):
+        events, self.events = self.events, []
+        write_events(events)
+
+    @contextmanager
+    def batch(self):
+        self.depth += 1
+
+        try:
+            yield
+        finally:
+            self.depth -= 1
+
+            if self.depth == 0:
+                self.flush()
+
+
+event_buffer = EventBuffer()
@@ -0,0 +1,168 @@
+"""
+    ESSArch is an open source archiving and digital preservation system
+
+    ESSArch Core
+    Copyright (C) 2005-2017 ES Solutions AB
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+    Contact information:
+    Web - http://www.essolutions.se
+    Email - essarch@essolutions.se
+"""
+
+from __future__ import absolute_import
+
+import sys
+import threading
+
+from multiprocessing.pool import ThreadPool
+
+from billiard.einfo import ExceptionInfo
+
+from celery import chain, group, states as celery_states, uuid
+from celery.app.trace import eager_trace_task
+from celery.canvas import maybe_signature
+from celery.result import EagerResult, GroupResult
+
+from django.conf import settings
+from django.db import connections
+
+
+def get_pool_size():
+    return max(getattr(settings, 'WORKFLOW_EAGER_POOL_SIZE', 1) or 1, 1)
+
+
+class EagerWorkflowExecutor(object):
+    """
+    Executes a celery canvas in the current process.
+
+    Chains are executed in order, exactly like ``chain.apply()``. Members of
+    groups are executed concurrently on a pool of at most ``pool_size``
+    threads, configured with ``WORKFLOW_EAGER_POOL_SIZE``.
+
+    With a pool size of 1 (the default) the canvas is executed in the calling
+    thread, in the same order as ``workflow.apply()`` would.
+    """
+
+    def __init__(self, pool_size=None):
+        if pool_size is None:
+            pool_size = get_pool_size()
+
+        self.pool_size = pool_size
+        self.semaphore = threading.BoundedSemaphore(pool_size)
+
+    def apply(self, workflow):
+        if self.pool_size == 1:
+            return workflow.apply()
+
+        return self._apply(maybe_signature(workflow), ())
+
+    def _apply(self, sig, args):
+        if isinstance(sig, chain):
+            return self._apply_chain(sig, args)
+
+        if isinstance(sig, group):
+            return self._apply_group(sig, args)
+
+        if sig.subtask_type is not None:
+            # chords and other canvas types are left to celery
+            return sig.apply(args)
+
+        return self._apply_task(sig, args)
+
+    def _apply_chain(self, sig, args):
+        last, fargs = None, args  # fargs passed to first task only
+
+        for task in sig.tasks:
+            task = maybe_signature(task)
+            res = self._apply(task, fargs or (last and (last.get(), )) or ())
+            res.parent, last, fargs = last, res, None
+
+        return last
+
+    def _apply_group(self, sig, args):
+        tasks = [maybe_signature(t) for t in sig.tasks]
+        group_id = sig.options.get('task_id') or uuid()
+
+        if not tasks:
+            return GroupResult(group_id, [])
+
+        if len(tasks) == 1:
+            return GroupResult(group_id, [self._apply(t, args) for t in tasks])
+
+        failed = threading.Event()
+
+        def apply_member(task):
+            if failed.is_set():
+                return None, None
+
+            try:
+                return self._apply(task, args), None
+            except BaseException:
+                failed.set()
+                return None, sys.exc_info()
+            finally:
+                connections.close_all()
+
+        pool = ThreadPool(min(self.pool_size, len(tasks)))
+
+        try:
+            outcome = pool.map(apply_member, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+        for res, exc_info in outcome:
+            if exc_info is not None:
+                raise exc_info[0], exc_info[1], exc_info[2]
+
+        return GroupResult(group_id, [res for res, _ in outcome])
+
+    def _apply_task(self, sig, args):
+        args, kwargs, options = sig._merge(args)
+
+        # Task.apply always traces the registered task instance which is
+        # shared between all threads. DBTask keeps the state of the current
+        # execution on the instance so each execution gets its own instance.
+        task = type(sig.type)()
+        app = task._get_app()
+        task_id = options.get('task_id') or uuid()
+        throw = app.either('CELERY_EAGER_PROPAGATES_EXCEPTIONS', options.get('throw'))
+        request = {
+            'id': task_id, 'retries': 0, 'is_eager': True,
+            'delivery_info': {'is_eager': True},
+        }
+
+        with self.semaphore:
+            retval, info = eager_trace_task(
+                task, task_id, args, kwargs, app=app, request=request,
+                propagate=throw
+            )
+
+        tb = None
+        if isinstance(retval, ExceptionInfo):
+            retval, tb = retval.exception, retval.traceback
+
+        state = celery_states.SUCCESS if info is None else info.state
+        return EagerResult(task_id, retval, state, traceback=tb)
+
+
+def apply_eager(workflow):
+    """
+    Executes the workflow in the current process using the
+    ``EagerWorkflowExecutor``
+    """
+
+    return EagerWorkflowExecutor().apply(workflow)
@@ -0,0 +1,307 @@
+"""
+    ESSArch is an open source archiving and digital preservation system
+
+    ESSArch Core
+    Copyright (C) 2005-2017 ES Solutions AB
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+    Contact information:
+    Web - http://www.essolutions.se
+    Email - essarch@essolutions.se
+"""
+
+from __future__ import absolute_import
+
+import base64
+import copy
+import cPickle
+import datetime
+import decimal
+import hashlib
+import json
+import uuid
+import zlib
+
+from django.apps import apps
+from django.db import IntegrityError, models, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from picklefield.fields import _ObjectWrapper, dbsafe_decode, wrap_conflictual_object
+
+ENCODING_VERSION = '1'
+
+JSON = 'json'
+PICKLE = 'pickle'
+ZLIB = 'zlib'
+BLOB = 'blob'
+
+COMPRESS_THRESHOLD = 1024  # 1 KiB
+BLOB_THRESHOLD = 262144  # 256 KiB
+
+TYPE_KEY = '__type__'
+
+
+class NotJSONSerializable(Exception):
+    pass
+
+
+def _to_json(value):
+    """
+    Converts the value to something that can be serialized as JSON without
+    losing any information, tuples, UUIDs, datetimes and decimals are tagged
+    so that they can be restored when decoding.
+
+    Raises NotJSONSerializable if the value contains anything else
+    """
+
+    if value is None or isinstance(value, (bool, int, long, float, basestring)):
+        return value
+
+    if isinstance(value, list):
+        return [_to_json(v) for v in value]
+
+    if isinstance(value, dict):
+        if TYPE_KEY in value:
+            raise NotJSONSerializable()
+
+        if not all(isinstance(k, basestring) for k in value.iterkeys()):
+            raise NotJSONSerializable()
+
+        return dict((k, _to_json(v)) for k, v in value.iteritems())
+
+    if isinstance(value, tuple):
+        return {TYPE_KEY: 'tuple', 'value': [_to_json(v) for v in value]}
+
+    if isinstance(value, uuid.UUID):
+        return {TYPE_KEY: 'uuid', 'value': str(value)}
+
+    if isinstance(value, datetime.datetime):
+        return {TYPE_KEY: 'datetime', 'value': value.isoformat()}
+
+    if isinstance(value, decimal.Decimal):
+        return {TYPE_KEY: 'decimal', 'value': str(value)}
+
+    raise NotJSONSerializable()
+
+
+def _from_json(dct):
+    value_type = dct.get(TYPE_KEY)
+
+    if value_type is None:
+        return dct
+
+    value = dct['value']
+
+    if value_type == 'tuple':
+        return tuple(value)
+
+    if value_type == 'uuid':
+        return uuid.UUID(value)
+
+    if value_type == 'datetime':
+        return parse_datetime(value)
+
+    if value_type == 'decimal':
+        return decimal.Decimal(value)
+
+    return dct
+
+
+def _get_blob_model():
+    return apps.get_model('WorkflowEngine', 'ProcessBlob')
+
+
+def get_blob_reference(digest):
+    """
+    Gets the encoded value that refers to the blob with the given digest
+    """
+
+    return '%s:%s:%s' % (ENCODING_VERSION, BLOB, digest)
+
+
+def get_blob_fields():
+    """
+    Gets (model, field) pairs of all fields that store large values in the
+    blob store
+    """
+
+    for model in apps.get_models():
+        for field in model._meta.concrete_fields:
+            if isinstance(field, CompactObjectField) and field.blob_threshold is not None:
+                yield model, field
+
+
+def encode(value, compress_threshold=COMPRESS_THRESHOLD, blob_threshold=None):
+    """
+    Encodes the value to a versioned string with the format
+    "<version>:<codec>:<payload>".
+
+    The value is serialized as JSON if possible, otherwise it is pickled.
+    Note that strings serialized as JSON, including dictionary keys, are
+    always decoded as unicode, even if they were encoded as str.
+    Payloads larger than compress_threshold are compressed using zlib and
+    payloads larger than blob_threshold are stored in the blob store and
+    replaced with the digest of their content.
+    """
+
+    try:
+        data = '%s:%s:%s' % (ENCODING_VERSION, JSON, json.dumps(
+            _to_json(value), sort_keys=True, separators=(',', ':'),
+        ))
+    except (NotJSONSerializable, UnicodeDecodeError):
+        data = '%s:%s:%s' % (ENCODING_VERSION, PICKLE, base64.b64encode(
+            cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL)
+        ))
+
+    if compress_threshold is not None and len(data) > compress_threshold:
+        compressed = '%s:%s:%s' % (ENCODING_VERSION, ZLIB, base64.b64encode(
+            zlib.compress(data.encode('utf-8'))
+        ))
+
+        if len(compressed) < len(data):
+            data = compressed
+
+    if blob_threshold is not None and len(data) > blob_threshold:
+        digest = hashlib.sha256(data.encode('utf-8')).hexdigest()
+        Blob = _get_blob_model()
+
+        # the time of existing blobs is renewed so that they aren't deleted
+        # as unreferenced before the value referring to them is saved
+        if not Blob.objects.filter(digest=digest).update(time_created=timezone.now()):
+            try:
+                with transaction.atomic():
+                    Blob.objects.create(digest=digest, data=data)
+            except IntegrityError:
+                pass  # created by someone else in the meantime
+
+        data = get_blob_reference(digest)
+
+    return data
+
+
+def decode(data):
+    """
+    Decodes a string created by encode. Strings without a version are
+    assumed to have been created by picklefield.
+    """
+
+    value = _decode(data)
+
+    if isinstance(value, _ObjectWrapper):
+        return value._obj
+
+    return value
+
+
+def _decode(data):
+    try:
+        version, codec, payload = data.split(':', 2)
+    except ValueError:
+        return dbsafe_decode(data)
+
+    if version != ENCODING_VERSION:
+        raise ValueError('Unknown encoding version: %s' % version)
+
+    if codec == JSON:
+        return json.loads(payload, object_hook=_from_json)
+
+    if codec == PICKLE:
+        return cPickle.loads(base64.b64decode(payload))
+
+    if codec == ZLIB:
+        return _decode(zlib.decompress(base64.b64decode(payload)).decode('utf-8'))
+
+    if codec == BLOB:
+        Blob = _get_blob_model()
+        return _decode(Blob.objects.values_list('data', flat=True).get(digest=payload))
+
+    raise ValueError('Unknown codec: %s' % codec)
+
+
+class EncodedObject(unicode):
+    """
+    A string that already has been encoded and should be stored as is
+    """
+
+
+class CompactObjectField(models.TextField):
+    """
+    A field that stores any python object using a compact, versioned encoding.
+
+    Values are stored as JSON when possible and pickled otherwise. Large
+    values are compressed and, if blob_threshold is set, values larger than
+    it are stored once in the content-addressed ProcessBlob table.
+
+    Rows written by PickledObjectField can still be read.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.compress_threshold = kwargs.pop('compress_threshold', COMPRESS_THRESHOLD)
+        self.blob_threshold = kwargs.pop('blob_threshold', None)
+        kwargs.setdefault('editable', False)
+        super(CompactObjectField, self).__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super(CompactObjectField, self).deconstruct()
+
+        if self.compress_threshold != COMPRESS_THRESHOLD:
+            kwargs['compress_threshold'] = self.compress_threshold
+
+        if self.blob_threshold is not None:
+            kwargs['blob_threshold'] = self.blob_threshold
+
+        return name, path, args, kwargs
+
+    def get_default(self):
+        if self.has_default():
+            if callable(self.default):
+                return self.default()
+
+            # mutable defaults such as [] and {} must not be shared
+            return copy.deepcopy(self.default)
+
+        return super(CompactObjectField, self).get_default()
+
+    def from_db_value(self, value, expression, connection, context):
+        if value is None:
+            return value
+
+        return decode(value)
+
+    def to_python(self, value):
+        return value
+
+    def pre_save(self, model_instance, add):
+        value = super(CompactObjectField, self).pre_save(model_instance, add)
+        return wrap_conflictual_object(value)
+
+    def get_prep_value(self, value):
+        if value is None or isinstance(value, EncodedObject):
+            return value
+
+        return EncodedObject(encode(
+            value, compress_threshold=self.compress_threshold,
+            blob_threshold=self.blob_threshold,
+        ))
+
+    def value_to_string(self, obj):
+        return self.get_prep_value(self.value_from_object(obj))
+
+    def get_lookup(self, lookup_name):
+        if lookup_name not in ['exact', 'in', 'isnull']:
+            return None
+
+        return super(CompactObjectField, self).get_lookup(lookup_name)
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-19 16:51
+from __future__ import unicode_literals
+
+import ESSArch_Core.WorkflowEngine.fields
+from django.db import migrations, models, transaction
+from django.db.models import Case, Value, When
+
+BATCH_SIZE = 1000
+
+
+def reencode(model, fields, db_alias):
+    """
+    Re-encodes the fields of all rows, walking the table in batches of
+    primary keys. Each batch is updated using a single query in its own
+    transaction to avoid holding locks on the whole table.
+    """
+
+    connection = transaction.get_connection(db_alias)
+    manager = model._base_manager.db_manager(db_alias)
+    output_fields = dict((field, model._meta.get_field(field)) for field in fields)
+
+    # each row needs two parameters per field and one for its primary key,
+    # which some backends (e.g. SQLite) limit the number of
+    params = ['pk'] + fields * 2
+    batch_size = connection.ops.bulk_batch_size(params, range(BATCH_SIZE))
+
+    last_pk = None
+
+    while True:
+        with transaction.atomic(using=db_alias):
+            rows = manager.order_by('pk')
+            if last_pk is not None:
+                rows = rows.filter(pk__gt=last_pk)
+
+            rows = list(rows.values_list('pk', *fields)[:batch_size])
+            if not rows:
+                return
+
+            manager.filter(pk__in=[row[0] for row in rows]).update(**dict(
+                (field, Case(*[
+                    When(pk=row[0], then=Value(row[i], output_field=output_fields[field])) for row in rows
+                ], output_field=output_fields[field]))
+                for i, field in enumerate(fields, 1)
+            ))
+
+        last_pk = rows[-1][0]
+
+
+def forwards_func(apps, schema_editor):
+    ProcessStep = apps.get_model("WorkflowEngine", "ProcessStep")
+    ProcessTask = apps.get_model("WorkflowEngine", "ProcessTask")
+    db_alias = schema_editor.connection.alias
+
+    reencode(ProcessStep, ['result'], db_alias)
+    reencode(ProcessTask, ['args', 'params', 'result_params', 'result', 'meta', 'log'], db_alias)
+
+
+class Migration(migrations.Migration):
+
+    # the existing rows are re-encoded in batches, each in its own transaction
+    atomic = False
+
+    dependencies = [
+        ('WorkflowEngine', '0065_auto_20170531_1133'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessBlob',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('data', models.TextField()),
+                ('time_created', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'ProcessBlob',
+            },
+        ),
+        migrations.AlterField(
+            model_name='processstep',
+            name='result',
+            field=ESSArch_Core.WorkflowEngine.fields.CompactObjectField(blob_threshold=262144, default=None, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='processtask',
+            name='args',
+            field=ESSArch_Core.WorkflowEngine.fields.CompactObjectField(default=[], editable=False),
+        ),
+        migrations.AlterField(
+            model_name='processtask',
+            name='log',
+            field=ESSArch_Core.WorkflowEngine.fields.CompactObjectField(default=None, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='processtask',
+            name='meta',
+            field=ESSArch_Core.WorkflowEngine.fields.CompactObjectField(default=None, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='processtask',
+            name='params',
+            field=ESSArch_Core.WorkflowEngine.fields.CompactObjectField(default={}, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='processtask',
+            name='result',
+            field=ESSArch_Core.WorkflowEngine.fields.CompactObjectField(blob_threshold=262144, default=None, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='processtask',
+            name='result_params',
+            field=ESSArch_Core.WorkflowEngine.fields.CompactObjectField(default={}, editable=False),
+        ),
+        migrations.RunPython(forwards_func, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-19 16:57
+from __future__ import unicode_literals
+
+import ESSArch_Core.WorkflowEngine.fields
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('ip', '0038_auto_20170608_1329'),
+        ('WorkflowEngine', '0066_compact_object_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedProcessTask',
+            fields=[
+                ('id', models.UUIDField(editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255)),
+                ('status', models.CharField(max_length=50)),
+                ('processstep_pos', models.IntegerField(default=0)),
+                ('undone', models.UUIDField(null=True)),
+                ('retried', models.UUIDField(null=True)),
+                ('undo_type', models.BooleanField(default=False)),
+                ('hidden', models.BooleanField(default=False)),
+                ('progress', models.IntegerField(default=0)),
+                ('time_created', models.DateTimeField()),
+                ('time_started', models.DateTimeField(null=True)),
+                ('time_done', models.DateTimeField(null=True)),
+                ('time_archived', models.DateTimeField(auto_now_add=True)),
+                ('traceback', models.TextField(blank=True)),
+                ('exception', models.TextField(blank=True)),
+                ('data', ESSArch_Core.WorkflowEngine.fields.CompactObjectField(blob_threshold=262144, default={}, editable=False)),
+                ('event', models.OneToOneField(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_application', to='ip.EventIP')),
+                ('information_package', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='archived_tasks', to='ip.InformationPackage')),
+                ('processstep', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='archived_tasks', to='WorkflowEngine.ProcessStep')),
+                ('responsible', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_tasks', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'ArchivedProcessTask',
+            },
+        ),
+        migrations.CreateModel(
+            name='ProcessStepSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_count', models.IntegerField(default=0)),
+                ('task_progress', models.IntegerField(default=0)),
+                ('failed', models.BooleanField(default=False)),
+                ('undone', models.BooleanField(default=False)),
+                ('time_started', models.DateTimeField(null=True)),
+                ('time_done', models.DateTimeField(null=True)),
+                ('time_archived', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'ProcessStepSummary',
+            },
+        ),
+        migrations.AddField(
+            model_name='processstep',
+            name='summary',
+            field=models.OneToOneField(editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='step', to='WorkflowEngine.ProcessStepSummary'),
+        ),
+    ]
@@ -34,13 +34,17 @@ from django.conf import settings
 from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.db import models
-from django.db.models import Case, Count, Sum, When
+from django.db.models import Case, Count, Sum, Value, When
 from django.utils import timezone
 from django.utils.translation import ugettext as _
 
-from picklefield.fields import PickledObjectField
-
 from ESSArch_Core.util import available_tasks, chunks, flatten, sliceUntilAttr
+from ESSArch_Core.WorkflowEngine.executor import apply_eager
+from ESSArch_Core.WorkflowEngine.fields import BLOB_THRESHOLD, CompactObjectField
+
+# the number of tasks to create at once when undoing or retrying a step, low
+# enough to stay within the limits of query parameters of all databases
+SHADOW_BATCH_SIZE = 250
 
 class Process(models.Model):
     def _create_task(self, name):
@@ -59,7 +63,7 @@ class Process(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     eager = models.BooleanField(default=True)
     time_created = models.DateTimeField(auto_now_add=True)
-    result = PickledObjectField(null=True, default=None, editable=False)
+    result = CompactObjectField(null=True, default=None, blob_threshold=BLOB_THRESHOLD)
 
     def __unicode__(self):
         return self.name
@@ -112,6 +116,10 @@ class ProcessStep(Process):
     )
     hidden = models.BooleanField(default=False)
     parallel = models.BooleanField(default=False)
+    summary = models.OneToOneField(
+        'ProcessStepSummary', on_delete=models.SET_NULL, related_name='step',
+        null=True, editable=False
+    )
 
     def add_tasks(self, *tasks):
         self.clear_cache()
@@ -157,6 +165,7 @@ class ProcessStep(Process):
 
         cache.delete(self.cache_status_key)
         cache.delete(self.cache_progress_key)
+        cache.delete(self.cache_undone_key)
 
         if self.parent_step:
             self.parent_step.clear_cache()
@@ -178,13 +187,13 @@ class ProcessStep(Process):
 
         def create_sub_task(t):
             created = self._create_task(t.name)
-            t.params['_options'] = {
+            params = dict(t.params, _options={
                 'args': t.args,
                 'responsible': t.responsible_id, 'ip': t.information_package_id,
                 'step': self.id, 'step_pos': t.processstep_pos, 'hidden': t.hidden,
                 'result_params': t.result_params,
-            }
-            return created.si(*t.args, **t.params).set(task_id=str(t.pk), queue=created.queue)
+            })
+            return created.si(*t.args, **params).set(task_id=str(t.pk), queue=created.queue)
 
         func = group if self.parallel else chain
 
@@ -209,7 +218,12 @@ class ProcessStep(Process):
 
         if direct:
             if self.eager:
-                return workflow.apply()
+                from ESSArch_Core.WorkflowEngine.events import event_buffer
+
+                # the events of all tasks of the step are written together
+                # when the step is done
+                with event_buffer.batch():
+                    return apply_eager(workflow)
             else:
                 return workflow.apply_async()
         else:
@@ -233,12 +247,10 @@ class ProcessStep(Process):
 
         t = self._create_task(first.name)
 
-        first.params['_options'] = create_options(first)
-        params = [first.params]
+        params = [dict(first.params, _options=create_options(first))]
 
         for task in tasks:
-            task.params['_options'] = create_options(task)
-            params.append(task.params)
+            params.append(dict(task.params, _options=create_options(task)))
 
         if size is None:
             size = len(params)
@@ -265,15 +277,14 @@ class ProcessStep(Process):
         """
 
         def create_sub_task(t):
-            t = t.create_undo_obj()
-            t.params['_options'] = {
+            params = dict(t.params, _options={
                 'args': t.args,
                 'responsible': t.responsible_id, 'ip': t.information_package_id,
                 'step': self.id, 'step_pos': t.processstep_pos, 'hidden': t.hidden,
                 'undo': True, 'result_params': t.result_params,
-            }
+            })
             created = self._create_task(t.name)
-            return created.si(*t.args, **t.params).set(task_id=str(t.pk), queue=created.queue)
+            return created.si(*t.args, **params).set(task_id=str(t.pk), queue=created.queue)
 
         child_steps = self.child_steps.all()
         tasks = self.tasks(manager='by_step_pos').all()
@@ -294,19 +305,22 @@ class ProcessStep(Process):
 
         func = group if self.parallel else chain
 
-        task_canvas = func(create_sub_task(t) for t in tasks.reverse())
+        undo_objs = ProcessTask.create_undo_objs(tasks.reverse())
+        self.clear_cache()
+
+        task_canvas = func(create_sub_task(t) for t in ProcessTask.iter_by_pk(undo_objs))
         step_canvas = func(s.undo(only_failed=only_failed, direct=False) for s in child_steps.reverse())
 
         if not child_steps:
             workflow = task_canvas
-        elif not tasks:
+        elif not undo_objs:
             workflow = step_canvas
         else:
             workflow = (task_canvas | step_canvas)
 
         if direct:
             if self.eager:
-                return workflow.apply()
+                return apply_eager(workflow)
             else:
                 return workflow.apply_async()
         else:
@@ -326,15 +340,14 @@ class ProcessStep(Process):
         """
 
         def create_sub_task(t):
-            t = t.create_retry_obj()
-            t.params['_options'] = {
+            params = dict(t.params, _options={
                 'args': t.args,
                 'responsible': t.responsible_id, 'ip': t.information_package_id,
                 'step': self.id, 'step_pos': t.processstep_pos, 'hidden': t.hidden,
                 'result_params': t.result_params,
-            }
+            })
             created = self._create_task(t.name)
-            return created.si(*t.args, **t.params).set(task_id=str(t.pk), queue=created.queue)
+            return created.si(*t.args, **params).set(task_id=str(t.pk), queue=created.queue)
 
         child_steps = self.child_steps.all()
 
@@ -351,19 +364,22 @@ class ProcessStep(Process):
 
         func = group if self.parallel else chain
 
+        retry_objs = ProcessTask.create_retry_objs(tasks)
+        self.clear_cache()
+
         step_canvas = func(s.retry(direct=False) for s in child_steps)
-        task_canvas = func(create_sub_task(t) for t in tasks)
+        task_canvas = func(create_sub_task(t) for t in ProcessTask.iter_by_pk(retry_objs))
 
         if not child_steps:
             workflow = task_canvas
-        elif not tasks:
+        elif not retry_objs:
             workflow = step_canvas
         else:
             workflow = (step_canvas | task_canvas)
 
         if direct:
             if self.eager:
-                return workflow.apply()
+                return apply_eager(workflow)
             else:
                 return workflow.apply_async()
         else:
@@ -384,13 +400,13 @@ class ProcessStep(Process):
 
         def create_sub_task(t):
             created = self._create_task(t.name)
-            t.params['_options'] = {
+            params = dict(t.params, _options={
                 'args': t.args,
                 'responsible': t.responsible_id, 'ip': t.information_package_id,
                 'step': self.id, 'step_pos': t.processstep_pos, 'hidden': t.hidden,
                 'result_params': t.result_params
-            }
-            return created.si(*t.args, **t.params).set(task_id=str(t.pk), queue=created.queue)
+            })
+            return created.si(*t.args, **params).set(task_id=str(t.pk), queue=created.queue)
 
         func = group if self.parallel else chain
 
@@ -412,7 +428,7 @@ class ProcessStep(Process):
 
         if direct:
             if self.eager:
-                return workflow.apply()
+                return apply_eager(workflow)
             else:
                 return workflow.apply_async()
         else:
@@ -430,16 +446,38 @@ class ProcessStep(Process):
     def cache_progress_key(self):
         return '%s_progress' % str(self.pk)
 
+    @property
+    def cache_undone_key(self):
+        return '%s_undone' % str(self.pk)
+
+    def get_summary(self):
+        """
+        Gets the summary of the archived tasks of the step, if any
+        """
+
+        if self.summary_id is None:
+            return None
+
+        return self.summary
+
     @property
     def time_started(self):
         if self.tasks.exists():
             return self.tasks.first().time_started
 
+        summary = self.get_summary()
+        if summary is not None:
+            return summary.time_started
+
     @property
     def time_done(self):
         if self.tasks.exists():
             return self.tasks.first().time_done
 
+        summary = self.get_summary()
+        if summary is not None:
+            return summary.time_done
+
     @property
     def progress(self):
         """
@@ -468,6 +506,11 @@ class ProcessStep(Process):
 
             total = len(child_steps) + task_data['task_count']
 
+            summary = self.get_summary()
+            if summary is not None:
+                total += summary.task_count
+                progress += summary.task_progress
+
             if total == 0:
                 cache.set(self.cache_progress_key, 100)
                 return 100
@@ -518,6 +561,11 @@ class ProcessStep(Process):
             tasks = self.tasks.filter(undo_type=False, undone__isnull=True, retried__isnull=True)
             status = celery_states.SUCCESS
 
+            summary = self.get_summary()
+            if summary is not None and summary.failed:
+                cache.set(self.cache_status_key, celery_states.FAILURE)
+                return celery_states.FAILURE
+
             if not child_steps.exists() and not tasks.exists():
                 cache.set(self.cache_status_key, status)
                 return status
@@ -532,7 +580,7 @@ class ProcessStep(Process):
             if tasks.filter(status=celery_states.STARTED).exists():
                 status = celery_states.STARTED
 
-            for cs in child_steps.only('parent_step').iterator():
+            for cs in child_steps.only('parent_step', 'summary').iterator():
                 if cs.status == celery_states.STARTED:
                     status = cs.status
                 if (cs.status == celery_states.PENDING and
@@ -564,6 +612,10 @@ class ProcessStep(Process):
         if self.tasks.filter(undone__isnull=False, retried__isnull=True).exists():
             return True
 
+        summary = self.get_summary()
+        if summary is not None and summary.undone:
+            return True
+
         return False
 
     class Meta:
@@ -597,15 +649,15 @@ class ProcessTask(Process):
     responsible = models.ForeignKey(
         'auth.User', on_delete=models.SET_NULL, related_name='tasks', null=True
     )
-    args = PickledObjectField(default=[])
-    params = PickledObjectField(default={})
-    result_params = PickledObjectField(default={})
+    args = CompactObjectField(default=[])
+    params = CompactObjectField(default={})
+    result_params = CompactObjectField(default={})
     time_started = models.DateTimeField(_('started at'), null=True, blank=True)
     time_done = models.DateTimeField(_('done at'), null=True, blank=True)
     traceback = models.TextField(blank=True)
     exception = models.TextField(blank=True)
     hidden = models.BooleanField(editable=False, default=False, db_index=True)
-    meta = PickledObjectField(null=True, default=None, editable=False)
+    meta = CompactObjectField(null=True, default=None)
     processstep = models.ForeignKey(
         'ProcessStep', related_name='tasks', on_delete=models.CASCADE,
         null=True, blank=True
@@ -621,7 +673,7 @@ class ProcessTask(Process):
         blank=True,
         null=True
     )
-    log = PickledObjectField(null=True, default=None)
+    log = CompactObjectField(null=True, default=None)
 
     objects = models.Manager()
     by_step_pos = OrderedProcessTaskManager()
@@ -644,17 +696,20 @@ class ProcessTask(Process):
 
         t = self._create_task(self.name)
 
-        self.params['_options'] = {
+        options = {
             'responsible': self.responsible_id, 'ip':
             self.information_package_id, 'step': self.processstep_id,
             'step_pos': self.processstep_pos, 'hidden': self.hidden,
         }
 
         if self.eager:
-            self.params['_options']['result_params'] = self.result_params
-            res = t.apply(args=self.args, kwargs=self.params, task_id=str(self.pk))
+            options['result_params'] = self.result_params
+            res = t.apply(args=self.args, kwargs=dict(self.params, _options=options), task_id=str(self.pk))
         else:
-            res = t.apply_async(args=self.args, kwargs=self.params, task_id=str(self.pk), queue=t.queue)
+            res = t.apply_async(
+                args=self.args, kwargs=dict(self.params, _options=options),
+                task_id=str(self.pk), queue=t.queue,
+            )
 
         return res
 
@@ -666,7 +721,7 @@ class ProcessTask(Process):
         t = self._create_task(self.name)
 
         undoobj = self.create_undo_obj()
-        self.params['_options'] = {
+        options = {
             'responsible': self.responsible_id, 'ip':
             self.information_package_id, 'step': self.processstep_id,
             'step_pos': self.processstep_pos, 'hidden': self.hidden, 'undo':
@@ -674,10 +729,13 @@ class ProcessTask(Process):
         }
 
         if undoobj.eager:
-            undoobj.params['_options']['result_params'] = undoobj.result_params
-            res = t.apply(args=undoobj.args, kwargs=undoobj.params, task_id=str(undoobj.pk))
+            options['result_params'] = undoobj.result_params
+            res = t.apply(args=undoobj.args, kwargs=dict(undoobj.params, _options=options), task_id=str(undoobj.pk))
         else:
-            res = t.apply_async(args=undoobj.args, kwargs=undoobj.params, task_id=str(undoobj.pk), queue=t.queue)
+            res = t.apply_async(
+                args=undoobj.args, kwargs=dict(undoobj.params, _options=options),
+                task_id=str(undoobj.pk), queue=t.queue,
+            )
 
         return res
 
@@ -689,17 +747,20 @@ class ProcessTask(Process):
         t = self._create_task(self.name)
 
         retryobj = self.create_retry_obj()
-        self.params['_options'] = {
+        options = {
             'responsible': self.responsible_id, 'ip':
             self.information_package_id, 'step': self.processstep_id,
             'step_pos': self.processstep_pos, 'hidden': self.hidden,
         }
 
         if retryobj.eager:
-            retryobj.params['_options']['result_params'] = retryobj.result_params
-            res = t.apply(args=retryobj.args, kwargs=retryobj.params, task_id=str(retryobj.pk))
+            options['result_params'] = retryobj.result_params
+            res = t.apply(args=retryobj.args, kwargs=dict(retryobj.params, _options=options), task_id=str(retryobj.pk))
         else:
-            res = t.apply_async(args=retryobj.args, kwargs=retryobj.params, task_id=str(retryobj.pk), queue=t.queue)
+            res = t.apply_async(
+                args=retryobj.args, kwargs=dict(retryobj.params, _options=options),
+                task_id=str(retryobj.pk), queue=t.queue,
+            )
 
         return res
 
@@ -742,6 +803,81 @@ class ProcessTask(Process):
 
         return retry_obj
 
+    @staticmethod
+    def _create_shadow_objs(tasks, link, **kwargs):
+        """
+        Creates a copy of each task, in batches, and links each task to its
+        copy using the given field.
+
+        Neither the created nor the updated tasks are saved using save(),
+        the cache of the affected steps has to be cleared by the caller.
+
+        Args:
+            tasks: A queryset of the tasks to copy
+            link: The field of the original task that is set to the copy
+            **kwargs: Values to set on all the copies
+
+        Returns:
+            The primary keys of the copies, in the same order as the tasks
+        """
+
+        pks = list(tasks.values_list('pk', flat=True))
+        copies = []
+
+        for chunk in chunks(pks, SHADOW_BATCH_SIZE):
+            originals = ProcessTask.objects.in_bulk(chunk)
+            batch = [
+                ProcessTask(
+                    processstep_id=t.processstep_id, name=t.name, args=t.args,
+                    params=t.params, result_params=t.result_params,
+                    processstep_pos=t.processstep_pos, status="PREPARED",
+                    information_package_id=t.information_package_id,
+                    eager=t.eager, **kwargs
+                ) for t in (originals[pk] for pk in chunk)
+            ]
+
+            ProcessTask.objects.bulk_create(batch)
+            ProcessTask.objects.filter(pk__in=chunk).update(**{
+                link: Case(
+                    *[When(pk=pk, then=Value(copy.pk, output_field=models.UUIDField()))
+                      for pk, copy in zip(chunk, batch)]
+                )
+            })
+
+            copies.extend(copy.pk for copy in batch)
+
+        return copies
+
+    @staticmethod
+    def create_undo_objs(tasks):
+        """
+        Bulk version of create_undo_obj, returns the primary keys of the
+        created tasks in the same order as the given tasks
+        """
+
+        return ProcessTask._create_shadow_objs(tasks, 'undone', undo_type=True)
+
+    @staticmethod
+    def create_retry_objs(tasks):
+        """
+        Bulk version of create_retry_obj, returns the primary keys of the
+        created tasks in the same order as the given tasks
+        """
+
+        return ProcessTask._create_shadow_objs(tasks, 'retried')
+
+    @staticmethod
+    def iter_by_pk(pks):
+        """
+        Lazily fetches the tasks with the given primary keys, in order
+        """
+
+        for chunk in chunks(pks, SHADOW_BATCH_SIZE):
+            tasks = ProcessTask.objects.in_bulk(chunk)
+
+            for pk in chunk:
+                yield tasks[pk]
+
     class Meta:
         db_table = 'ProcessTask'
         get_latest_by = "time_created"
@@ -753,3 +889,88 @@ class ProcessTask(Process):
 
         def __unicode__(self):
             return '%s - %s' % (self.name, self.id)
+
+
+class ProcessBlob(models.Model):
+    """
+    Content-addressed storage for large values of ``CompactObjectField``
+    fields, identical values are only stored once.
+    """
+
+    digest = models.CharField(max_length=64, primary_key=True)
+    data = models.TextField()
+    time_created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'ProcessBlob'
+
+    def __unicode__(self):
+        return self.digest
+
+
+class ProcessStepSummary(models.Model):
+    """
+    Aggregated state of the tasks of a step that have been archived
+    """
+
+    task_count = models.IntegerField(default=0)
+    task_progress = models.IntegerField(default=0)
+    failed = models.BooleanField(default=False)
+    undone = models.BooleanField(default=False)
+    time_started = models.DateTimeField(null=True)
+    time_done = models.DateTimeField(null=True)
+    time_archived = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'ProcessStepSummary'
+
+    def __unicode__(self):
+        return unicode(self.pk)
+
+
+class ArchivedProcessTask(models.Model):
+    """
+    A finished task that has been moved out of the ProcessTask table.
+
+    The serialized values of the task (args, params, result_params, result,
+    meta and log) are stored together in ``data``
+    """
+
+    id = models.UUIDField(primary_key=True, editable=False)
+    name = models.CharField(max_length=255)
+    status = models.CharField(max_length=50)
+    processstep = models.ForeignKey(
+        'ProcessStep', related_name='archived_tasks', on_delete=models.CASCADE,
+        null=True
+    )
+    processstep_pos = models.IntegerField(default=0)
+    information_package = models.ForeignKey(
+        'ip.InformationPackage', related_name='archived_tasks',
+        on_delete=models.CASCADE, null=True
+    )
+    event = models.OneToOneField(
+        'ip.EventIP', related_name='archived_application',
+        on_delete=models.SET_NULL, null=True
+    )
+    responsible = models.ForeignKey(
+        'auth.User', on_delete=models.SET_NULL, related_name='archived_tasks',
+        null=True
+    )
+    undone = models.UUIDField(null=True)
+    retried = models.UUIDField(null=True)
+    undo_type = models.BooleanField(default=False)
+    hidden = models.BooleanField(default=False)
+    progress = models.IntegerField(default=0)
+    time_created = models.DateTimeField()
+    time_started = models.DateTimeField(null=True)
+    time_done = models.DateTimeField(null=True)
+    time_archived = models.DateTimeField(auto_now_add=True)
+    traceback = models.TextField(blank=True)
+    exception = models.TextField(blank=True)
+    data = CompactObjectField(default={}, blob_threshold=BLOB_THRESHOLD)
+
+    class Meta:
+        db_table = 'ArchivedProcessTask'
+
+    def __unicode__(self):
+        return '%s - %s' % (self.name, self.id)
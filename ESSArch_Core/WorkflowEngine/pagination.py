@@ -0,0 +1,201 @@
+"""
+    ESSArch is an open source archiving and digital preservation system
+
+    ESSArch Core
+    Copyright (C) 2005-2017 ES Solutions AB
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+    Contact information:
+    Web - http://www.essolutions.se
+    Email - essarch@essolutions.se
+"""
+
+
+from __future__ import absolute_import
+
+import base64
+import datetime
+import heapq
+import json
+import uuid
+
+import pytz
+
+from django.db.models import DateTimeField, Q, Value
+from django.db.models.functions import Coalesce
+from django.utils.dateparse import parse_datetime
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from ESSArch_Core.pagination import get_count, get_link_header, is_exact_count_requested
+
+# processes that haven't started are placed last
+NOT_STARTED = datetime.datetime(datetime.MAXYEAR, 1, 1, 1, 1, 1, 1, pytz.UTC)
+
+
+def annotate_sort_key(queryset, time_started):
+    return queryset.annotate(sort_key=Coalesce(
+        time_started, Value(NOT_STARTED, output_field=DateTimeField()),
+        output_field=DateTimeField(),
+    ))
+
+
+class Source(object):
+    """
+    A queryset that is merged with other querysets, ordered by
+    (sort_key, rank, position, pk).
+
+    The queryset must be annotated with sort_key and the rank decides the
+    order of rows from different sources with the same sort key.
+    """
+
+    def __init__(self, queryset, rank, position):
+        self.queryset = queryset
+        self.rank = rank
+        self.position = position
+
+    def get_key(self, obj):
+        return (obj.sort_key, self.rank, getattr(obj, self.position), obj.pk)
+
+    def after(self, cursor, reverse=False):
+        """
+        Filters the rows of the source that come after (or before, if
+        reverse) the cursor
+        """
+
+        op = 'lt' if reverse else 'gt'
+        sort_key, rank, position, pk = cursor
+
+        later = Q(**{'sort_key__%s' % op: sort_key})
+
+        if (self.rank < rank) if reverse else (self.rank > rank):
+            later |= Q(sort_key=sort_key)
+        elif self.rank == rank:
+            later |= Q(sort_key=sort_key, **{'%s__%s' % (self.position, op): position})
+            later |= Q(sort_key=sort_key, **{self.position: position, 'pk__%s' % op: pk})
+
+        return self.queryset.filter(later)
+
+    def fetch(self, cursor, limit, reverse=False):
+        queryset = self.queryset if cursor is None else self.after(cursor, reverse)
+        ordering = ['sort_key', self.position, 'pk']
+
+        if reverse:
+            ordering = ['-%s' % f for f in ordering]
+
+        return list(queryset.order_by(*ordering)[:limit])
+
+
+class MergedCursorPagination(BasePagination):
+    """
+    Paginates multiple querysets as if they were one, ordered by the time
+    they were started.
+
+    Each page is created by fetching at most page_size + 1 rows from each
+    queryset, starting at the cursor, and merging them. Deep pages are
+    therefore as cheap as the first one regardless of the number of rows.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = None
+    page_size = api_settings.PAGE_SIZE
+    invalid_cursor_message = 'Invalid cursor'
+    exact_count = False
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                return _positive_int(
+                    request.query_params[self.page_size_query_param],
+                    strict=True, cutoff=self.max_page_size
+                )
+            except (KeyError, ValueError):
+                pass
+
+        return self.page_size
+
+    def encode_cursor(self, key, reverse):
+        sort_key, rank, position, pk = key
+        data = json.dumps([sort_key.isoformat(), rank, position, pk.hex, reverse])
+        return base64.urlsafe_b64encode(data.encode('ascii')).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+
+        if encoded is None:
+            return None, False
+
+        try:
+            sort_key, rank, position, pk, reverse = json.loads(
+                base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii')
+            )
+            sort_key = parse_datetime(sort_key)
+
+            if sort_key is None:
+                raise ValueError()
+
+            return (sort_key, int(rank), int(position), uuid.UUID(pk)), bool(reverse)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_link(self, key, reverse):
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(key, reverse))
+
+    def paginate_queryset(self, sources, request, view=None):
+        self.page_size = self.get_page_size(request)
+
+        if not self.page_size:
+            return None
+
+        self.request = request
+        cursor, reverse = self.decode_cursor(request)
+
+        rows = []
+        for source in sources:
+            rows.extend((source.get_key(obj), obj) for obj in source.fetch(cursor, self.page_size + 1, reverse))
+
+        rows = heapq.nlargest(self.page_size + 1, rows) if reverse else heapq.nsmallest(self.page_size + 1, rows)
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        if reverse:
+            rows.reverse()
+
+        exact = self.exact_count or is_exact_count_requested(request)
+        self.count = sum(get_count(source.queryset, exact) for source in sources)
+        self.next_link = self.previous_link = None
+
+        if rows:
+            if has_more or reverse:
+                self.next_link = self.get_link(rows[-1][0], False)
+
+            if (has_more and reverse) or (cursor is not None and not reverse):
+                self.previous_link = self.get_link(rows[0][0], True)
+        elif cursor is not None:
+            self.previous_link = remove_query_param(request.build_absolute_uri(), self.cursor_query_param)
+
+        return [obj for key, obj in rows]
+
+    def get_paginated_response(self, data):
+        link = get_link_header(self.next_link, self.previous_link)
+        headers = {'Link': link, 'Count': self.count} if link else {}
+
+        return Response(data, headers=headers)
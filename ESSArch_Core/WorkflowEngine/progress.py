@@ -0,0 +1,117 @@
+"""
+    ESSArch is an open source archiving and digital preservation system
+
+    ESSArch Core
+    Copyright (C) 2005-2017 ES Solutions AB
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+    Contact information:
+    Web - http://www.essolutions.se
+    Email - essarch@essolutions.se
+"""
+
+from __future__ import absolute_import, division
+
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from ESSArch_Core.WorkflowEngine.models import ProcessTask
+
+DEFAULT_RATE = 2  # updates per second
+DEFAULT_MILESTONE = 10  # percent
+CACHE_TIMEOUT = 60 * 60
+
+
+def get_cache_key(task_id):
+    return '%s_task_progress' % str(task_id)
+
+
+def get_task_progress(task_id):
+    """
+    Gets the latest published progress of a running task, or None if no
+    progress has been published
+    """
+
+    return cache.get(get_cache_key(task_id))
+
+
+class ProgressChannel(object):
+    """
+    Reports the progress of a task.
+
+    Updates are published to the cache, and passed to the given callback, at
+    most ``rate`` times per second, intermediate updates are coalesced and
+    only the latest one is kept. The progress is persisted in the database
+    each time it has increased by at least ``milestone`` percent.
+
+    The final update (100%) is always published and persisted immediately.
+    ``on_persist`` is called with the percentage each time it is persisted.
+    """
+
+    def __init__(self, task_id, rate=None, milestone=None, callback=None,
+                 on_persist=None, clock=time.time):
+        if rate is None:
+            rate = getattr(settings, 'WORKFLOW_PROGRESS_RATE', DEFAULT_RATE)
+
+        if milestone is None:
+            milestone = getattr(settings, 'WORKFLOW_PROGRESS_MILESTONE', DEFAULT_MILESTONE)
+
+        self.task_id = task_id
+        self.interval = 1 / rate if rate else 0
+        self.milestone = milestone
+        self.callback = callback
+        self.on_persist = on_persist
+        self.clock = clock
+
+        self.pending = None
+        self.last_published = None
+        self.persisted = 0
+
+    def update(self, progress, total):
+        self.pending = (progress, total)
+        now = self.clock()
+
+        if (progress >= total or self.last_published is None or
+                now - self.last_published >= self.interval):
+            self.publish(now)
+
+    def flush(self):
+        """
+        Publishes the latest update if it hasn't been published yet
+        """
+
+        if self.pending is not None:
+            self.publish(self.clock())
+
+    def publish(self, now):
+        progress, total = self.pending
+        percent = (progress / total) * 100
+
+        self.pending = None
+        self.last_published = now
+
+        cache.set(get_cache_key(self.task_id), percent, CACHE_TIMEOUT)
+
+        if self.callback is not None:
+            self.callback(progress, total)
+
+        if percent >= 100 or percent - self.persisted >= self.milestone:
+            ProcessTask.objects.filter(pk=self.task_id).update(progress=percent)
+            self.persisted = percent
+
+            if self.on_persist is not None:
+                self.on_persist(percent)
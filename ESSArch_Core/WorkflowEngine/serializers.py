@@ -27,18 +27,62 @@ from celery import states as celery_states
 from rest_framework import serializers
 
 from ESSArch_Core.WorkflowEngine.models import ProcessStep, ProcessTask
-from ESSArch_Core.WorkflowEngine.util import get_result
+from ESSArch_Core.WorkflowEngine.progress import get_task_progress
+from ESSArch_Core.WorkflowEngine.util import get_results, get_step_details, get_step_states, normalize_pk
 from ESSArch_Core.util import available_tasks
 
 
-class ProcessStepChildrenSerializer(serializers.Serializer):
+def get_progress(task):
+    """
+    Gets the progress of the task, the progress of running tasks is read from
+    the cache since it is only persisted at milestones
+    """
+
+    if task.status == celery_states.STARTED:
+        progress = get_task_progress(task.pk)
+
+        if progress is not None:
+            return int(progress)
+
+    return task.progress
+
+
+class StepStateMixin(object):
+    """
+    Reads the state of steps from the states calculated in bulk for all
+    serialized steps, steps without a calculated state are calculated
+    on demand
+    """
+
+    def get_context_values(self, name, getter, obj):
+        values = self.context.setdefault(name, {})
+
+        if obj.pk not in values:
+            values.update(getter([obj.pk]))
+
+        return values[obj.pk]
+
+    def get_step_state(self, obj, field):
+        return self.get_context_values('step_states', get_step_states, obj)[field]
+
+
+class ProcessStepListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # calculate the state of all steps at once instead of once per step
+        steps = list(data.all() if hasattr(data, 'all') else data)
+        self.context.setdefault('step_states', {}).update(get_step_states([s.pk for s in steps]))
+
+        return super(ProcessStepListSerializer, self).to_representation(steps)
+
+
+class ProcessStepChildrenSerializer(StepStateMixin, serializers.Serializer):
     url = serializers.SerializerMethodField()
     id = serializers.UUIDField()
     flow_type = serializers.SerializerMethodField()
     name = serializers.CharField()
     hidden = serializers.BooleanField()
-    progress = serializers.IntegerField()
-    status = serializers.CharField()
+    progress = serializers.SerializerMethodField()
+    status = serializers.SerializerMethodField()
     responsible = serializers.SerializerMethodField()
     step_position = serializers.SerializerMethodField()
     time_started = serializers.DateTimeField()
@@ -53,6 +97,16 @@ class ProcessStepChildrenSerializer(serializers.Serializer):
     def get_flow_type(self, obj):
         return 'task' if type(obj).__name__ == 'ProcessTask' else 'step'
 
+    def get_progress(self, obj):
+        if type(obj).__name__ == 'ProcessTask':
+            return get_progress(obj)
+        return self.get_step_state(obj, 'progress')
+
+    def get_status(self, obj):
+        if type(obj).__name__ == 'ProcessTask':
+            return obj.status
+        return self.get_step_state(obj, 'status')
+
     def get_responsible(self, obj):
         if type(obj).__name__ == 'ProcessTask':
             if obj.responsible:
@@ -73,6 +127,10 @@ class ProcessTaskSerializer(serializers.HyperlinkedModelSerializer):
     responsible = serializers.SlugRelatedField(
         slug_field='username', read_only=True
     )
+    progress = serializers.SerializerMethodField()
+
+    def get_progress(self, obj):
+        return get_progress(obj)
 
     class Meta:
         model = ProcessTask
@@ -99,10 +157,11 @@ class ProcessTaskDetailSerializer(ProcessTaskSerializer):
 
     def get_params(self, obj):
         params = obj.params
+        results = get_results(obj.result_params.values())
         for param, task in obj.result_params.iteritems():
             try:
-                params[param] = get_result(task)
-            except ProcessTask.DoesNotExist:
+                params[param] = results[normalize_pk(task)]
+            except KeyError:
                 params[param] = 'waiting on result from %s ...' % task
 
         return dict((k.encode('utf-8'), v) for k, v in params.iteritems())
@@ -128,8 +187,22 @@ class ProcessTaskSetSerializer(ProcessTaskSerializer):
         )
 
 
-class ProcessStepSerializer(serializers.HyperlinkedModelSerializer):
+class ProcessStepSerializer(StepStateMixin, serializers.HyperlinkedModelSerializer):
+    status = serializers.SerializerMethodField()
+    progress = serializers.SerializerMethodField()
+    undone = serializers.SerializerMethodField()
+
+    def get_status(self, obj):
+        return self.get_step_state(obj, 'status')
+
+    def get_progress(self, obj):
+        return self.get_step_state(obj, 'progress')
+
+    def get_undone(self, obj):
+        return self.get_step_state(obj, 'undone')
+
     class Meta:
+        list_serializer_class = ProcessStepListSerializer
         model = ProcessStep
         fields = (
             'url', 'id', 'name', 'result', 'type', 'user', 'parallel',
@@ -147,23 +220,23 @@ class ProcessStepDetailSerializer(ProcessStepSerializer):
     exception = serializers.SerializerMethodField()
     traceback = serializers.SerializerMethodField()
 
+    def get_step_detail(self, obj, field):
+        return self.get_context_values('step_details', get_step_details, obj)[field]
+
     def get_task_count(self, obj):
-        return obj.tasks.count()
+        return self.get_step_detail(obj, 'task_count')
 
     def get_failed_task_count(self, obj):
-        return obj.tasks.filter(status=celery_states.FAILURE, undone__isnull=True).count()
+        return self.get_step_detail(obj, 'failed_task_count')
 
     def get_exception(self, obj):
-        t = obj.tasks.filter(status=celery_states.FAILURE, undone__isnull=True).only('exception').first()
-        if t:
-            return t.exception
+        return self.get_step_detail(obj, 'exception')
 
     def get_traceback(self, obj):
-        t = obj.tasks.filter(status=celery_states.FAILURE, undone__isnull=True).only('traceback').first()
-        if t:
-            return t.traceback
+        return self.get_step_detail(obj, 'traceback')
 
     class Meta:
+        list_serializer_class = ProcessStepListSerializer
         model = ProcessStepSerializer.Meta.model
         fields = ProcessStepSerializer.Meta.fields + (
             'task_count', 'failed_task_count', 'exception', 'traceback'
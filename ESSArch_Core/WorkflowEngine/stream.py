@@ -0,0 +1,229 @@
+"""
+    ESSArch is an open source archiving and digital preservation system
+
+    ESSArch Core
+    Copyright (C) 2005-2017 ES Solutions AB
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+    Contact information:
+    Web - http://www.essolutions.se
+    Email - essarch@essolutions.se
+"""
+
+from __future__ import absolute_import
+
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from django_redis import get_redis_connection
+
+from redis.exceptions import RedisError
+
+from ESSArch_Core.WorkflowEngine.models import ProcessStep
+
+KEY_PREFIX = 'process_state_changes'
+TOKEN_KEY = '%s:token' % KEY_PREFIX
+
+MAX_CHANGES = 1000  # per step and information package
+CHANGES_TTL = 60 * 60 * 24
+
+DEFAULT_TIMEOUT = 25  # seconds
+DEFAULT_DURATION = 300  # seconds
+DEFAULT_INTERVAL = 1  # seconds
+
+logger = logging.getLogger('code.exceptions')
+
+
+def get_key(scope, pk):
+    return '%s:%s:%s' % (KEY_PREFIX, scope, pk)
+
+
+def record_state_change(task, status, step=None, ip=None, progress=None):
+    """
+    Records a change of the state of a task. The change is stored in the
+    change logs of the step and information package of the task, where it
+    is kept for a day or until it is pushed out by newer changes.
+
+    Args:
+        task: The id of the task
+        status: The new status of the task
+        step: The id of the step of the task
+        ip: The id of the information package of the task
+        progress: The new progress of the task
+
+    Returns:
+        The token of the change, None if the task belongs to neither a step
+        nor an information package or if the change couldn't be recorded
+    """
+
+    keys = []
+
+    if step is not None:
+        keys.append(get_key('step', step))
+
+    if ip is not None:
+        keys.append(get_key('ip', ip))
+
+    if not keys:
+        return None
+
+    try:
+        conn = get_redis_connection()
+        token = conn.incr(TOKEN_KEY)
+
+        change = json.dumps({
+            'token': token,
+            'time': timezone.now().isoformat(),
+            'task': str(task),
+            'step': str(step) if step is not None else None,
+            'information_package': str(ip) if ip is not None else None,
+            'status': status,
+            'progress': progress,
+        })
+
+        pipe = conn.pipeline(transaction=False)
+        for key in keys:
+            pipe.zadd(key, token, change)
+            pipe.zremrangebyrank(key, 0, -MAX_CHANGES - 1)
+            pipe.expire(key, CHANGES_TTL)
+        pipe.execute()
+    except RedisError:
+        # the task itself must never fail because of the change log
+        logger.exception('Failed to record state change of task %s', task)
+        return None
+
+    return token
+
+
+def get_step_subtree(step):
+    """
+    Gets the ids of the step and all of its descendants
+    """
+
+    steps = [step]
+    parents = [step]
+
+    while parents:
+        parents = list(ProcessStep.objects.filter(parent_step__in=parents).values_list('pk', flat=True))
+        steps.extend(parents)
+
+    return steps
+
+
+def get_changes(since=0, steps=(), ips=()):
+    """
+    Gets the changes newer than the given token for the given steps and
+    information packages, ordered from oldest to newest
+    """
+
+    keys = [get_key('step', s) for s in steps] + [get_key('ip', ip) for ip in ips]
+
+    if not keys:
+        return []
+
+    pipe = get_redis_connection().pipeline(transaction=False)
+    for key in keys:
+        pipe.zrangebyscore(key, '(%d' % since, '+inf')
+
+    changes = {}
+    for result in pipe.execute():
+        for change in result:
+            change = json.loads(change)
+            changes[change['token']] = change
+
+    return [changes[token] for token in sorted(changes)]
+
+
+def get_timeout():
+    return getattr(settings, 'WORKFLOW_STREAM_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def get_duration():
+    return getattr(settings, 'WORKFLOW_STREAM_DURATION', DEFAULT_DURATION)
+
+
+def get_interval():
+    return getattr(settings, 'WORKFLOW_STREAM_INTERVAL', DEFAULT_INTERVAL)
+
+
+def wait_for_changes(since=0, timeout=None, steps=(), ips=()):
+    """
+    Waits at most timeout seconds for changes newer than the given token
+    """
+
+    if timeout is None:
+        timeout = get_timeout()
+
+    deadline = time.time() + timeout
+
+    while True:
+        changes = get_changes(since, steps, ips)
+
+        if changes or time.time() >= deadline:
+            return changes
+
+        time.sleep(min(get_interval(), max(deadline - time.time(), 0)))
+
+
+def stream_changes(since, get_scope, duration=None):
+    """
+    Yields changes as Server-Sent Events for duration seconds, the client
+    is expected to reconnect with the id of the last received event.
+
+    Args:
+        since: The token of the last change received by the client
+        get_scope: A callable returning the steps and information packages
+            to stream changes for, it is called again every minute to
+            include newly created steps
+        duration: The number of seconds to stream changes
+    """
+
+    if duration is None:
+        duration = get_duration()
+
+    interval = get_interval()
+    deadline = time.time() + duration
+    scope, scope_time = get_scope(), time.time()
+
+    yield 'retry: %d\n\n' % (interval * 1000)
+    last_sent = time.time()
+
+    # changes since the given token are always sent, even if the duration
+    # has passed before the first poll
+    while True:
+        if time.time() - scope_time > 60:
+            scope, scope_time = get_scope(), time.time()
+
+        changes = get_changes(since, **scope)
+
+        for change in changes:
+            since = change['token']
+            yield 'id: %d\nevent: state\ndata: %s\n\n' % (since, json.dumps(change))
+
+        if changes:
+            last_sent = time.time()
+        elif time.time() - last_sent > 15:
+            # keeps proxies from closing the connection
+            yield ': keep-alive\n\n'
+            last_sent = time.time()
+
+        if time.time() >= deadline:
+            break
+
+        time.sleep(interval)
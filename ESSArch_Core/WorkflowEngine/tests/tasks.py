@@ -24,10 +24,13 @@
 
 from __future__ import absolute_import
 
-from ESSArch_Core.ip.models import InformationPackage
+from ESSArch_Core.ip.models import EventIP, InformationPackage
 from ESSArch_Core.WorkflowEngine.dbtask import DBTask
+from ESSArch_Core.WorkflowEngine.models import ProcessTask
 
 import os
+import threading
+import time
 
 
 class First(DBTask):
@@ -63,6 +66,15 @@ class Add(DBTask):
         return x-y
 
 
+class CurrentThread(DBTask):
+    def run(self, delay=0):
+        time.sleep(delay)
+        return threading.current_thread().ident
+
+    def undo(self, delay=0):
+        pass
+
+
 class Fail(DBTask):
     def run(self):
         raise Exception
@@ -99,3 +111,17 @@ class WithEvent(DBTask):
 
     def event_outcome_success(self, bar, foo=None):
         return "Task completed successfully with bar=%s and foo=%s" % (bar, foo)
+
+
+class WithNestedEvents(DBTask):
+    def run(self, tasks=[]):
+        events = []
+
+        for pk in tasks:
+            ProcessTask.objects.get(pk=pk).run().get()
+            events.append(EventIP.objects.filter(eventApplication=pk).count())
+
+        return events
+
+    def undo(self, tasks=[]):
+        pass
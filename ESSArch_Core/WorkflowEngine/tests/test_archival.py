@@ -0,0 +1,181 @@
+"""
+    ESSArch is an open source archiving and digital preservation system
+
+    ESSArch Core
+    Copyright (C) 2005-2017 ES Solutions AB
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+    Contact information:
+    Web - http://www.essolutions.se
+    Email - essarch@essolutions.se
+"""
+
+import datetime
+import uuid
+
+from celery import states as celery_states
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from ESSArch_Core.configuration.models import EventType
+from ESSArch_Core.ip.models import EventIP, InformationPackage
+from ESSArch_Core.WorkflowEngine.archival import BLOB_GRACE_PERIOD, archive_tasks
+from ESSArch_Core.WorkflowEngine.fields import BLOB_THRESHOLD
+from ESSArch_Core.WorkflowEngine.models import (
+    ArchivedProcessTask,
+    ProcessBlob,
+    ProcessStep,
+    ProcessTask,
+)
+from ESSArch_Core.WorkflowEngine.util import get_result
+
+
+class test_archiving_tasks(TestCase):
+    def setUp(self):
+        self.ip = InformationPackage.objects.create()
+        self.step = ProcessStep.objects.create(information_package=self.ip)
+
+    def create_task(self, **kwargs):
+        kwargs.setdefault('name', 'ESSArch_Core.WorkflowEngine.tests.tasks.First')
+        kwargs.setdefault('status', celery_states.SUCCESS)
+        kwargs.setdefault('progress', 100)
+        kwargs.setdefault('time_done', timezone.now())
+        return ProcessTask.objects.create(**kwargs)
+
+    def test_nothing_archived_by_default(self):
+        self.create_task(processstep=self.step)
+
+        self.assertEqual(archive_tasks(), 0)
+        self.assertEqual(ProcessTask.objects.count(), 1)
+
+    def test_archived_ip(self):
+        t = self.create_task(processstep=self.step, params={'foo': 'bar'}, result='baz')
+        InformationPackage.objects.filter(pk=self.ip.pk).update(archived=True)
+
+        self.assertEqual(archive_tasks(batch_size=1), 1)
+        self.assertFalse(ProcessTask.objects.exists())
+
+        archived = ArchivedProcessTask.objects.get(pk=t.pk)
+        self.assertEqual(archived.processstep, self.step)
+        self.assertEqual(archived.data['params'], {'foo': 'bar'})
+        self.assertEqual(get_result(t.pk, eager=True), 'baz')
+
+    def test_retention(self):
+        old = timezone.now() - datetime.timedelta(days=10)
+        other_step = ProcessStep.objects.create()
+
+        self.create_task(processstep=self.step, time_done=old)
+        self.create_task(processstep=other_step)
+
+        self.assertEqual(archive_tasks(retention=5), 1)
+        self.assertFalse(self.step.tasks.exists())
+        self.assertTrue(other_step.tasks.exists())
+
+    @override_settings(WORKFLOW_TASK_RETENTION=5)
+    def test_retention_setting(self):
+        old = timezone.now() - datetime.timedelta(days=10)
+        other_step = ProcessStep.objects.create()
+
+        self.create_task(processstep=self.step, time_done=old)
+        self.create_task(processstep=other_step)
+
+        self.assertEqual(archive_tasks(), 1)
+        self.assertFalse(self.step.tasks.exists())
+        self.assertTrue(other_step.tasks.exists())
+
+    def test_unfinished_steps_are_not_archived(self):
+        self.create_task(processstep=self.step)
+        self.create_task(processstep=self.step, status=celery_states.STARTED)
+        InformationPackage.objects.filter(pk=self.ip.pk).update(archived=True)
+
+        self.assertEqual(archive_tasks(), 0)
+        self.assertEqual(self.step.tasks.count(), 2)
+
+    def test_step_state_is_kept(self):
+        started = timezone.now() - datetime.timedelta(hours=1)
+        self.create_task(processstep=self.step, time_started=started)
+        self.create_task(processstep=self.step, status=celery_states.FAILURE, progress=0)
+        InformationPackage.objects.filter(pk=self.ip.pk).update(archived=True)
+
+        status, progress = self.step.status, self.step.progress
+
+        self.assertEqual(archive_tasks(batch_size=1), 2)
+
+        step = ProcessStep.objects.get(pk=self.step.pk)
+        self.assertFalse(step.tasks.exists())
+        self.assertEqual(step.status, status)
+        self.assertEqual(step.progress, progress)
+        self.assertEqual(step.time_started, started)
+        self.assertFalse(step.undone)
+
+    def test_event_is_kept(self):
+        t = self.create_task(processstep=self.step)
+        event = EventIP.objects.create(
+            eventType=EventType.objects.create(eventType=1),
+            eventApplication=t, linkingObjectIdentifierValue=self.ip,
+        )
+        InformationPackage.objects.filter(pk=self.ip.pk).update(archived=True)
+
+        archive_tasks()
+
+        event = EventIP.objects.get(pk=event.pk)
+        self.assertIsNone(event.eventApplication)
+        self.assertEqual(event.archived_application.pk, t.pk)
+
+    def test_event_is_kept_when_task_is_deleted(self):
+        t = self.create_task(processstep=self.step)
+        event = EventIP.objects.create(
+            eventType=EventType.objects.create(eventType=1),
+            eventApplication=t, linkingObjectIdentifierValue=self.ip,
+        )
+
+        self.step.delete()
+
+        self.assertIsNone(EventIP.objects.get(pk=event.pk).eventApplication)
+
+    def test_tasks_without_step(self):
+        t = self.create_task(information_package=self.ip)
+        InformationPackage.objects.filter(pk=self.ip.pk).update(archived=True)
+
+        self.assertEqual(archive_tasks(), 1)
+        self.assertEqual(ArchivedProcessTask.objects.get().pk, t.pk)
+        self.assertEqual(self.ip.archived_tasks.count(), 1)
+
+    def test_unreferenced_blobs_are_deleted(self):
+        result = [uuid.uuid4().hex for _ in range(BLOB_THRESHOLD / 16)]
+        t = self.create_task(processstep=self.step, result=result)
+        self.create_task(result=result, status=celery_states.STARTED)
+        InformationPackage.objects.filter(pk=self.ip.pk).update(archived=True)
+
+        ProcessBlob.objects.update(time_created=timezone.now() - BLOB_GRACE_PERIOD)
+        self.assertEqual(archive_tasks(), 1)
+
+        # the result is still used by the unfinished task
+        self.assertEqual(ProcessBlob.objects.count(), 2)
+
+        ProcessTask.objects.all().delete()
+        ProcessBlob.objects.update(time_created=timezone.now() - BLOB_GRACE_PERIOD)
+        archive_tasks()
+
+        self.assertEqual(ProcessBlob.objects.count(), 1)
+        self.assertEqual(get_result(t.pk, eager=True), result)
+
+    def test_recent_blobs_are_kept(self):
+        result = [uuid.uuid4().hex for _ in range(BLOB_THRESHOLD / 16)]
+        self.create_task(result=result).delete()
+
+        archive_tasks()
+        self.assertEqual(ProcessBlob.objects.count(), 1)
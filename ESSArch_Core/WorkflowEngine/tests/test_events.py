@@ -0,0 +1,144 @@
+"""
+    ESSArch is an open source archiving and digital preservation system
+
+    ESSArch Core
+    Copyright (C) 2005-2017 ES Solutions AB
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+    Contact information:
+    Web - http://www.essolutions.se
+    Email - essarch@essolutions.se
+"""
+
+import mock
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from ESSArch_Core.configuration.models import EventType
+from ESSArch_Core.ip.models import EventIP, InformationPackage
+from ESSArch_Core.WorkflowEngine import events
+from ESSArch_Core.WorkflowEngine.models import ProcessStep, ProcessTask
+
+
+class test_write_events(TestCase):
+    def setUp(self):
+        self.event_type = EventType.objects.create(eventType=1)
+        self.task = ProcessTask.objects.create(name='foo')
+
+    def create_event(self, application=None):
+        return EventIP(eventType=self.event_type, eventApplication=application)
+
+    def test_single_insert(self):
+        with CaptureQueriesContext(connection) as ctx:
+            events.write_events([self.create_event() for _ in range(5)])
+
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 1)
+
+        self.assertEqual(EventIP.objects.count(), 5)
+
+    def test_one_event_per_task(self):
+        first = self.create_event(self.task)
+        events.write_events([first, self.create_event(self.task), self.create_event()])
+
+        self.assertEqual(EventIP.objects.count(), 2)
+        self.assertEqual(EventIP.objects.get(eventApplication=self.task).pk, first.pk)
+
+    def test_task_with_existing_event(self):
+        existing = self.create_event(self.task)
+        existing.save()
+
+        events.write_events([self.create_event(self.task), self.create_event()])
+
+        self.assertEqual(EventIP.objects.count(), 2)
+        self.assertEqual(EventIP.objects.get(eventApplication=self.task).pk, existing.pk)
+
+
+class test_event_version(TestCase):
+    def test_resolved_once(self):
+        events.get_event_version()
+
+        with mock.patch('ESSArch_Core.WorkflowEngine.events.get_versions') as get_versions:
+            events.get_event_version()
+            events.get_event_version()
+
+        get_versions.assert_not_called()
+
+
+@override_settings(CELERY_ALWAYS_EAGER=True, CELERY_EAGER_PROPAGATES_EXCEPTIONS=True)
+class test_buffered_events(TestCase):
+    def setUp(self):
+        EventType.objects.create(eventType=1)
+        self.ip = InformationPackage.objects.create()
+
+    def create_task(self):
+        return ProcessTask.objects.create(
+            name='ESSArch_Core.WorkflowEngine.tests.tasks.WithEvent',
+            args=[1], information_package=self.ip,
+        )
+
+    def test_written_when_task_is_done(self):
+        task = self.create_task()
+        task.run().get()
+
+        self.assertTrue(EventIP.objects.filter(eventApplication=task).exists())
+
+    def test_written_when_outermost_task_is_done(self):
+        tasks = [self.create_task() for _ in range(3)]
+        outer = ProcessTask.objects.create(
+            name='ESSArch_Core.WorkflowEngine.tests.tasks.WithNestedEvents',
+            params={'tasks': [str(t.pk) for t in tasks]},
+        )
+
+        self.assertEqual(outer.run().get(), [0, 0, 0])
+        self.assertEqual(EventIP.objects.filter(eventApplication__in=tasks).count(), 3)
+
+    @override_settings(WORKFLOW_EVENT_BATCH_SIZE=2)
+    def test_written_when_buffer_is_full(self):
+        tasks = [self.create_task() for _ in range(3)]
+        outer = ProcessTask.objects.create(
+            name='ESSArch_Core.WorkflowEngine.tests.tasks.WithNestedEvents',
+            params={'tasks': [str(t.pk) for t in tasks]},
+        )
+
+        self.assertEqual(outer.run().get(), [0, 1, 0])
+        self.assertEqual(EventIP.objects.filter(eventApplication__in=tasks).count(), 3)
+
+    def test_written_when_step_is_done(self):
+        step = ProcessStep.objects.create(name='step', eager=True)
+        tasks = [self.create_task() for _ in range(3)]
+        step.tasks = tasks
+        step.save()
+
+        with CaptureQueriesContext(connection) as ctx:
+            step.run().get()
+
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT INTO "ip_eventip"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(EventIP.objects.filter(eventApplication__in=tasks).count(), 3)
+
+    def test_time_of_event(self):
+        task = self.create_task()
+        buffer = events.EventBuffer()
+
+        with mock.patch('ESSArch_Core.WorkflowEngine.dbtask.event_buffer', buffer):
+            with buffer.batch():
+                task.run().get()
+                created = buffer.events[0].eventDateTime
+                self.assertFalse(EventIP.objects.filter(eventApplication=task).exists())
+
+        self.assertEqual(EventIP.objects.get(eventApplication=task).eventDateTime, created)
@@ -0,0 +1,140 @@
+"""
+    ESSArch is an open source archiving and digital preservation system
+
+    ESSArch Core
+    Copyright (C) 2005-2017 ES Solutions AB
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+    Contact information:
+    Web - http://www.essolutions.se
+    Email - essarch@essolutions.se
+"""
+
+import datetime
+import uuid
+
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from picklefield.fields import dbsafe_encode
+
+from ESSArch_Core.WorkflowEngine.fields import BLOB_THRESHOLD, decode, encode
+from ESSArch_Core.WorkflowEngine.models import ProcessBlob, ProcessTask
+
+
+def get_raw(task, field):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT %s FROM ProcessTask WHERE id = %%s' % field, [task.pk.hex])
+        return cursor.fetchone()[0]
+
+
+class test_encoding(TestCase):
+    def test_json(self):
+        value = {'foo': [1, 2.5, None, True], 'bar': u'baz'}
+        data = encode(value)
+
+        self.assertTrue(data.startswith('1:json:'))
+        self.assertEqual(decode(data), value)
+
+    def test_tagged_types(self):
+        value = {
+            'tuple': (1, 2),
+            'uuid': uuid.uuid4(),
+            'datetime': timezone.now(),
+        }
+        data = encode(value)
+
+        self.assertTrue(data.startswith('1:json:'))
+        self.assertEqual(decode(data), value)
+
+    def test_str_decoded_as_unicode(self):
+        decoded = decode(encode({'foo': 'bar'}))
+
+        self.assertEqual(decoded, {u'foo': u'bar'})
+        self.assertIsInstance(decoded.keys()[0], unicode)
+        self.assertIsInstance(decoded.values()[0], unicode)
+
+    def test_pickle_fallback(self):
+        value = {1: datetime.date.today()}
+        data = encode(value)
+
+        self.assertTrue(data.startswith('1:pickle:'))
+        self.assertEqual(decode(data), value)
+
+    def test_compression(self):
+        value = ['foo'] * 1000
+        data = encode(value)
+
+        self.assertTrue(data.startswith('1:zlib:'))
+        self.assertEqual(decode(data), value)
+
+    def test_legacy_pickle(self):
+        value = {'foo': ['bar']}
+        self.assertEqual(decode(dbsafe_encode(value)), value)
+
+
+class test_compact_object_field(TestCase):
+    def test_defaults_are_not_shared(self):
+        t1 = ProcessTask(name='foo')
+        t2 = ProcessTask(name='foo')
+
+        t1.params['foo'] = 'bar'
+        t1.args.append('baz')
+
+        self.assertEqual(t2.params, {})
+        self.assertEqual(t2.args, [])
+
+    def test_save_and_load(self):
+        params = {'foo': 'bar', 'baz': (1, 2)}
+        t = ProcessTask.objects.create(name='foo', args=[1, 2], params=params)
+
+        self.assertTrue(get_raw(t, 'params').startswith('1:json:'))
+
+        t.refresh_from_db()
+        self.assertEqual(t.args, [1, 2])
+        self.assertEqual(t.params, params)
+
+    def test_load_legacy_row(self):
+        t = ProcessTask.objects.create(name='foo')
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'UPDATE ProcessTask SET params = %s WHERE id = %s',
+                [dbsafe_encode({'foo': 'bar'}), t.pk.hex]
+            )
+
+        t.refresh_from_db()
+        self.assertEqual(t.params, {'foo': 'bar'})
+
+    def test_large_result_in_blob_store(self):
+        result = [uuid.uuid4().hex for _ in range(BLOB_THRESHOLD / 16)]
+
+        t1 = ProcessTask.objects.create(name='foo', result=result)
+        t2 = ProcessTask.objects.create(name='foo', result=result)
+
+        self.assertTrue(get_raw(t1, 'result').startswith('1:blob:'))
+        self.assertEqual(ProcessBlob.objects.count(), 1)
+
+        t1.refresh_from_db()
+        t2.refresh_from_db()
+        self.assertEqual(t1.result, result)
+        self.assertEqual(t2.result, result)
+
+    def test_exact_lookup(self):
+        t = ProcessTask.objects.create(name='foo', params={'foo': 'bar', 'a': 1})
+
+        self.assertEqual(ProcessTask.objects.get(params={'a': 1, 'foo': 'bar'}), t)
+        self.assertTrue(ProcessTask.objects.filter(result__isnull=True).exists())
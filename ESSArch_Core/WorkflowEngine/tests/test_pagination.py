@@ -0,0 +1,169 @@
+"""
+    ESSArch is an open source archiving and digital preservation system
+
+    ESSArch Core
+    Copyright (C) 2005-2017 ES Solutions AB
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+    Contact information:
+    Web - http://www.essolutions.se
+    Email - essarch@essolutions.se
+"""
+
+import re
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from rest_framework import generics, serializers
+from rest_framework.test import APIRequestFactory
+
+from ESSArch_Core.pagination import LinkHeaderCursorPagination, LinkHeaderPagination
+from ESSArch_Core.WorkflowEngine.models import ProcessTask
+
+
+def get_links(response):
+    return dict((rel, url) for url, rel in re.findall(r'<([^>]+)>; rel="(\w+)"', response.get('Link', '')))
+
+
+class TaskSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ProcessTask
+        fields = ('id', 'name')
+
+
+class TaskList(generics.ListAPIView):
+    queryset = ProcessTask.objects.all()
+    serializer_class = TaskSerializer
+
+    def get_queryset(self):
+        queryset = super(TaskList, self).get_queryset()
+        name = self.request.query_params.get('name')
+
+        if name is not None:
+            queryset = queryset.filter(name=name)
+
+        return queryset.order_by('processstep_pos')
+
+
+class CachedCountTaskList(TaskList):
+    cached_count = True
+
+
+class PaginationTestCase(TestCase):
+    pagination_class = None
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.view = TaskList.as_view(pagination_class=self.pagination_class)
+
+        for i in range(7):
+            ProcessTask.objects.create(name='foo' if i % 2 else 'bar', processstep_pos=i)
+
+    def tearDown(self):
+        cache.clear()
+
+    def get(self, url='/', **params):
+        response = self.view(self.factory.get(url, params))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+
+class test_link_header_pagination(PaginationTestCase):
+    pagination_class = LinkHeaderPagination
+
+    def test_links(self):
+        response = self.get(page_size=3, page=2)
+        links = get_links(response)
+
+        self.assertIn('page=3', links['next'])
+        self.assertIn('prev', links)
+        self.assertEqual(response['Count'], '7')
+
+    def test_exact_count_by_default(self):
+        self.get(page_size=3)
+        ProcessTask.objects.create(name='foo', processstep_pos=7)
+
+        response = self.get(page_size=3, page=3)
+
+        self.assertEqual(response['Count'], '8')
+        self.assertEqual(len(response.data), 2)
+
+    def test_cached_count(self):
+        self.view = CachedCountTaskList.as_view(pagination_class=self.pagination_class)
+        self.get(page_size=3)
+        ProcessTask.objects.create(name='foo', processstep_pos=7)
+
+        with self.assertNumQueries(1):
+            response = self.get(page_size=3)
+
+        self.assertEqual(response['Count'], '7')
+
+        # the count is cached for each set of filters
+        self.assertEqual(self.get(page_size=3, name='foo')['Count'], '4')
+
+    def test_exact_count(self):
+        self.view = CachedCountTaskList.as_view(pagination_class=self.pagination_class)
+        self.get(page_size=3)
+        ProcessTask.objects.create(name='foo', processstep_pos=7)
+
+        with self.assertNumQueries(2):
+            response = self.get(page_size=3, exact_count='true')
+
+        self.assertEqual(response['Count'], '8')
+
+
+class test_link_header_cursor_pagination(PaginationTestCase):
+    pagination_class = LinkHeaderCursorPagination
+
+    def test_all_pages(self):
+        response = self.get(page_size=3)
+        self.assertEqual(response['Count'], '7')
+        self.assertNotIn('prev', get_links(response))
+
+        ids = [t['id'] for t in response.data]
+        pages = [response.data]
+
+        while 'next' in get_links(response):
+            response = self.get(get_links(response)['next'])
+            ids.extend(t['id'] for t in response.data)
+            pages.append(response.data)
+
+        expected = [str(pk) for pk in ProcessTask.objects.order_by('-pk').values_list('pk', flat=True)]
+        self.assertEqual(ids, expected)
+        self.assertEqual(len(pages), 3)
+
+        previous = self.get(get_links(response)['prev'])
+        self.assertEqual(previous.data, pages[1])
+
+    def test_cursor_ordering(self):
+        TaskList.cursor_ordering = 'processstep_pos'
+
+        try:
+            response = self.get(page_size=3)
+        finally:
+            del TaskList.cursor_ordering
+
+        self.assertEqual([t['name'] for t in response.data], ['bar', 'foo', 'bar'])
+
+    def test_cached_count(self):
+        self.get(page_size=3)
+        ProcessTask.objects.create(name='foo', processstep_pos=7)
+
+        with self.assertNumQueries(1):
+            response = self.get(page_size=3)
+
+        self.assertEqual(response['Count'], '7')
+        self.assertEqual(self.get(page_size=3, exact_count='true')['Count'], '8')
@@ -0,0 +1,98 @@
+"""
+    ESSArch is an open source archiving and digital preservation system
+
+    ESSArch Core
+    Copyright (C) 2005-2017 ES Solutions AB
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+    Contact information:
+    Web - http://www.essolutions.se
+    Email - essarch@essolutions.se
+"""
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from ESSArch_Core.WorkflowEngine.models import ProcessTask
+from ESSArch_Core.WorkflowEngine.progress import ProgressChannel, get_cache_key, get_task_progress
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class test_progress_channel(TestCase):
+    def setUp(self):
+        self.task = ProcessTask.objects.create(name='foo')
+        self.clock = Clock()
+        self.published = []
+        self.channel = ProgressChannel(
+            self.task.pk, rate=2, milestone=10, clock=self.clock,
+            callback=lambda progress, total: self.published.append(progress),
+        )
+
+    def tearDown(self):
+        cache.delete(get_cache_key(self.task.pk))
+
+    def get_db_progress(self):
+        return ProcessTask.objects.values_list('progress', flat=True).get(pk=self.task.pk)
+
+    def test_rate_limited(self):
+        for i in range(1, 50):
+            self.channel.update(i, 100)
+
+        self.assertEqual(self.published, [1])
+        self.assertEqual(get_task_progress(self.task.pk), 1)
+
+        self.clock.now = 0.5
+        self.channel.update(50, 100)
+
+        self.assertEqual(self.published, [1, 50])
+        self.assertEqual(get_task_progress(self.task.pk), 50)
+
+    def test_final_value_always_published(self):
+        self.channel.update(1, 100)
+        self.channel.update(100, 100)
+
+        self.assertEqual(self.published, [1, 100])
+        self.assertEqual(self.get_db_progress(), 100)
+
+    def test_persisted_at_milestones(self):
+        self.channel.update(5, 100)
+        self.assertEqual(self.get_db_progress(), 0)
+
+        self.clock.now = 1
+        self.channel.update(12, 100)
+        self.assertEqual(self.get_db_progress(), 12)
+
+        self.clock.now = 2
+        self.channel.update(20, 100)
+        self.assertEqual(self.get_db_progress(), 12)
+
+    def test_flush(self):
+        self.channel.update(1, 100)
+        self.channel.update(30, 100)
+        self.assertEqual(get_task_progress(self.task.pk), 1)
+
+        self.channel.flush()
+        self.assertEqual(get_task_progress(self.task.pk), 30)
+        self.assertEqual(self.get_db_progress(), 30)
+
+        self.channel.flush()
+        self.assertEqual(self.published, [1, 30])
@@ -35,7 +35,7 @@ from ESSArch_Core.configuration.models import EventType
 from ESSArch_Core.ip.models import EventIP, InformationPackage
 
 from ESSArch_Core.WorkflowEngine.models import (
-    ProcessStep, ProcessTask,
+    SHADOW_BATCH_SIZE, ProcessStep, ProcessTask,
 )
 
 import os
@@ -1211,7 +1211,7 @@ class test_running_steps(TransactionTestCase):
         step.tasks = [t1, t2, t3]
         step.save()
 
-        expected = 14 if self.transaction_support else 20
+        expected = 16 if self.transaction_support else 22
 
         with self.assertNumQueries(expected):
             step.run().get()
@@ -1335,6 +1335,134 @@ class test_running_steps_eagerly(TransactionTestCase):
         self.assertEqual(t2.result, t1.result + t2_val)
         self.assertEqual(t3.result, t1.result + t3_val)
 
+    def test_result_params_in_other_forms(self):
+        step = ProcessStep.objects.create(name="Test")
+
+        t1 = ProcessTask.objects.create(
+            name="ESSArch_Core.WorkflowEngine.tests.tasks.Add",
+            params={"x": 1, "y": 1},
+            processstep_pos=0,
+        )
+
+        t2 = ProcessTask.objects.create(
+            name="ESSArch_Core.WorkflowEngine.tests.tasks.Add",
+            params={"x": 2},
+            result_params={"y": t1.id.hex},
+            processstep_pos=1,
+        )
+
+        t3 = ProcessTask.objects.create(
+            name="ESSArch_Core.WorkflowEngine.tests.tasks.Add",
+            params={"x": 3},
+            result_params={"y": str(t1.id).upper()},
+            processstep_pos=2,
+        )
+
+        step.tasks = [t1, t2, t3]
+        step.save()
+
+        step.run()
+
+        t2.refresh_from_db()
+        t3.refresh_from_db()
+
+        self.assertEqual(t2.result, 4)
+        self.assertEqual(t3.result, 5)
+
+
+@override_settings(CELERY_ALWAYS_EAGER=False, WORKFLOW_EAGER_POOL_SIZE=4)
+class test_running_steps_concurrently(TransactionTestCase):
+    def test_parallel_step(self):
+        step = ProcessStep.objects.create(name="Test", parallel=True)
+
+        for i in range(4):
+            ProcessTask.objects.create(
+                name="ESSArch_Core.WorkflowEngine.tests.tasks.CurrentThread",
+                params={"delay": 0.2},
+                processstep=step,
+                processstep_pos=i,
+            )
+
+        res = step.run().get()
+
+        self.assertEqual(len(res), 4)
+        self.assertTrue(len(set(res)) > 1)
+        self.assertEqual(step.status, celery_states.SUCCESS)
+        self.assertFalse(step.tasks.exclude(status=celery_states.SUCCESS).exists())
+
+    def test_serial_step(self):
+        step = ProcessStep.objects.create(name="Test")
+
+        t1 = ProcessTask.objects.create(
+            name="ESSArch_Core.WorkflowEngine.tests.tasks.Add",
+            params={"x": 1, "y": 1},
+            processstep=step,
+            processstep_pos=0,
+        )
+
+        t2 = ProcessTask.objects.create(
+            name="ESSArch_Core.WorkflowEngine.tests.tasks.Add",
+            params={"x": 2},
+            result_params={"y": t1.id},
+            processstep=step,
+            processstep_pos=1,
+        )
+
+        step.run()
+
+        t1.refresh_from_db()
+        t2.refresh_from_db()
+
+        self.assertEqual(step.status, celery_states.SUCCESS)
+        self.assertEqual(t1.result, 2)
+        self.assertEqual(t2.result, 4)
+
+    def test_parallel_child_steps(self):
+        main_step = ProcessStep.objects.create(name="Test", parallel=True)
+
+        for i in range(3):
+            child = ProcessStep.objects.create(parent_step=main_step, parent_step_pos=i)
+            ProcessTask.objects.create(
+                name="ESSArch_Core.WorkflowEngine.tests.tasks.First",
+                params={"foo": i},
+                processstep=child,
+            )
+
+        main_step.run()
+
+        self.assertEqual(main_step.status, celery_states.SUCCESS)
+        self.assertEqual(
+            sorted(ProcessTask.objects.values_list('result', flat=True)),
+            [0, 1, 2]
+        )
+
+    @override_settings(CELERY_EAGER_PROPAGATES_EXCEPTIONS=False)
+    def test_failing_parallel_step(self):
+        step = ProcessStep.objects.create(name="Test", parallel=True)
+
+        t1 = ProcessTask.objects.create(
+            name="ESSArch_Core.WorkflowEngine.tests.tasks.First",
+            params={"foo": 1},
+            processstep=step,
+            processstep_pos=0,
+        )
+
+        t2 = ProcessTask.objects.create(
+            name="ESSArch_Core.WorkflowEngine.tests.tasks.Fail",
+            processstep=step,
+            processstep_pos=1,
+        )
+
+        with self.assertRaises(Exception):
+            step.run().get()
+
+        t1.refresh_from_db()
+        t2.refresh_from_db()
+
+        self.assertEqual(step.status, celery_states.FAILURE)
+        self.assertEqual(t1.status, celery_states.SUCCESS)
+        self.assertEqual(t2.status, celery_states.FAILURE)
+
 
 class test_undoing_steps(TestCase):
     def setUp(self):
@@ -1598,6 +1726,29 @@ class test_undoing_steps(TestCase):
         self.assertEqual(step2.status, celery_states.SUCCESS)
         self.assertEqual(step3.status, celery_states.PENDING)
 
+    def test_undo_many_tasks(self):
+        step = ProcessStep.objects.create()
+        task_count = SHADOW_BATCH_SIZE + 10
+
+        ProcessTask.objects.bulk_create([
+            ProcessTask(
+                name="ESSArch_Core.WorkflowEngine.tests.tasks.First",
+                params={"foo": i}, processstep=step, processstep_pos=i,
+                status=celery_states.SUCCESS,
+            ) for i in range(task_count)
+        ])
+
+        step.undo().get()
+
+        tasks = step.tasks.filter(undo_type=False)
+        self.assertFalse(tasks.filter(undone__isnull=True).exists())
+
+        for t in tasks.select_related('undone'):
+            self.assertTrue(t.undone.undo_type)
+            self.assertEqual(t.undone.params, {'foo': t.params['foo']})
+            self.assertEqual(t.undone.processstep_pos, t.processstep_pos)
+            self.assertEqual(t.undone.status, celery_states.SUCCESS)
+
 
 class test_retrying_steps(TestCase):
     def setUp(self):
@@ -0,0 +1,183 @@
+"""
+    ESSArch is an open source archiving and digital preservation system
+
+    ESSArch Core
+    Copyright (C) 2005-2017 ES Solutions AB
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+    Contact information:
+    Web - http://www.essolutions.se
+    Email - essarch@essolutions.se
+"""
+
+import json
+
+from celery import states as celery_states
+
+from django.test import TestCase, override_settings
+
+from django_redis import get_redis_connection
+
+from rest_framework.test import APIRequestFactory
+
+from ESSArch_Core.ip.models import InformationPackage
+from ESSArch_Core.WorkflowEngine.models import ProcessStep, ProcessTask
+from ESSArch_Core.WorkflowEngine.stream import (
+    KEY_PREFIX,
+    get_changes,
+    get_step_subtree,
+    record_state_change,
+    stream_changes,
+    wait_for_changes,
+)
+from ESSArch_Core.WorkflowEngine.views import EventStreamRenderer, ProcessStepViewSet
+
+
+class StreamTestCase(TestCase):
+    def tearDown(self):
+        conn = get_redis_connection()
+        keys = conn.keys('%s:*' % KEY_PREFIX)
+
+        if keys:
+            conn.delete(*keys)
+
+
+class test_changes(StreamTestCase):
+    def setUp(self):
+        self.ip = InformationPackage.objects.create()
+        self.step = ProcessStep.objects.create(information_package=self.ip)
+
+    def test_resume_from_token(self):
+        first = record_state_change('a', celery_states.STARTED, step=self.step.pk)
+        second = record_state_change('a', celery_states.SUCCESS, step=self.step.pk, progress=100)
+
+        self.assertGreater(second, first)
+
+        changes = get_changes(steps=[self.step.pk])
+        self.assertEqual([c['status'] for c in changes], [celery_states.STARTED, celery_states.SUCCESS])
+
+        changes = get_changes(first, steps=[self.step.pk])
+        self.assertEqual(len(changes), 1)
+        self.assertEqual(changes[0]['token'], second)
+        self.assertEqual(changes[0]['progress'], 100)
+
+    def test_merged_and_ordered(self):
+        other = ProcessStep.objects.create()
+
+        record_state_change('a', celery_states.STARTED, step=self.step.pk, ip=self.ip.pk)
+        record_state_change('b', celery_states.STARTED, step=other.pk)
+        record_state_change('a', celery_states.SUCCESS, step=self.step.pk, ip=self.ip.pk)
+
+        changes = get_changes(steps=[self.step.pk, other.pk], ips=[self.ip.pk])
+        self.assertEqual([c['task'] for c in changes], ['a', 'b', 'a'])
+
+        tokens = [c['token'] for c in changes]
+        self.assertEqual(tokens, sorted(tokens))
+
+    def test_nothing_recorded_without_scope(self):
+        self.assertIsNone(record_state_change('a', celery_states.STARTED))
+
+    def test_step_subtree(self):
+        child = ProcessStep.objects.create(parent_step=self.step)
+        grandchild = ProcessStep.objects.create(parent_step=child)
+        ProcessStep.objects.create()
+
+        self.assertEqual(set(get_step_subtree(self.step.pk)), {self.step.pk, child.pk, grandchild.pk})
+
+    def test_wait_without_changes(self):
+        self.assertEqual(wait_for_changes(timeout=0, steps=[self.step.pk]), [])
+
+    def test_task_transitions(self):
+        task = ProcessTask.objects.create(
+            name="ESSArch_Core.WorkflowEngine.tests.tasks.First",
+            processstep=self.step, information_package=self.ip,
+        )
+        task.run()
+
+        changes = get_changes(ips=[self.ip.pk])
+        self.assertEqual([c['status'] for c in changes], [celery_states.STARTED, celery_states.SUCCESS])
+        self.assertEqual(changes[0]['task'], str(task.pk))
+        self.assertEqual(changes[0]['step'], str(self.step.pk))
+
+    def test_failed_task(self):
+        task = ProcessTask.objects.create(
+            name="ESSArch_Core.WorkflowEngine.tests.tasks.Fail",
+            processstep=self.step,
+        )
+
+        with self.assertRaises(Exception):
+            task.run()
+
+        changes = get_changes(steps=[self.step.pk])
+        self.assertEqual(changes[-1]['status'], celery_states.FAILURE)
+
+
+@override_settings(WORKFLOW_STREAM_INTERVAL=0)
+class test_stream(StreamTestCase):
+    def setUp(self):
+        self.step = ProcessStep.objects.create()
+        self.child = ProcessStep.objects.create(parent_step=self.step)
+        self.factory = APIRequestFactory()
+
+    def test_server_sent_events(self):
+        token = record_state_change('a', celery_states.STARTED, step=self.child.pk)
+
+        events = list(stream_changes(0, lambda: {'steps': [self.child.pk]}, duration=0.01))
+
+        self.assertTrue(events[0].startswith('retry:'))
+        self.assertTrue(events[1].startswith('id: %d\nevent: state\n' % token))
+
+    def test_long_poll_view(self):
+        record_state_change('a', celery_states.STARTED, step=self.step.pk)
+        token = record_state_change('b', celery_states.STARTED, step=self.child.pk)
+
+        view = ProcessStepViewSet.as_view({'get': 'changes'})
+        request = self.factory.get('/', {'since': token - 1, 'timeout': 0})
+        response = view(request, pk=str(self.step.pk))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['token'], token)
+        self.assertEqual([c['task'] for c in response.data['changes']], ['b'])
+
+    def test_long_poll_view_resume_header(self):
+        token = record_state_change('a', celery_states.STARTED, step=self.step.pk)
+
+        view = ProcessStepViewSet.as_view({'get': 'changes'})
+        request = self.factory.get('/', {'timeout': 0}, HTTP_LAST_EVENT_ID=str(token))
+        response = view(request, pk=str(self.step.pk))
+
+        self.assertEqual(response.data, {'token': token, 'changes': []})
+
+    def test_invalid_token(self):
+        view = ProcessStepViewSet.as_view({'get': 'changes'})
+        response = view(self.factory.get('/', {'since': 'foo'}), pk=str(self.step.pk))
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_stream_view(self):
+        record_state_change('a', celery_states.STARTED, step=self.child.pk)
+
+        view = ProcessStepViewSet.as_view({'get': 'changes_stream'}, renderer_classes=[EventStreamRenderer])
+
+        with self.settings(WORKFLOW_STREAM_DURATION=0.01):
+            response = view(self.factory.get('/', HTTP_ACCEPT='text/event-stream'), pk=str(self.step.pk))
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        with self.settings(WORKFLOW_STREAM_DURATION=0.01):
+            content = ''.join(response.streaming_content)
+
+        data = [json.loads(line[len('data: '):]) for line in content.splitlines() if line.startswith('data: ')]
+        self.assertEqual([c['task'] for c in data], ['a'])
@@ -88,6 +88,19 @@ class test_running_tasks(TestCase):
 
         self.assertEqual(res, x+y)
 
+    def test_params_are_not_modified(self):
+        task = ProcessTask.objects.create(
+            name="ESSArch_Core.WorkflowEngine.tests.tasks.First",
+            params={'foo': 123},
+        )
+
+        self.assertEqual(task.run().get(), 123)
+        self.assertEqual(task.params, {'foo': 123})
+
+        task.undo()
+        self.assertEqual(task.params, {'foo': 123})
+        self.assertEqual(task.undone.params, {'foo': 123})
+
     def test_run_with_too_many_args(self):
         x = 5
         y = 10
@@ -148,7 +161,7 @@ class test_running_tasks(TestCase):
             information_package=InformationPackage.objects.create()
         )
 
-        with self.assertNumQueries(3):
+        with self.assertNumQueries(2):
             task.run()
 
         task.refresh_from_db()
@@ -170,7 +183,7 @@ class test_running_tasks(TestCase):
             information_package=InformationPackage.objects.create()
         )
 
-        with self.assertNumQueries(6):
+        with self.assertNumQueries(5):
             task.run()
 
         task.refresh_from_db()
@@ -197,7 +210,7 @@ class test_running_tasks(TestCase):
             information_package=InformationPackage.objects.create()
         )
 
-        with self.assertNumQueries(3):
+        with self.assertNumQueries(2):
             with self.assertRaises(TypeError):
                 task.run()
 
@@ -230,7 +243,7 @@ class test_running_tasks(TestCase):
             information_package=InformationPackage.objects.create()
         )
 
-        with self.assertNumQueries(6):
+        with self.assertNumQueries(5):
             with self.assertRaises(TypeError):
                 task.run()
 
@@ -261,7 +274,7 @@ class test_undoing_tasks(TestCase):
         task.refresh_from_db()
         self.assertEqual(task.status, celery_states.SUCCESS)
 
-        with self.assertNumQueries(5):
+        with self.assertNumQueries(4):
             res = task.undo()
         task.refresh_from_db()
         self.assertEqual(res.get(), x-y)
@@ -341,7 +354,7 @@ class test_retrying_tasks(TestCase):
         task.run()
         task.undo()
 
-        with self.assertNumQueries(5):
+        with self.assertNumQueries(4):
             task.retry()
 
         task.refresh_from_db()
@@ -0,0 +1,165 @@
+"""
+    ESSArch is an open source archiving and digital preservation system
+
+    ESSArch Core
+    Copyright (C) 2005-2017 ES Solutions AB
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+    Contact information:
+    Web - http://www.essolutions.se
+    Email - essarch@essolutions.se
+"""
+
+from celery import states as celery_states
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from ESSArch_Core.WorkflowEngine.models import ProcessStep, ProcessStepSummary, ProcessTask
+from ESSArch_Core.WorkflowEngine.util import (
+    get_result,
+    get_results,
+    get_step_details,
+    get_step_states,
+    result_cache,
+)
+
+
+class test_get_results(TestCase):
+    def setUp(self):
+        result_cache.clear()
+
+    def create_task(self, result, status=celery_states.SUCCESS):
+        return ProcessTask.objects.create(name='foo', status=status, result=result)
+
+    def test_single_query(self):
+        tasks = [self.create_task(i) for i in range(5)]
+
+        with self.assertNumQueries(1):
+            results = get_results([t.pk for t in tasks], eager=True)
+
+        self.assertEqual(results, dict((str(t.pk), i) for i, t in enumerate(tasks)))
+
+    def test_cached(self):
+        t = self.create_task({'foo': ['bar']})
+        get_results([t.pk], eager=True)
+
+        with self.assertNumQueries(0):
+            result = get_result(t.pk, eager=True)
+
+        self.assertEqual(result, {'foo': ['bar']})
+
+        # modifying the returned result must not modify the cached result
+        result['foo'].append('baz')
+        self.assertEqual(get_result(t.pk, eager=True), {'foo': ['bar']})
+
+    def test_pk_forms(self):
+        t = self.create_task(1)
+
+        for pk in [t.pk, str(t.pk), t.pk.hex, t.pk.urn]:
+            self.assertEqual(get_results([pk], eager=True), {str(t.pk): 1})
+            self.assertEqual(get_result(pk, eager=True), 1)
+
+    def test_unfinished_tasks_are_not_included(self):
+        t1 = self.create_task(1)
+        t2 = self.create_task(None, status=celery_states.STARTED)
+
+        self.assertEqual(get_results([t1.pk, t2.pk], eager=True), {str(t1.pk): 1})
+
+        with self.assertRaises(ProcessTask.DoesNotExist):
+            get_result(t2.pk, eager=True)
+
+        ProcessTask.objects.filter(pk=t2.pk).update(status=celery_states.SUCCESS, result=2)
+        self.assertEqual(get_result(t2.pk, eager=True), 2)
+
+
+class test_get_step_states(TestCase):
+    def setUp(self):
+        self.root = ProcessStep.objects.create()
+        self.steps = [ProcessStep.objects.create(parent_step=self.root) for _ in range(3)]
+
+        # pending, started and failed steps with child steps of their own
+        for i, (step, status) in enumerate(zip(self.steps, [celery_states.PENDING, celery_states.STARTED, celery_states.FAILURE])):
+            child = ProcessStep.objects.create(parent_step=step)
+            ProcessTask.objects.create(name='foo', processstep=child, status=status, progress=10 * i)
+            ProcessTask.objects.create(name='foo', processstep=step, status=celery_states.SUCCESS, progress=100)
+
+        undone = ProcessTask.objects.create(name='foo', processstep=self.steps[0], status=celery_states.FAILURE)
+        undone.undone = ProcessTask.objects.create(name='foo', processstep=self.steps[0], undo_type=True)
+        undone.save()
+
+        self.steps[1].summary = ProcessStepSummary.objects.create(task_count=2, task_progress=150)
+        self.steps[1].save()
+
+        self.empty = ProcessStep.objects.create(parent_step=self.root)
+
+    def tearDown(self):
+        cache.clear()
+
+    def get_expected(self, steps):
+        cache.clear()
+        expected = dict((s.pk, {'status': s.status, 'progress': s.progress, 'undone': s.undone}) for s in steps)
+        cache.clear()
+        return expected
+
+    maxDiff = None
+
+    def test_same_as_properties(self):
+        steps = [self.root, self.empty] + self.steps
+        expected = self.get_expected(steps)
+
+        self.assertEqual(get_step_states([s.pk for s in steps]), expected)
+
+    def test_queries_per_level(self):
+        # 3 levels of steps, then task aggregates and summaries
+        with self.assertNumQueries(5):
+            get_step_states([self.root.pk])
+
+        with self.assertNumQueries(0):
+            states = get_step_states([self.root.pk])
+
+        self.assertEqual(states, self.get_expected([self.root]))
+
+    def test_cleared_with_step_cache(self):
+        get_step_states([self.root.pk])
+        self.steps[0].clear_cache()
+
+        # the step is calculated again using the cached state of its child
+        with self.assertNumQueries(3):
+            states = get_step_states([str(self.steps[0].pk)])
+
+        self.assertEqual(states, self.get_expected([self.steps[0]]))
+
+
+class test_get_step_details(TestCase):
+    def test_details(self):
+        step = ProcessStep.objects.create()
+        empty = ProcessStep.objects.create()
+
+        ProcessTask.objects.create(name='foo', processstep=step, status=celery_states.SUCCESS)
+        ProcessTask.objects.create(name='foo', processstep=step, status=celery_states.FAILURE, exception='foo', traceback='bar')
+        ProcessTask.objects.create(name='foo', processstep=step, status=celery_states.FAILURE, exception='foo', traceback='bar')
+
+        with self.assertNumQueries(3):
+            details = get_step_details([step.pk, empty.pk])
+
+        first = step.tasks.filter(status=celery_states.FAILURE).first()
+        self.assertEqual(details[step.pk]['task_count'], 3)
+        self.assertEqual(details[step.pk]['failed_task_count'], 2)
+        self.assertEqual(details[step.pk]['exception'], first.exception)
+        self.assertEqual(details[step.pk]['traceback'], first.traceback)
+        self.assertEqual(details[empty.pk], {
+            'task_count': 0, 'failed_task_count': 0, 'exception': None, 'traceback': None,
+        })
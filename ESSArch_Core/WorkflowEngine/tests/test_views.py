@@ -0,0 +1,249 @@
+"""
+    ESSArch is an open source archiving and digital preservation system
+
+    ESSArch Core
+    Copyright (C) 2005-2017 ES Solutions AB
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+    Contact information:
+    Web - http://www.essolutions.se
+    Email - essarch@essolutions.se
+"""
+
+import datetime
+import re
+
+from celery import states as celery_states
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+import mock
+
+from rest_framework.test import APIRequestFactory
+
+from ESSArch_Core.pagination import LinkHeaderPagination
+from ESSArch_Core.WorkflowEngine.models import ProcessStep, ProcessTask
+from ESSArch_Core.WorkflowEngine.views import ProcessStepViewSet, ProcessTaskViewSet, ProcessViewSet
+
+
+def get_links(response):
+    return dict((rel, url) for url, rel in re.findall(r'<([^>]+)>; rel="(\w+)"', response.get('Link', '')))
+
+
+class test_process_children(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.view = ProcessViewSet.as_view({'get': 'list'})
+        self.step = ProcessStep.objects.create()
+        self.now = timezone.now()
+
+    def tearDown(self):
+        cache.clear()
+
+    def create_task(self, minutes=None, **kwargs):
+        if minutes is not None:
+            kwargs['time_started'] = self.now + datetime.timedelta(minutes=minutes)
+            kwargs['status'] = celery_states.SUCCESS
+
+        return ProcessTask.objects.create(name='foo', processstep=self.step, **kwargs)
+
+    def get(self, url='/', **params):
+        response = self.view(self.factory.get(url, params), parent_lookup_processstep=str(self.step.pk))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def get_all(self, **params):
+        response = self.get(**params)
+        ids = [obj['id'] for obj in response.data]
+
+        while 'next' in get_links(response):
+            response = self.get(get_links(response)['next'])
+            ids.extend(obj['id'] for obj in response.data)
+
+        return ids
+
+    def test_merged_order(self):
+        late_step = ProcessStep.objects.create(parent_step=self.step, parent_step_pos=0)
+        ProcessTask.objects.create(
+            name='foo', processstep=late_step, status=celery_states.SUCCESS,
+            time_started=self.now + datetime.timedelta(minutes=10),
+        )
+        pending_step = ProcessStep.objects.create(parent_step=self.step, parent_step_pos=1)
+
+        early = [self.create_task(minutes=i, processstep_pos=i) for i in range(5)]
+        late = [self.create_task(minutes=20 + i, processstep_pos=20 + i) for i in range(3)]
+        pending = [self.create_task(processstep_pos=30 + i) for i in range(4)]
+
+        expected = [str(o.pk) for o in early + [late_step] + late + [pending_step] + pending]
+
+        self.assertEqual(self.get_all(page_size=3), expected)
+        self.assertEqual(self.get_all(page_size=100), expected)
+
+        response = self.get(page_size=3)
+        self.assertEqual(response['Count'], str(len(expected)))
+
+    def test_previous_page(self):
+        tasks = [self.create_task(minutes=i, processstep_pos=i) for i in range(7)]
+
+        first = self.get(page_size=3)
+        second = self.get(get_links(first)['next'])
+        third = self.get(get_links(second)['next'])
+
+        self.assertNotIn('next', get_links(third))
+        self.assertEqual([o['id'] for o in third.data], [str(tasks[6].pk)])
+
+        previous = self.get(get_links(third)['prev'])
+        self.assertEqual(previous.data, second.data)
+
+        previous = self.get(get_links(previous)['prev'])
+        self.assertEqual(previous.data, first.data)
+        self.assertNotIn('prev', get_links(previous))
+
+    def test_hidden(self):
+        visible = self.create_task(minutes=0)
+        hidden = self.create_task(minutes=1, hidden=True)
+
+        self.assertEqual(self.get_all(hidden='false'), [str(visible.pk)])
+        self.assertEqual(self.get_all(hidden='true'), [str(hidden.pk)])
+
+    def test_queries_independent_of_task_count(self):
+        for i in range(3):
+            child = ProcessStep.objects.create(parent_step=self.step, parent_step_pos=i)
+            ProcessTask.objects.create(name='foo', processstep=child)
+
+        for i in range(10):
+            self.create_task(processstep_pos=i)
+
+        cache.clear()
+
+        with CaptureQueriesContext(connection) as few:
+            self.get(page_size=5)
+
+        for i in range(10, 100):
+            self.create_task(processstep_pos=i)
+
+        cache.clear()
+
+        with CaptureQueriesContext(connection) as many:
+            response = self.get(page_size=5)
+
+        self.assertEqual(len(response.data), 5)
+        self.assertEqual(len(few), len(many))
+
+    def test_invalid_cursor(self):
+        response = self.view(self.factory.get('/', {'cursor': 'foo'}), parent_lookup_processstep=str(self.step.pk))
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(ROOT_URLCONF='ESSArch_Core.WorkflowEngine.tests.urls')
+class test_query_counts(TestCase):
+    """
+    The number of queries used by the endpoints must not depend on the
+    number of serialized objects
+    """
+
+    def setUp(self):
+        self.root = ProcessStep.objects.create()
+
+        # the counts include the count query of the pagination
+        for viewset in [ProcessStepViewSet, ProcessTaskViewSet]:
+            patcher = mock.patch.object(viewset, 'pagination_class', LinkHeaderPagination)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        cache.clear()
+
+    def create_steps(self, count):
+        for i in range(count):
+            step = ProcessStep.objects.create(parent_step=self.root, parent_step_pos=i)
+            child = ProcessStep.objects.create(parent_step=step)
+
+            ProcessTask.objects.create(name='foo', processstep=step, status=celery_states.SUCCESS, progress=100)
+            ProcessTask.objects.create(
+                name='foo', processstep=child, status=celery_states.FAILURE,
+                exception='foo', traceback='bar',
+            )
+
+    def get(self, url):
+        cache.clear()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_step_list(self):
+        self.create_steps(2)
+
+        # count, steps, child steps, task data and summaries, all child
+        # steps are on the same page as their parent
+        with self.assertNumQueries(5):
+            self.get('/api/steps/?page_size=100')
+
+        self.create_steps(5)
+
+        with self.assertNumQueries(5):
+            response = self.get('/api/steps/?page_size=100')
+
+        root = [s for s in response.data if s['id'] == str(self.root.pk)][0]
+        self.assertEqual(root['status'], celery_states.FAILURE)
+        self.assertEqual(root['progress'], 50)
+        self.assertFalse(root['undone'])
+
+    def test_child_steps(self):
+        self.create_steps(2)
+
+        with self.assertNumQueries(7):
+            self.get('/api/steps/%s/child-steps/' % self.root.pk)
+
+        self.create_steps(5)
+
+        with self.assertNumQueries(7):
+            self.get('/api/steps/%s/child-steps/' % self.root.pk)
+
+    def test_step_detail(self):
+        self.create_steps(5)
+        step = self.root.child_steps.first()
+
+        # step, 2 levels of child steps, task data, summaries, task counts
+        # and failed tasks
+        with self.assertNumQueries(7):
+            response = self.get('/api/steps/%s/' % step.pk)
+
+        self.assertEqual(response.data['task_count'], 1)
+        self.assertEqual(response.data['failed_task_count'], 0)
+        self.assertEqual(response.data['status'], celery_states.FAILURE)
+        self.assertIsNone(response.data['exception'])
+
+    def test_task_list(self):
+        self.create_steps(2)
+
+        with self.assertNumQueries(2):
+            self.get('/api/tasks/')
+
+        self.create_steps(5)
+
+        with self.assertNumQueries(2):
+            self.get('/api/tasks/')
+
+    def test_task_detail(self):
+        self.create_steps(1)
+        task = ProcessTask.objects.first()
+
+        with self.assertNumQueries(1):
+            self.get('/api/tasks/%s/' % task.pk)
@@ -1,11 +1,367 @@
-from celery import states as celery_states
-from celery.result import AsyncResult
+import copy
+import threading
+import uuid
 
-from ESSArch_Core.WorkflowEngine.models import ProcessTask
+from collections import OrderedDict
+
+from celery import current_app, states as celery_states
+from celery.backends.base import KeyValueStoreBackend
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, Count, IntegerField, Min, Sum, When
+
+from ESSArch_Core.util import chunks
+from ESSArch_Core.WorkflowEngine.models import ArchivedProcessTask, ProcessStep, ProcessTask
+
+# the number of steps to include in each query when calculating step states,
+# low enough to stay within the limits of query parameters of all databases
+STEP_STATE_BATCH_SIZE = 500
+
+
+class ResultCache(object):
+    """
+    A thread safe LRU cache of results of successful tasks, the result of a
+    successful task never changes so entries never have to be invalidated
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_many(self, keys):
+        found = {}
+
+        with self.lock:
+            for key in keys:
+                try:
+                    value = self.data.pop(key)
+                except KeyError:
+                    continue
+
+                self.data[key] = value
+                found[key] = value
+
+        # the results are handed to tasks that might modify them
+        return copy.deepcopy(found)
+
+    def set_many(self, values):
+        if self.size <= 0:
+            return
+
+        values = copy.deepcopy(values)
+
+        with self.lock:
+            for key, value in values.iteritems():
+                self.data.pop(key, None)
+                self.data[key] = value
+
+            while len(self.data) > self.size:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+result_cache = ResultCache(getattr(settings, 'WORKFLOW_RESULT_CACHE_SIZE', 256))
+
+
+def normalize_pk(pk):
+    """
+    Returns the canonical string form of the primary key of a task, which
+    results are keyed by, e.g. a UUID or its hex or URN form all give the
+    same key
+    """
+
+    try:
+        return str(uuid.UUID(str(pk)))
+    except ValueError:
+        return str(pk)
+
+
+def _get_results_from_backend(pks):
+    backend = current_app.backend
+
+    if not isinstance(backend, KeyValueStoreBackend):
+        return {}
+
+    keys = [backend.get_key_for_task(pk) for pk in pks]
+
+    try:
+        values = backend.mget(keys)
+    except NotImplementedError:
+        return {}
+
+    if hasattr(values, 'items'):
+        values = [values.get(k) for k in keys]
+
+    results = {}
+    for pk, value in zip(pks, values):
+        if value is None:
+            continue
+
+        meta = backend.decode_result(value)
+        if meta['status'] == celery_states.SUCCESS:
+            results[pk] = meta['result']
+
+    return results
+
+
+def _get_results_from_db(pks):
+    results = dict((normalize_pk(pk), result) for pk, result in ProcessTask.objects.filter(
+        pk__in=pks, status=celery_states.SUCCESS,
+    ).values_list('pk', 'result'))
+
+    archived = [pk for pk in pks if pk not in results]
+    if archived:
+        results.update((normalize_pk(pk), data['result']) for pk, data in ArchivedProcessTask.objects.filter(
+            pk__in=archived, status=celery_states.SUCCESS,
+        ).values_list('pk', 'data'))
+
+    return results
+
+
+def get_results(pks, eager=False):
+    """
+    Gets the results of multiple successful tasks using at most one lookup
+    in the result backend and one query in the database
+
+    Args:
+        pks: The primary keys of the tasks
+        eager: If true, the result backend is not used
+
+    Returns:
+        A dict with the results of all the successful tasks keyed by
+        normalize_pk, tasks that aren't found or haven't succeeded are not
+        included
+    """
+
+    pks = set(normalize_pk(pk) for pk in pks)
+    results = result_cache.get_many(pks)
+    missing = [pk for pk in pks if pk not in results]
+    found = {}
+
+    if missing and not eager:
+        found.update(_get_results_from_backend(missing))
+        missing = [pk for pk in missing if pk not in found]
+
+    if missing:
+        found.update(_get_results_from_db(missing))
+
+    result_cache.set_many(found)
+    results.update(found)
+
+    return results
 
 
 def get_result(pk, eager=False):
-    if not eager and AsyncResult(str(pk)).successful():
-        return AsyncResult(str(pk)).result
-    else:
-        return ProcessTask.objects.values_list('result', flat=True).get(pk=pk, status=celery_states.SUCCESS)
+    try:
+        return get_results([pk], eager)[normalize_pk(pk)]
+    except KeyError:
+        raise ProcessTask.DoesNotExist()
+
+
+def _count(**conditions):
+    return Sum(Case(When(then=1, **conditions), default=0, output_field=IntegerField()))
+
+
+def _get_cached_step_states(pks):
+    keys = []
+    for pk in pks:
+        keys.extend(['%s_status' % pk, '%s_progress' % pk, '%s_undone' % pk])
+
+    cached = cache.get_many(keys)
+    states = {}
+
+    for pk in pks:
+        status = cached.get('%s_status' % pk)
+        progress = cached.get('%s_progress' % pk)
+        undone = cached.get('%s_undone' % pk)
+
+        if status and progress is not None and undone is not None:
+            states[pk] = {'status': status, 'progress': progress, 'undone': undone}
+
+    return states
+
+
+def _get_task_data(pks):
+    task_data = {}
+
+    for batch in chunks(pks, STEP_STATE_BATCH_SIZE):
+        for row in ProcessTask.objects.filter(
+            processstep__in=batch, undo_type=False, retried__isnull=True
+        ).values('processstep').annotate(
+            count=Count('id'),
+            progress=Sum(Case(When(undone__isnull=False, then=0), default='progress')),
+            active=_count(undone__isnull=True),
+            failed=_count(undone__isnull=True, status=celery_states.FAILURE),
+            pending=_count(undone__isnull=True, status=celery_states.PENDING),
+            started=_count(undone__isnull=True, status=celery_states.STARTED),
+            undone_count=_count(undone__isnull=False),
+        ).order_by():
+            task_data[row['processstep']] = row
+
+    return task_data
+
+
+def _get_summaries(pks):
+    summaries = {}
+
+    for batch in chunks(pks, STEP_STATE_BATCH_SIZE):
+        for row in ProcessStep.objects.filter(pk__in=batch, summary__isnull=False).values(
+            'pk', 'summary__task_count', 'summary__task_progress', 'summary__failed',
+            'summary__undone',
+        ).order_by():
+            summaries[row['pk']] = row
+
+    return summaries
+
+
+def _get_step_status(children, tasks, summary):
+    if summary is not None and summary['summary__failed']:
+        return celery_states.FAILURE
+
+    if not children and not tasks['active']:
+        return celery_states.SUCCESS
+
+    if tasks['failed'] or celery_states.FAILURE in children:
+        return celery_states.FAILURE
+
+    if tasks['started'] or celery_states.STARTED in children:
+        return celery_states.STARTED
+
+    if tasks['pending'] or celery_states.PENDING in children:
+        return celery_states.PENDING
+
+    return celery_states.SUCCESS
+
+
+def _get_step_progress(children, tasks, summary):
+    total = len(children) + tasks['count']
+    progress = sum(children) + (tasks['progress'] or 0)
+
+    if summary is not None:
+        total += summary['summary__task_count']
+        progress += summary['summary__task_progress']
+
+    if total == 0:
+        return 100
+
+    return progress / total
+
+
+def _get_step_undone(children, tasks, summary):
+    return any(children) or tasks['undone_count'] > 0 or (summary is not None and summary['summary__undone'])
+
+
+def get_step_states(pks):
+    """
+    Gets the status, progress and undone state of multiple steps in bulk.
+    The result is the same as reading the status, progress and undone
+    properties of each step but only a fixed number of queries are used for
+    each level of child steps.
+
+    States found in the cache are used as is, calculated states are added to
+    the cache.
+
+    Args:
+        pks: The primary keys of the steps
+
+    Returns:
+        A dict with the status, progress and undone state of each step
+    """
+
+    pks = [pk if isinstance(pk, uuid.UUID) else uuid.UUID(str(pk)) for pk in pks]
+    states = _get_cached_step_states(pks)
+    children = {}
+    missing = []
+    current = list(set(pk for pk in pks if pk not in states))
+    missing_set = set(current)
+
+    while current:
+        missing.extend(current)
+        child_steps = []
+
+        for batch in chunks(current, STEP_STATE_BATCH_SIZE):
+            child_steps.extend(ProcessStep.objects.filter(parent_step__in=batch).values_list('parent_step', 'pk').order_by())
+
+        for parent, pk in child_steps:
+            children.setdefault(parent, []).append(pk)
+
+        child_pks = [pk for parent, pk in child_steps if pk not in states and pk not in missing_set]
+        states.update(_get_cached_step_states(child_pks))
+        current = [pk for pk in child_pks if pk not in states]
+        missing_set.update(current)
+
+    task_data = _get_task_data(missing)
+    summaries = _get_summaries(missing)
+    empty = {'count': 0, 'progress': 0, 'active': 0, 'failed': 0, 'pending': 0, 'started': 0, 'undone_count': 0}
+    calculated = {}
+
+    def calculate(pk):
+        # child steps must be calculated before their parents
+        if pk in states:
+            return states[pk]
+
+        child_states = [calculate(c) for c in children.get(pk, [])]
+        tasks = task_data.get(pk, empty)
+        summary = summaries.get(pk)
+
+        states[pk] = {
+            'status': _get_step_status([c['status'] for c in child_states], tasks, summary),
+            'progress': _get_step_progress([c['progress'] for c in child_states], tasks, summary),
+            'undone': _get_step_undone([c['undone'] for c in child_states], tasks, summary),
+        }
+
+        for field, value in states[pk].iteritems():
+            calculated['%s_%s' % (pk, field)] = value
+        return states[pk]
+
+    for pk in missing:
+        calculate(pk)
+
+    if calculated:
+        cache.set_many(calculated)
+
+    return dict((pk, states[pk]) for pk in pks)
+
+
+def get_step_details(pks):
+    """
+    Gets the number of tasks, the number of failed tasks and the exception
+    and traceback of the first failed task of multiple steps using three
+    queries
+
+    Args:
+        pks: The primary keys of the steps
+
+    Returns:
+        A dict with the details of each step
+    """
+
+    pks = [pk if isinstance(pk, uuid.UUID) else uuid.UUID(str(pk)) for pk in pks]
+    details = dict((pk, {
+        'task_count': 0, 'failed_task_count': 0, 'exception': None, 'traceback': None,
+    }) for pk in pks)
+
+    failed = dict(processstep__in=pks, status=celery_states.FAILURE, undone__isnull=True)
+
+    for row in ProcessTask.objects.filter(processstep__in=pks).values('processstep').annotate(
+        task_count=Count('id'),
+        failed_task_count=_count(status=celery_states.FAILURE, undone__isnull=True),
+    ).order_by():
+        details[row['processstep']]['task_count'] = row['task_count']
+        details[row['processstep']]['failed_task_count'] = row['failed_task_count']
+
+    first_failed = ProcessTask.objects.filter(**failed).values('processstep').annotate(
+        first=Min('pk'),
+    ).order_by().values_list('first', flat=True)
+
+    if first_failed:
+        for row in ProcessTask.objects.filter(pk__in=list(first_failed)).values('processstep', 'exception', 'traceback'):
+            details[row['processstep']]['exception'] = row['exception']
+            details[row['processstep']]['traceback'] = row['traceback']
+
+    return details
@@ -22,14 +22,16 @@
     Email - essarch@essolutions.se
 """
 
-import datetime
-import itertools
-import pytz
+from django.db.models import Min
+from django.db.models.functions import Coalesce
+from django.http import StreamingHttpResponse
 
 from django_filters.rest_framework import DjangoFilterBackend
 
 from rest_framework.decorators import detail_route
+from rest_framework.exceptions import ParseError
 from rest_framework.generics import GenericAPIView
+from rest_framework.renderers import BaseRenderer
 from rest_framework.response import Response
 
 from rest_framework_extensions.mixins import NestedViewSetMixin
@@ -40,6 +42,12 @@ from ESSArch_Core.WorkflowEngine.models import (
     ProcessTask,
 )
 
+from ESSArch_Core.WorkflowEngine.pagination import (
+    MergedCursorPagination,
+    Source,
+    annotate_sort_key,
+)
+
 from ESSArch_Core.WorkflowEngine.permissions import (
     CanUndo,
     CanRetry,
@@ -53,11 +61,21 @@ from ESSArch_Core.WorkflowEngine.serializers import (
     ProcessTaskDetailSerializer,
 )
 
+from ESSArch_Core.WorkflowEngine.stream import (
+    get_step_subtree,
+    get_timeout,
+    stream_changes,
+    wait_for_changes,
+)
+
+from ESSArch_Core.WorkflowEngine.util import get_step_states
+
 from rest_framework import viewsets
 
 
 class ProcessViewSet(GenericAPIView, viewsets.ViewSet):
     queryset = ProcessStep.objects.none()
+    pagination_class = MergedCursorPagination
 
     def list(self, request, parent_lookup_processstep):
         hidden = request.query_params.get('hidden')
@@ -69,8 +87,16 @@ class ProcessViewSet(GenericAPIView, viewsets.ViewSet):
             hidden = False
 
         step = ProcessStep.objects.get(pk=parent_lookup_processstep)
-        child_steps = step.child_steps.all()
-        tasks = step.tasks.all().select_related('responsible')
+        child_steps = annotate_sort_key(
+            step.child_steps.all(),
+            Coalesce(Min('tasks__time_started'), 'summary__time_started'),
+        )
+        tasks = annotate_sort_key(
+            step.tasks.select_related('responsible').defer(
+                'args', 'params', 'result_params', 'result', 'meta', 'log',
+            ),
+            'time_started',
+        )
 
         if hidden is True:
             child_steps = child_steps.filter(hidden=True)
@@ -79,24 +105,98 @@ class ProcessViewSet(GenericAPIView, viewsets.ViewSet):
             child_steps = child_steps.filter(hidden=False)
             tasks = tasks.filter(hidden=False)
 
+        # child steps are placed before tasks started at the same time
+        sources = [
+            Source(child_steps, 0, 'parent_step_pos'),
+            Source(tasks, 1, 'processstep_pos'),
+        ]
 
-        queryset = sorted(
-            itertools.chain(child_steps, tasks),
-            key=lambda instance: instance.time_started or
-            datetime.datetime(datetime.MAXYEAR, 1, 1, 1, 1, 1, 1, pytz.UTC)
-        )
+        page = self.paginate_queryset(sources)
+        objs = page
 
-        page = self.paginate_queryset(queryset)
+        if page is None:
+            objs = sorted(
+                (source.get_key(obj), obj) for source in sources for obj in source.fetch(None, None)
+            )
+            objs = [obj for key, obj in objs]
+
+        step_states = get_step_states([obj.pk for obj in objs if isinstance(obj, ProcessStep)])
+        context = {'request': request, 'step_states': step_states}
+        serializers = ProcessStepChildrenSerializer(objs, many=True, context=context)
 
         if page is not None:
-            serializers = ProcessStepChildrenSerializer(page, many=True, context={'request': request})
             return self.get_paginated_response(serializers.data)
 
-        serializers = ProcessStepChildrenSerializer(queryset, many=True, context={'request': request})
         return Response(serializers.data)
 
 
-class ProcessStepViewSet(viewsets.ModelViewSet):
+class EventStreamRenderer(BaseRenderer):
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
+
+
+class StateChangeMixin(object):
+    """
+    Adds endpoints for following the state changes of the tasks belonging
+    to an object, either by long-polling (changes) or as Server-Sent Events
+    (changes-stream).
+
+    Clients resume by passing the token of the last received change as the
+    "since" parameter, or in the Last-Event-ID header.
+    """
+
+    def get_state_change_scope(self, obj):
+        """
+        Returns a dict with the steps and information packages (ips) to
+        follow the changes of
+        """
+
+        raise NotImplementedError()
+
+    def get_since(self, request):
+        since = request.query_params.get('since', request.META.get('HTTP_LAST_EVENT_ID', 0))
+
+        try:
+            return int(since)
+        except (TypeError, ValueError):
+            raise ParseError('Invalid token: %s' % since)
+
+    @detail_route(methods=['get'])
+    def changes(self, request, pk=None):
+        obj = self.get_object()
+        since = self.get_since(request)
+
+        try:
+            timeout = min(float(request.query_params.get('timeout', get_timeout())), get_timeout())
+        except ValueError:
+            raise ParseError('Invalid timeout')
+
+        changes = wait_for_changes(since, timeout, **self.get_state_change_scope(obj))
+
+        if changes:
+            since = changes[-1]['token']
+
+        return Response({'token': since, 'changes': changes})
+
+    @detail_route(methods=['get'], url_path='changes-stream', renderer_classes=[EventStreamRenderer])
+    def changes_stream(self, request, pk=None):
+        obj = self.get_object()
+        since = self.get_since(request)
+
+        response = StreamingHttpResponse(
+            stream_changes(since, lambda: self.get_state_change_scope(obj)),
+            content_type='text/event-stream',
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class ProcessStepViewSet(StateChangeMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows steps to be viewed or edited.
     """
@@ -111,6 +211,9 @@ class ProcessStepViewSet(viewsets.ModelViewSet):
 
         return ProcessStepDetailSerializer
 
+    def get_state_change_scope(self, obj):
+        return {'steps': get_step_subtree(obj.pk)}
+
     @detail_route(methods=['get'], url_path='child-steps')
     def child_steps(self, request, pk=None):
         step = self.get_object()
@@ -157,6 +260,18 @@ class ProcessTaskViewSet(NestedViewSetMixin, viewsets.ModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filter_class = ProcessTaskFilter
 
+    def get_queryset(self):
+        queryset = super(ProcessTaskViewSet, self).get_queryset()
+
+        if self.action == 'list':
+            # the serialized values are not included when listing tasks,
+            # don't fetch and decode them
+            queryset = queryset.defer(
+                'args', 'params', 'result_params', 'result', 'meta', 'log',
+            )
+
+        return queryset
+
     def get_serializer_class(self):
         if self.action == 'list':
             return ProcessTaskSerializer
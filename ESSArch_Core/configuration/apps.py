@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class ConfigurationConfig(AppConfig):
+    name = 'ESSArch_Core.configuration'
+    label = 'configuration'
+
+    def ready(self):
+        import ESSArch_Core.configuration.signals  # noqa
@@ -0,0 +1,224 @@
+"""
+    ESSArch is an open source archiving and digital preservation system
+
+    ESSArch Core
+    Copyright (C) 2005-2017 ES Solutions AB
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+    Contact information:
+    Web - http://www.essolutions.se
+    Email - essarch@essolutions.se
+"""
+
+from __future__ import absolute_import
+
+import collections
+import copy
+import os
+import threading
+import uuid
+
+from django.core.cache import cache
+
+from ESSArch_Core.configuration.models import ArchivePolicy, Parameter, Path
+
+VERSION_KEY = 'configuration_version'
+MIMETYPES_ENTITY = 'path_mimetypes_definitionfile'
+
+
+def get_version():
+    """
+    Gets the shared version of the configuration, it is changed whenever a
+    path, parameter or archive policy is saved or deleted in any process
+    """
+
+    version = cache.get(VERSION_KEY)
+
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+
+    return version
+
+
+def invalidate():
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+
+
+class MimeTypeRegistry(collections.Mapping):
+    """
+    An immutable mapping from file extensions (including the leading dot)
+    to mimetypes, read from a file in the format of mime.types
+    """
+
+    def __init__(self, types=None):
+        self._types = dict(types or {})
+
+    @classmethod
+    def from_file(cls, path):
+        types = {}
+
+        if not os.path.isfile(path):
+            return cls(types)
+
+        with open(path) as f:
+            for line in f:
+                words = line.split('#', 1)[0].split()
+
+                if not words:
+                    continue
+
+                for suffix in words[1:]:
+                    types['.' + suffix] = words[0]
+
+        return cls(types)
+
+    def __getitem__(self, key):
+        return self._types[key]
+
+    def __iter__(self):
+        return iter(self._types)
+
+    def __len__(self):
+        return len(self._types)
+
+    def guess_type(self, fname):
+        return self.get(os.path.splitext(fname)[1])
+
+
+class ConfigurationCache(object):
+    """
+    A process wide cache of the configuration. Each section is loaded once
+    and then used until the shared version of the configuration changes.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sections = {}
+        self.mimetypes = (None, None)
+
+    def get_section(self, name, loader):
+        version = get_version()
+
+        with self.lock:
+            cached_version, data = self.sections.get(name, (None, None))
+
+        if cached_version == version:
+            return data
+
+        data = loader()
+
+        with self.lock:
+            self.sections[name] = (version, data)
+
+        return data
+
+    def get_mimetypes(self, path):
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            mtime = None
+
+        with self.lock:
+            key, registry = self.mimetypes
+
+        if key == (path, mtime):
+            return registry
+
+        registry = MimeTypeRegistry.from_file(path)
+
+        with self.lock:
+            self.mimetypes = ((path, mtime), registry)
+
+        return registry
+
+    def clear(self):
+        with self.lock:
+            self.sections = {}
+            self.mimetypes = (None, None)
+
+
+config_cache = ConfigurationCache()
+
+
+def _load_paths():
+    return dict(Path.objects.values_list('entity', 'value'))
+
+
+def _load_parameters():
+    return dict(Parameter.objects.values_list('entity', 'value'))
+
+
+def _load_archive_policies():
+    policies = ArchivePolicy.objects.select_related('cache_storage', 'ingest_path')
+    return dict((str(p.pk), p) for p in policies)
+
+
+def get_path(entity):
+    """
+    Gets the value of the path with the given entity
+
+    Raises:
+        Path.DoesNotExist: If there is no path with the given entity
+    """
+
+    try:
+        return config_cache.get_section('paths', _load_paths)[entity]
+    except KeyError:
+        raise Path.DoesNotExist('Path matching query does not exist.')
+
+
+def get_parameter(entity):
+    """
+    Gets the value of the parameter with the given entity
+
+    Raises:
+        Parameter.DoesNotExist: If there is no parameter with the given entity
+    """
+
+    try:
+        return config_cache.get_section('parameters', _load_parameters)[entity]
+    except KeyError:
+        raise Parameter.DoesNotExist('Parameter matching query does not exist.')
+
+
+def get_archive_policy(pk):
+    """
+    Gets a copy of the archive policy with the given primary key
+
+    Raises:
+        ArchivePolicy.DoesNotExist: If there is no such archive policy
+    """
+
+    try:
+        policy = config_cache.get_section('archive_policies', _load_archive_policies)[str(pk)]
+    except KeyError:
+        raise ArchivePolicy.DoesNotExist('ArchivePolicy matching query does not exist.')
+
+    return copy.copy(policy)
+
+
+def get_mimetypes():
+    """
+    Gets the mimetypes of the definition file at the
+    path_mimetypes_definitionfile path. The file is only read again when the
+    path or the file is changed.
+
+    Raises:
+        Path.DoesNotExist: If the path_mimetypes_definitionfile path
+            doesn't exist
+    """
+
+    return config_cache.get_mimetypes(get_path(MIMETYPES_ENTITY))
@@ -0,0 +1,19 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from ESSArch_Core.configuration.cache import invalidate
+from ESSArch_Core.configuration.models import ArchivePolicy, Parameter, Path
+
+
+@receiver(post_save, sender=ArchivePolicy)
+@receiver(post_save, sender=Parameter)
+@receiver(post_save, sender=Path)
+def configuration_post_save(sender, instance, created, **kwargs):
+    invalidate()
+
+
+@receiver(post_delete, sender=ArchivePolicy)
+@receiver(post_delete, sender=Parameter)
+@receiver(post_delete, sender=Path)
+def configuration_post_delete(sender, instance, **kwargs):
+    invalidate()
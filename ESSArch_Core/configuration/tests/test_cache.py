@@ -0,0 +1,145 @@
+"""
+    ESSArch is an open source archiving and digital preservation system
+
+    ESSArch Core
+    Copyright (C) 2005-2017 ES Solutions AB
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+    Contact information:
+    Web - http://www.essolutions.se
+    Email - essarch@essolutions.se
+"""
+
+import os
+import shutil
+import tempfile
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from ESSArch_Core.configuration.cache import (
+    VERSION_KEY,
+    MimeTypeRegistry,
+    config_cache,
+    get_archive_policy,
+    get_mimetypes,
+    get_parameter,
+    get_path,
+)
+from ESSArch_Core.configuration.models import ArchivePolicy, Parameter, Path
+
+
+class ConfigurationCacheTestCase(TestCase):
+    def setUp(self):
+        config_cache.clear()
+        self.path = Path.objects.create(entity='label', value='/label')
+
+    def test_get_path(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(get_path('label'), '/label')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_path('label'), '/label')
+
+    def test_get_missing_path(self):
+        with self.assertRaises(Path.DoesNotExist):
+            get_path('missing')
+
+    def test_get_parameter(self):
+        Parameter.objects.create(entity='site_name', value='ESSArch')
+        self.assertEqual(get_parameter('site_name'), 'ESSArch')
+
+        with self.assertRaises(Parameter.DoesNotExist):
+            get_parameter('missing')
+
+    def test_get_archive_policy(self):
+        policy = ArchivePolicy.objects.create(
+            policy_id='1', cache_storage=self.path, ingest_path=self.path,
+        )
+
+        cached = get_archive_policy(policy.pk)
+        self.assertEqual(cached.policy_id, '1')
+
+        cached.policy_id = '2'
+        self.assertEqual(get_archive_policy(policy.pk).policy_id, '1')
+
+    def test_invalidated_on_save(self):
+        get_path('label')
+
+        self.path.value = '/new_label'
+        self.path.save()
+
+        self.assertEqual(get_path('label'), '/new_label')
+
+    def test_invalidated_on_delete(self):
+        get_path('label')
+        self.path.delete()
+
+        with self.assertRaises(Path.DoesNotExist):
+            get_path('label')
+
+    def test_invalidated_by_other_process(self):
+        get_path('label')
+
+        # another process saving the path changes the shared version
+        Path.objects.filter(pk=self.path.pk).update(value='/new_label')
+        cache.set(VERSION_KEY, 'other', None)
+
+        self.assertEqual(get_path('label'), '/new_label')
+
+
+class MimeTypeRegistryTestCase(TestCase):
+    def setUp(self):
+        config_cache.clear()
+        self.datadir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.datadir)
+
+        self.definitionfile = os.path.join(self.datadir, 'mime.types')
+        with open(self.definitionfile, 'w') as f:
+            f.write('# comment\n')
+            f.write('text/plain\t\ttxt text # inline comment\n')
+            f.write('application/pdf\tpdf\n')
+
+        Path.objects.create(entity='path_mimetypes_definitionfile', value=self.definitionfile)
+
+    def test_read(self):
+        mtypes = get_mimetypes()
+
+        self.assertEqual(dict(mtypes), {
+            '.txt': 'text/plain', '.text': 'text/plain', '.pdf': 'application/pdf',
+        })
+        self.assertEqual(mtypes.guess_type('foo.pdf'), 'application/pdf')
+        self.assertIsNone(mtypes.guess_type('foo.xml'))
+
+    def test_immutable(self):
+        with self.assertRaises(TypeError):
+            get_mimetypes()['.xml'] = 'text/xml'
+
+    def test_read_once(self):
+        self.assertIs(get_mimetypes(), get_mimetypes())
+
+    def test_file_changed(self):
+        get_mimetypes()
+
+        with open(self.definitionfile, 'a') as f:
+            f.write('text/xml\txml\n')
+
+        mtime = os.path.getmtime(self.definitionfile) + 10
+        os.utime(self.definitionfile, (mtime, mtime))
+
+        self.assertEqual(get_mimetypes()['.xml'], 'text/xml')
+
+    def test_missing_file(self):
+        self.assertEqual(len(MimeTypeRegistry.from_file(os.path.join(self.datadir, 'missing'))), 0)
@@ -25,7 +25,6 @@
 import os
 import re
 import uuid
-import mimetypes
 
 from celery import states as celery_states
 from celery.result import allow_join_result
@@ -39,9 +38,7 @@ from django.utils import timezone
 
 from scandir import walk
 
-from ESSArch_Core.configuration.models import (
-    Path,
-)
+from ESSArch_Core.configuration.cache import get_mimetypes
 
 from ESSArch_Core.exceptions import (
     FileFormatNotAllowed
@@ -320,15 +317,7 @@ class XMLGenerator(object):
     def generate(self, folderToParse=None, algorithm='SHA-256'):
         files = []
 
-        mimetypes.suffix_map = {}
-        mimetypes.encodings_map = {}
-        mimetypes.types_map = {}
-        mimetypes.common_types = {}
-        mimetypes_file = Path.objects.get(
-            entity="path_mimetypes_definitionfile"
-        ).value
-        mimetypes.init(files=[mimetypes_file])
-        mtypes = mimetypes.types_map
+        mtypes = get_mimetypes()
 
         responsible = None
 
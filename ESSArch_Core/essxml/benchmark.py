@@ -0,0 +1,120 @@
+"""
+    ESSArch is an open source archiving and digital preservation system
+
+    ESSArch Core
+    Copyright (C) 2005-2017 ES Solutions AB
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+    Contact information:
+    Web - http://www.essolutions.se
+    Email - essarch@essolutions.se
+"""
+
+# Micro-benchmark of the reading of file elements in METS documents.
+#
+# Usage:
+#     python -m ESSArch_Core.essxml.benchmark [number of files]
+
+from __future__ import absolute_import, print_function
+
+import os
+import re
+import sys
+import tempfile
+import time
+
+from lxml import etree
+
+from ESSArch_Core.essxml.util import FILE_ELEMENTS, find_files
+from ESSArch_Core.util import get_value_from_path
+
+METS_NS = 'http://www.loc.gov/METS/'
+XLINK_NS = 'http://www.w3.org/1999/xlink'
+
+
+def uncompiled_value_from_path(el, path):
+    # the original implementation of get_value_from_path, building a new
+    # XPath expression on each call
+    def get_elements(root, path):
+        return root.xpath(".//" + "/".join(["*[local-name()='%s']" % e for e in path.split("/")]))
+
+    if "@" in path:
+        nested, attr = path.split('@')
+        try:
+            el = get_elements(el, nested)[0]
+        except IndexError:
+            pass
+
+        for a, val in el.attrib.iteritems():
+            if re.sub(r'{.*}', '', a) == attr:
+                return val
+    else:
+        try:
+            el = get_elements(el, path)[0]
+        except IndexError:
+            pass
+
+        return el.text
+
+
+def write_mets(path, count):
+    with etree.xmlfile(path, encoding='UTF-8') as xf:
+        xf.write_declaration()
+        with xf.element('{%s}mets' % METS_NS, nsmap={'mets': METS_NS, 'xlink': XLINK_NS}):
+            with xf.element('{%s}fileSec' % METS_NS):
+                with xf.element('{%s}fileGrp' % METS_NS):
+                    for i in range(count):
+                        f = etree.Element('{%s}file' % METS_NS, ID='ID%d' % i, CHECKSUM='%032x' % i,
+                                          CHECKSUMTYPE='MD5', FILEFORMATNAME='Plain Text')
+                        etree.SubElement(f, '{%s}FLocat' % METS_NS, {
+                            '{%s}href' % XLINK_NS: 'file:///content/%d.txt' % i,
+                            'LOCTYPE': 'URL',
+                        })
+                        xf.write(f)
+
+
+def timed(name, func, *args):
+    start = time.time()
+    result = func(*args)
+    print('%-30s %8.3fs' % (name, time.time() - start))
+    return result
+
+
+def read_values(elements, getter):
+    props = FILE_ELEMENTS['file']
+    paths = [props['path'], props['checksum'], props['checksumtype'], props['format']]
+    return [[getter(el, path) for path in paths] for el in elements]
+
+
+def main(count):
+    fd, path = tempfile.mkstemp(suffix='.xml')
+    os.close(fd)
+
+    try:
+        timed('write %d files' % count, write_mets, path, count)
+        elements = etree.parse(path).getroot().xpath(".//*[local-name()='file']")
+
+        expected = timed('uncompiled accessors', read_values, elements, uncompiled_value_from_path)
+        actual = timed('compiled accessors', read_values, elements, get_value_from_path)
+        assert expected == actual
+
+        found = timed('find_files', find_files, path)
+        assert len(found) == count
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
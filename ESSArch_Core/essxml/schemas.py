@@ -0,0 +1,812 @@
+"""
+    ESSArch is an open source archiving and digital preservation system
+
+    ESSArch Core
+    Copyright (C) 2005-2017 ES Solutions AB
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+    Contact information:
+    Web - http://www.essolutions.se
+    Email - essarch@essolutions.se
+"""
+
+from __future__ import absolute_import
+
+import errno
+import hashlib
+import json
+import logging
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+import urllib
+import urlparse
+
+from collections import OrderedDict
+
+import requests
+
+from django.conf import settings
+from django.core.cache import cache
+
+from lxml import etree
+
+from ESSArch_Core.exceptions import SchemaNotAvailable
+
+XSD_NAMESPACE = "http://www.w3.org/2001/XMLSchema"
+CATALOG_NAMESPACE = "urn:oasis:names:tc:entity:xmlns:xml:catalog"
+VALIDATION_PURPOSE = "http://www.rddl.org/purposes#schema-validation"
+
+CATALOG_FILENAME = 'catalog.xml'
+LOCATIONS_FILENAME = 'locations.json'
+CATALOG_LOCK_KEY = 'xml_schema_catalog_lock'
+STORE_LOCK_KEY = 'xml_schema_store_lock_%s'
+
+logger = logging.getLogger('code.exceptions')
+
+
+def get_catalog_dir():
+    return getattr(settings, 'XML_SCHEMA_CATALOG', None)
+
+
+def get_cache_size():
+    return getattr(settings, 'XML_SCHEMA_CACHE_SIZE', 32)
+
+
+def get_store_dir():
+    return getattr(settings, 'XML_SCHEMA_STORE', None)
+
+
+def get_store_max_age():
+    return getattr(settings, 'XML_SCHEMA_STORE_MAX_AGE', 24 * 60 * 60)
+
+
+def is_offline():
+    return getattr(settings, 'XML_SCHEMA_OFFLINE', False)
+
+
+def is_remote(url):
+    return url.startswith(('http://', 'https://'))
+
+
+def get_schema_references(content):
+    """
+    Gets the target namespace of the schema and the locations of the
+    schemas it imports or includes
+    """
+
+    root = etree.fromstring(content)
+    locations = root.xpath(
+        './xsd:import/@schemaLocation | ./xsd:include/@schemaLocation | ./xsd:redefine/@schemaLocation',
+        namespaces={'xsd': XSD_NAMESPACE}
+    )
+
+    return root.get('targetNamespace'), locations
+
+
+class SchemaCatalog(object):
+    """
+    An XML catalog of schemas stored in a local directory. The catalog maps
+    the original locations of the schemas, and their target namespaces, to
+    the local copies using uri entries of an OASIS XML catalog.
+
+    The catalog is shared by all processes using the same directory, entries
+    added by other processes are found once the catalog file has changed.
+    The catalog also keeps the sets of locations that import schemas have
+    been compiled from, see warm_up.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, CATALOG_FILENAME)
+        self.locations_path = os.path.join(directory, LOCATIONS_FILENAME)
+        self.lock = threading.Lock()
+        self.uris = {}
+        self.namespaces = {}
+        self.mtime = None
+
+    def _get_mtime(self):
+        try:
+            return os.path.getmtime(self.path)
+        except OSError:
+            return None
+
+    def _read(self):
+        uris = {}
+        namespaces = {}
+
+        if os.path.isfile(self.path):
+            for entry in etree.parse(self.path).iterfind('{%s}uri' % CATALOG_NAMESPACE):
+                if entry.get('nature') == XSD_NAMESPACE:
+                    namespaces[entry.get('name')] = entry.get('uri')
+                else:
+                    uris[entry.get('name')] = entry.get('uri')
+
+        return uris, namespaces
+
+    def _write(self, uris, namespaces):
+        root = etree.Element('{%s}catalog' % CATALOG_NAMESPACE, nsmap={None: CATALOG_NAMESPACE})
+
+        for name, uri in sorted(uris.items()):
+            etree.SubElement(root, '{%s}uri' % CATALOG_NAMESPACE, name=name, uri=uri)
+
+        for name, uri in sorted(namespaces.items()):
+            etree.SubElement(
+                root, '{%s}uri' % CATALOG_NAMESPACE, name=name, uri=uri,
+                nature=XSD_NAMESPACE, purpose=VALIDATION_PURPOSE,
+            )
+
+        fd, tmp = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'w') as f:
+            etree.ElementTree(root).write(f, xml_declaration=True, encoding='UTF-8', pretty_print=True)
+
+        os.rename(tmp, self.path)
+
+    def load(self):
+        mtime = self._get_mtime()
+
+        with self.lock:
+            if mtime is not None and mtime == self.mtime:
+                return
+
+            self.uris, self.namespaces = self._read()
+            self.mtime = mtime
+
+    def resolve(self, url):
+        """
+        Gets the path of the local copy of the schema at the given location,
+        or None if it isn't in the catalog
+        """
+
+        self.load()
+        filename = self.uris.get(url)
+
+        if filename is None:
+            return None
+
+        return os.path.join(self.directory, filename)
+
+    def get_location(self, namespace):
+        """
+        Gets a location in the catalog of the schema with the given target
+        namespace, or None if there is no such schema
+        """
+
+        self.load()
+        filename = self.namespaces.get(namespace)
+
+        for url, f in sorted(self.uris.items()):
+            if f == filename:
+                return url
+
+        return None
+
+    def get_locations(self):
+        """
+        Gets the locations and target namespaces of all schemas in the catalog
+        """
+
+        self.load()
+        namespaces = dict((f, ns) for ns, f in self.namespaces.items())
+        return [(namespaces.get(f), url) for url, f in sorted(self.uris.items())]
+
+    def get_location_sets(self):
+        """
+        Gets the sets of (namespace, location) pairs that import schemas have
+        been compiled from, the most recently added set last
+        """
+
+        try:
+            with open(self.locations_path) as f:
+                return [frozenset(tuple(pair) for pair in pairs) for pairs in json.load(f)]
+        except (IOError, ValueError):
+            return []
+
+    def add_location_set(self, locations, size):
+        """
+        Adds a set of (namespace, location) pairs that an import schema has
+        been compiled from, only the last size sets are kept
+        """
+
+        locations = frozenset(locations)
+
+        if locations in self.get_location_sets():
+            return
+
+        with cache.lock(CATALOG_LOCK_KEY, timeout=60):
+            sets = [s for s in self.get_location_sets() if s != locations]
+            sets.append(locations)
+
+            fd, tmp = tempfile.mkstemp(dir=self.directory)
+            with os.fdopen(fd, 'w') as f:
+                json.dump([sorted(s) for s in sets[-size:]], f)
+
+            os.rename(tmp, self.locations_path)
+
+    def add(self, url, content=None, recursive=True):
+        """
+        Adds the schema at the given location to the catalog
+
+        Args:
+            url: The location of the schema
+            content: The content of the schema, downloaded from the location
+                if not provided
+            recursive: If true, schemas imported or included by the schema
+                are also added
+        """
+
+        if self.resolve(url) is not None:
+            return
+
+        if content is None:
+            content = download(url)
+
+        namespace, references = get_schema_references(content)
+        filename = '%s.xsd' % hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+        with open(os.path.join(self.directory, filename), 'wb') as f:
+            f.write(content)
+
+        with cache.lock(CATALOG_LOCK_KEY, timeout=60):
+            uris, namespaces = self._read()
+            uris[url] = filename
+            if namespace:
+                namespaces.setdefault(namespace, filename)
+            self._write(uris, namespaces)
+
+            with self.lock:
+                self.uris, self.namespaces = uris, namespaces
+                self.mtime = self._get_mtime()
+
+        if recursive:
+            for location in references:
+                self.add(urlparse.urljoin(url, location))
+
+    def seed(self, template):
+        """
+        Adds the schemas in -schemasToPreserve of the given profile template
+        """
+
+        for url in template.get('-schemasToPreserve', []):
+            self.add(url)
+
+
+class SchemaStore(object):
+    """
+    A content addressed store of downloaded schemas shared by all processes
+    using the same directory.
+
+    The content of each schema is stored once in objects/, named by its
+    SHA-256 digest. For each location, urls/ holds the digest of its
+    current content together with the ETag and Last-Modified headers of the
+    response and the time it was last checked. A location is not checked
+    again until the max age has passed, and then with a conditional request.
+    In offline mode only stored schemas are used.
+    """
+
+    def __init__(self, directory, max_age=None, offline=False):
+        self.directory = directory
+        self.max_age = get_store_max_age() if max_age is None else max_age
+        self.offline = offline
+
+        for d in ('objects', 'urls'):
+            try:
+                os.makedirs(os.path.join(directory, d))
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+    def get_object_path(self, digest):
+        return os.path.join(self.directory, 'objects', digest[:2], digest)
+
+    def get_meta_path(self, url):
+        return os.path.join(self.directory, 'urls', '%s.json' % hashlib.sha1(url.encode('utf-8')).hexdigest())
+
+    def get_meta(self, url):
+        try:
+            with open(self.get_meta_path(url)) as f:
+                meta = json.load(f)
+        except (IOError, ValueError):
+            return None
+
+        if not os.path.isfile(self.get_object_path(meta['digest'])):
+            return None
+
+        return meta
+
+    def _write_file(self, path, content, mode=None):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+
+        if mode is not None:
+            os.chmod(tmp, mode)
+
+        os.rename(tmp, path)
+
+    def _store(self, url, content, headers):
+        digest = hashlib.sha256(content).hexdigest()
+        path = self.get_object_path(digest)
+
+        if not os.path.isfile(path):
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+            # objects are shared through hard links and must never be
+            # modified in place
+            self._write_file(path, content, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+
+        meta = {
+            'url': url,
+            'digest': digest,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'checked': time.time(),
+        }
+        self._write_file(self.get_meta_path(url), json.dumps(meta))
+
+        return meta
+
+    def _revalidate(self, url, meta):
+        headers = {}
+
+        if meta is not None:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        try:
+            r = requests.get(url, headers=headers, timeout=60)
+
+            if r.status_code == 304 and meta is not None:
+                meta['checked'] = time.time()
+                self._write_file(self.get_meta_path(url), json.dumps(meta))
+                return meta
+
+            r.raise_for_status()
+        except requests.RequestException:
+            if meta is None:
+                raise
+
+            logger.exception('Failed to revalidate %s, using stored copy' % url)
+            return meta
+
+        return self._store(url, r.content, r.headers)
+
+    def _is_fresh(self, meta):
+        return meta is not None and (self.offline or time.time() - meta['checked'] < self.max_age)
+
+    def fetch(self, url):
+        """
+        Gets the path of the stored content of the schema at the given
+        location, downloading or revalidating it if needed
+
+        Raises:
+            SchemaNotAvailable: If in offline mode and the schema isn't stored
+        """
+
+        meta = self.get_meta(url)
+
+        if self._is_fresh(meta):
+            return self.get_object_path(meta['digest'])
+
+        if self.offline:
+            raise SchemaNotAvailable('%s is not available offline' % url)
+
+        # only one process downloads each schema, the others wait and then
+        # use the stored copy
+        with cache.lock(STORE_LOCK_KEY % hashlib.sha1(url.encode('utf-8')).hexdigest(), timeout=120):
+            meta = self.get_meta(url)
+
+            if not self._is_fresh(meta):
+                meta = self._revalidate(url, meta)
+
+        return self.get_object_path(meta['digest'])
+
+    def read(self, url):
+        with open(self.fetch(url), 'rb') as f:
+            return f.read()
+
+    def place(self, url, dst):
+        """
+        Places the schema at the given location at dst as a hard link to the
+        stored content, or as a copy if a link can't be created
+        """
+
+        src = self.fetch(url)
+
+        if os.path.lexists(dst):
+            os.remove(dst)
+
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copyfile(src, dst)
+
+        return dst
+
+
+class CatalogResolver(etree.Resolver):
+    """
+    Resolves schema locations to the local copies in the catalog, schemas
+    that are missing are added to the catalog the first time they are used.
+    In offline mode, schemas that aren't available locally fail to load.
+    """
+
+    def __init__(self, catalog):
+        super(CatalogResolver, self).__init__()
+        self.catalog = catalog
+
+    def resolve(self, url, pubid, context):
+        if not is_remote(url):
+            return None
+
+        path = self.catalog.resolve(url)
+
+        if path is None:
+            try:
+                self.catalog.add(url, recursive=False)
+            except (requests.RequestException, etree.XMLSyntaxError, IOError, SchemaNotAvailable):
+                logger.exception('Failed to add %s to schema catalog' % url)
+
+                # raising stops lxml from loading the schema by itself
+                if is_offline():
+                    raise
+
+                return None
+
+            path = self.catalog.resolve(url)
+
+        with open(path, 'rb') as f:
+            # the original location is kept as base url so that relative
+            # locations in the schema are also resolved using the catalog
+            return self.resolve_string(f.read(), context, base_url=url)
+
+
+class SchemaCache(object):
+    """
+    A thread safe LRU cache of compiled schemas
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, factory):
+        with self.lock:
+            try:
+                schema = self.data.pop(key)
+            except KeyError:
+                pass
+            else:
+                self.data[key] = schema
+                return schema
+
+        schema = factory()
+
+        if self.size <= 0:
+            return schema
+
+        with self.lock:
+            self.data[key] = schema
+
+            while len(self.data) > self.size:
+                self.data.popitem(last=False)
+
+        return schema
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+_catalogs = {}
+_stores = {}
+_local = threading.local()
+_digests = {}
+
+
+def get_thread_schema_cache():
+    """
+    Gets the schema cache of the current thread. A compiled schema collects
+    the errors of each validation in a log of its own and can't be used by
+    multiple threads at the same time, so compiled schemas are never shared
+    between threads.
+    """
+
+    try:
+        return _local.schema_cache
+    except AttributeError:
+        _local.schema_cache = SchemaCache(get_cache_size())
+        return _local.schema_cache
+
+
+def get_store():
+    """
+    Gets the store in the XML_SCHEMA_STORE directory, or None if no
+    directory is configured
+    """
+
+    directory = get_store_dir()
+
+    if directory is None:
+        return None
+
+    key = (directory, get_store_max_age(), is_offline())
+
+    if key not in _stores:
+        _stores[key] = SchemaStore(directory, max_age=key[1], offline=key[2])
+
+    return _stores[key]
+
+
+def download(url):
+    """
+    Gets the content of the schema at the given location, using the store if
+    there is one
+
+    Raises:
+        SchemaNotAvailable: If in offline mode and the schema isn't stored
+    """
+
+    store = get_store()
+
+    if store is not None:
+        return store.read(url)
+
+    if is_offline():
+        raise SchemaNotAvailable('%s is not available offline' % url)
+
+    r = requests.get(url, timeout=60)
+    r.raise_for_status()
+    return r.content
+
+
+def place(url, dst):
+    """
+    Places the schema at the given location at dst, using the store if there
+    is one
+
+    Raises:
+        SchemaNotAvailable: If in offline mode and the schema isn't stored
+    """
+
+    store = get_store()
+
+    if store is not None and is_remote(url):
+        return store.place(url, dst)
+
+    if is_offline() and is_remote(url):
+        raise SchemaNotAvailable('%s is not available offline' % url)
+
+    urllib.urlretrieve(url, dst)
+    return dst
+
+
+def get_catalog():
+    """
+    Gets the catalog in the XML_SCHEMA_CATALOG directory, or None if no
+    directory is configured
+    """
+
+    directory = get_catalog_dir()
+
+    if directory is None:
+        return None
+
+    if directory not in _catalogs:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        _catalogs[directory] = SchemaCatalog(directory)
+
+    return _catalogs[directory]
+
+
+def get_parser():
+    parser = etree.XMLParser()
+    catalog = get_catalog()
+
+    if catalog is not None:
+        parser.resolvers.add(CatalogResolver(catalog))
+
+    return parser
+
+
+def resolve_locations(locations):
+    """
+    Gets the locations that schemas with the given (namespace, location)
+    pairs are imported from, see get_import_schema
+    """
+
+    catalog = get_catalog()
+
+    if catalog is not None:
+        resolved = set()
+        for ns, loc in locations:
+            if catalog.resolve(loc) is None:
+                loc = catalog.get_location(ns) or loc
+            resolved.add((ns, loc))
+        locations = resolved
+
+    return frozenset(locations)
+
+
+def _get_local_path(location):
+    if not is_remote(location):
+        return location
+
+    catalog = get_catalog()
+
+    if catalog is None:
+        return None
+
+    return catalog.resolve(location)
+
+
+def _get_file_digest(path):
+    """
+    Gets the digest of the schema in the given file and the locations of the
+    schemas it references, both are kept until the file is modified
+    """
+
+    mtime = os.path.getmtime(path)
+
+    try:
+        digest_mtime, digest, references = _digests[path]
+    except KeyError:
+        pass
+    else:
+        if digest_mtime == mtime:
+            return digest, references
+
+    with open(path, 'rb') as f:
+        content = f.read()
+
+    try:
+        references = get_schema_references(content)[1]
+    except etree.XMLSyntaxError:
+        references = []
+
+    digest = hashlib.sha256(content).hexdigest()
+    _digests[path] = mtime, digest, references
+    return digest, references
+
+
+def get_schema_digest(locations):
+    """
+    Gets a digest of the content of the schemas at the given locations and
+    of all schemas that they import, include or redefine. Remote schemas are
+    read from the catalog, remote schemas that aren't in the catalog are
+    identified by their location only.
+
+    Args:
+        locations: Paths or urls of schemas
+    """
+
+    digests = {}
+    queue = list(locations)
+
+    while queue:
+        location = queue.pop()
+
+        if location in digests:
+            continue
+
+        path = _get_local_path(location)
+
+        if path is None or not os.path.isfile(path):
+            digests[location] = None
+            continue
+
+        digests[location], references = _get_file_digest(path)
+
+        for ref in references:
+            if is_remote(location):
+                queue.append(urlparse.urljoin(location, ref))
+            elif is_remote(ref) or os.path.isabs(ref):
+                queue.append(ref)
+            else:
+                queue.append(os.path.join(os.path.dirname(location), ref))
+
+    h = hashlib.sha256()
+    for location, digest in sorted(digests.items()):
+        h.update(('%s %s\n' % (location, digest)).encode('utf-8'))
+
+    return h.hexdigest()
+
+
+def get_import_schema(locations, cache=None):
+    """
+    Gets a compiled schema importing the schemas at the given locations
+
+    Args:
+        locations: (namespace, location) pairs, schemas with a namespace
+            found in the catalog are imported from the catalog when their
+            location isn't
+        cache: The schema cache to use, defaults to the cache of the
+            current thread
+    """
+
+    locations = resolve_locations(locations)
+
+    def compile_schema():
+        parser = get_parser()
+        root = parser.makeelement("{%s}schema" % XSD_NAMESPACE, nsmap={'xsd': XSD_NAMESPACE})
+        root.attrib["elementFormDefault"] = "qualified"
+
+        for ns, loc in sorted(locations):
+            etree.SubElement(root, "{%s}import" % XSD_NAMESPACE, attrib={
+                "namespace": ns,
+                "schemaLocation": loc
+            })
+
+        schema = etree.XMLSchema(root)
+
+        catalog = get_catalog()
+        if catalog is not None and get_cache_size() > 0:
+            catalog.add_location_set(locations, get_cache_size())
+
+        return schema
+
+    if cache is None:
+        cache = get_thread_schema_cache()
+
+    return cache.get(('locations', get_catalog_dir(), locations), compile_schema)
+
+
+def get_schema(path, cache=None):
+    """
+    Gets the compiled schema in the given file, the file is compiled again
+    when it is modified
+    """
+
+    if cache is None:
+        cache = get_thread_schema_cache()
+
+    path = os.path.abspath(path)
+    key = ('file', get_catalog_dir(), path, os.path.getmtime(path))
+
+    return cache.get(key, lambda: etree.XMLSchema(etree.parse(path, get_parser())))
+
+
+def warm_up(**kwargs):
+    """
+    Compiles the import schemas of the sets of locations kept in the catalog
+    into the schema cache of the current thread, so that they are ready
+    before the first validation. Used as a handler of the
+    worker_process_init signal of celery and when the threads validating
+    documents start.
+    """
+
+    catalog = get_catalog()
+
+    if catalog is None:
+        return
+
+    for locations in catalog.get_location_sets()[-get_cache_size():]:
+        try:
+            get_import_schema(locations)
+        except etree.XMLSchemaParseError:
+            logger.exception('Failed to compile schema importing %s' % ', '.join(loc for _, loc in locations))
@@ -0,0 +1,317 @@
+"""
+    ESSArch is an open source archiving and digital preservation system
+
+    ESSArch Core
+    Copyright (C) 2005-2017 ES Solutions AB
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+    Contact information:
+    Web - http://www.essolutions.se
+    Email - essarch@essolutions.se
+"""
+
+import os
+import shutil
+import stat
+import tempfile
+import threading
+
+import mock
+import requests
+
+from django.test import TestCase, override_settings
+
+from lxml import etree
+
+from ESSArch_Core.essxml.schemas import (
+    CATALOG_NAMESPACE,
+    XSD_NAMESPACE,
+    SchemaCatalog,
+    get_catalog,
+    get_import_schema,
+    get_schema,
+    get_store,
+    get_thread_schema_cache,
+    place,
+    warm_up,
+)
+from ESSArch_Core.exceptions import SchemaNotAvailable
+from ESSArch_Core.util import getSchemas
+from ESSArch_Core.WorkflowEngine.models import ProcessTask
+
+A_URL = 'http://example.com/schemas/a.xsd'
+B_URL = 'http://example.com/schemas/b.xsd'
+
+A_XSD = '''<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema" xmlns:b="urn:b"
+    targetNamespace="urn:a" elementFormDefault="qualified">
+  <xs:import namespace="urn:b" schemaLocation="b.xsd"/>
+  <xs:element name="root">
+    <xs:complexType><xs:sequence><xs:element ref="b:child"/></xs:sequence></xs:complexType>
+  </xs:element>
+</xs:schema>'''
+
+B_XSD = '''<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema"
+    targetNamespace="urn:b" elementFormDefault="qualified">
+  <xs:element name="child" type="xs:string"/>
+</xs:schema>'''
+
+DOC = '''<root xmlns="urn:a" xmlns:b="urn:b"
+    xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+    xsi:schemaLocation="urn:a %s urn:b %s"><b:child>%s</b:child></root>'''
+
+
+def fake_get(url, **kwargs):
+    content = {A_URL: A_XSD, B_URL: B_XSD}.get(url)
+    response = mock.Mock(content=content)
+
+    if content is None:
+        response.raise_for_status.side_effect = requests.HTTPError(url)
+
+    return response
+
+
+class SchemaTestCase(TestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.datadir)
+
+        self.catalog_dir = os.path.join(self.datadir, 'catalog')
+
+        settings = override_settings(XML_SCHEMA_CATALOG=self.catalog_dir)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        get_thread_schema_cache().clear()
+
+        patcher = mock.patch('ESSArch_Core.essxml.schemas.requests.get', side_effect=fake_get)
+        self.get = patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class SchemaCatalogTestCase(SchemaTestCase):
+    def test_add_with_references(self):
+        catalog = get_catalog()
+        catalog.add(A_URL)
+
+        self.assertEqual(self.get.call_count, 2)
+        with open(catalog.resolve(B_URL)) as f:
+            self.assertEqual(f.read(), B_XSD)
+
+        self.assertEqual(catalog.get_location('urn:b'), B_URL)
+        self.assertIsNone(catalog.resolve('http://example.com/other.xsd'))
+
+    def test_add_with_content(self):
+        catalog = get_catalog()
+        catalog.add(B_URL, content=B_XSD)
+
+        self.get.assert_not_called()
+        self.assertIsNotNone(catalog.resolve(B_URL))
+
+    def test_seed(self):
+        catalog = get_catalog()
+        catalog.seed({'-schemasToPreserve': [A_URL]})
+
+        self.assertItemsEqual(catalog.get_locations(), [('urn:a', A_URL), ('urn:b', B_URL)])
+
+    def test_catalog_file(self):
+        get_catalog().add(B_URL)
+
+        root = etree.parse(os.path.join(self.catalog_dir, 'catalog.xml')).getroot()
+        entries = root.findall('{%s}uri' % CATALOG_NAMESPACE)
+
+        self.assertEqual([(e.get('name'), e.get('nature')) for e in entries], [
+            (B_URL, None), ('urn:b', XSD_NAMESPACE),
+        ])
+
+    def test_shared_between_processes(self):
+        get_catalog().add(B_URL)
+        self.assertIsNotNone(SchemaCatalog(self.catalog_dir).resolve(B_URL))
+
+
+class CompiledSchemaTestCase(SchemaTestCase):
+    def test_validate_offline(self):
+        get_catalog().add(A_URL)
+        self.get.reset_mock()
+
+        doc = etree.ElementTree(etree.fromstring(DOC % (A_URL, B_URL, 'foo')))
+        schema = getSchemas(doc=doc)
+
+        self.assertTrue(schema.validate(doc))
+        self.assertIs(getSchemas(doc=doc), schema)
+        self.get.assert_not_called()
+
+    def test_missing_schemas_added_when_used(self):
+        doc = etree.ElementTree(etree.fromstring(DOC % (A_URL, B_URL, 'foo')))
+        getSchemas(doc=doc)
+
+        self.assertIsNotNone(get_catalog().resolve(A_URL))
+        self.assertIsNotNone(get_catalog().resolve(B_URL))
+
+    def test_resolved_by_namespace(self):
+        get_catalog().add(A_URL)
+        self.get.reset_mock()
+
+        locations = [('urn:a', 'http://example.org/a.xsd')]
+        doc = etree.fromstring(DOC % (A_URL, B_URL, 'foo'))
+
+        self.assertTrue(get_import_schema(locations).validate(doc))
+        self.get.assert_not_called()
+
+    def test_schema_file(self):
+        path = os.path.join(self.datadir, 'b.xsd')
+        with open(path, 'w') as f:
+            f.write(B_XSD)
+
+        schema = get_schema(path)
+        self.assertIs(get_schema(path), schema)
+
+        mtime = os.path.getmtime(path) + 10
+        os.utime(path, (mtime, mtime))
+        self.assertIsNot(get_schema(path), schema)
+
+    def test_schema_per_thread(self):
+        get_catalog().add(A_URL)
+        locations = [('urn:b', B_URL)]
+        schema = get_import_schema(locations)
+        self.assertIs(get_import_schema(locations), schema)
+
+        schemas = []
+        thread = threading.Thread(target=lambda: schemas.append(get_import_schema(locations)))
+        thread.start()
+        thread.join()
+
+        self.assertIsNot(schemas[0], schema)
+
+    def test_warm_up(self):
+        doc = etree.ElementTree(etree.fromstring(DOC % (A_URL, B_URL, 'foo')))
+        getSchemas(doc=doc)
+
+        get_thread_schema_cache().clear()
+        warm_up()
+
+        with mock.patch('ESSArch_Core.essxml.schemas.etree.XMLSchema') as XMLSchema:
+            self.assertTrue(getSchemas(doc=doc).validate(doc))
+
+        XMLSchema.assert_not_called()
+
+    @override_settings(XML_SCHEMA_CACHE_SIZE=1)
+    def test_location_sets_limited_to_cache_size(self):
+        get_catalog().add(A_URL)
+        get_import_schema([('urn:a', A_URL)])
+        get_import_schema([('urn:b', B_URL)])
+
+        self.assertEqual(get_catalog().get_location_sets(), [frozenset([('urn:b', B_URL)])])
+
+
+@override_settings(CELERY_ALWAYS_EAGER=True, CELERY_EAGER_PROPAGATES_EXCEPTIONS=True)
+class SchemaStoreTestCase(TestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.datadir)
+
+        self.store_dir = os.path.join(self.datadir, 'store')
+        self.settings = override_settings(XML_SCHEMA_STORE=self.store_dir)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+
+        self.content = {A_URL: A_XSD, B_URL: B_XSD}
+        patcher = mock.patch('ESSArch_Core.essxml.schemas.requests.get', side_effect=self.fake_get)
+        self.get = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fake_get(self, url, headers=None, **kwargs):
+        if headers and headers.get('If-None-Match') == '"%s"' % hash(self.content[url]):
+            return mock.Mock(status_code=304)
+
+        return mock.Mock(
+            status_code=200, content=self.content[url],
+            headers={'ETag': '"%s"' % hash(self.content[url])},
+        )
+
+    def test_fetched_once(self):
+        store = get_store()
+
+        with open(store.fetch(A_URL)) as f:
+            self.assertEqual(f.read(), A_XSD)
+
+        store.fetch(A_URL)
+        self.assertEqual(self.get.call_count, 1)
+
+    def test_place_links(self):
+        dst1 = os.path.join(self.datadir, 'a1.xsd')
+        dst2 = os.path.join(self.datadir, 'a2.xsd')
+
+        place(A_URL, dst1)
+        place(A_URL, dst2)
+
+        self.assertEqual(self.get.call_count, 1)
+        self.assertEqual(os.stat(dst1).st_ino, os.stat(dst2).st_ino)
+        self.assertFalse(os.stat(dst1).st_mode & stat.S_IWUSR)
+
+    def test_same_content_stored_once(self):
+        self.content['http://example.com/copy/a.xsd'] = A_XSD
+        store = get_store()
+
+        self.assertEqual(store.fetch(A_URL), store.fetch('http://example.com/copy/a.xsd'))
+
+    def test_revalidate(self):
+        with override_settings(XML_SCHEMA_STORE_MAX_AGE=0):
+            store = get_store()
+            path = store.fetch(A_URL)
+
+            self.assertEqual(store.fetch(A_URL), path)
+            self.assertEqual(self.get.call_args[1]['headers'], {'If-None-Match': '"%s"' % hash(A_XSD)})
+
+            self.content[A_URL] = B_XSD
+            with open(store.fetch(A_URL)) as f:
+                self.assertEqual(f.read(), B_XSD)
+
+    def test_revalidate_failed(self):
+        with override_settings(XML_SCHEMA_STORE_MAX_AGE=0):
+            store = get_store()
+            path = store.fetch(A_URL)
+
+            self.get.side_effect = requests.ConnectionError()
+            self.assertEqual(store.fetch(A_URL), path)
+
+    def test_offline(self):
+        get_store().fetch(A_URL)
+        self.get.reset_mock()
+
+        with override_settings(XML_SCHEMA_OFFLINE=True, XML_SCHEMA_STORE_MAX_AGE=0):
+            get_store().fetch(A_URL)
+
+            with self.assertRaises(SchemaNotAvailable):
+                get_store().fetch(B_URL)
+
+        self.get.assert_not_called()
+
+    def test_download_schemas(self):
+        template = {'-schemasToPreserve': [A_URL, B_URL]}
+
+        for ip in ('ip1', 'ip2'):
+            dirname = os.path.join(self.datadir, ip)
+            os.mkdir(dirname)
+
+            ProcessTask.objects.create(
+                name='ESSArch_Core.tasks.DownloadSchemas',
+                params={'template': template, 'dirname': dirname},
+            ).run().get()
+
+            with open(os.path.join(dirname, 'b.xsd')) as f:
+                self.assertEqual(f.read(), B_XSD)
+
+        self.assertEqual(self.get.call_count, 2)
+        self.assertFalse(ProcessTask.objects.filter(name='ESSArch_Core.tasks.DownloadFile').exists())
@@ -27,7 +27,8 @@ import shutil
 import tempfile
 from collections import OrderedDict
 
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 
 from lxml import etree
 
@@ -39,14 +40,24 @@ from ESSArch_Core.configuration.models import (
     Path,
 )
 from ESSArch_Core.essxml.util import (
+    find_documents,
     find_files,
     get_agent,
     get_altrecordid,
     get_altrecordids,
+    get_file_digest,
     get_objectpath,
     parse_reference_code,
     parse_submit_description,
+    get_schema_locations,
+    get_validation_cache_key,
+    get_validation_pool,
+    validate_against_schema,
+    validate_document,
+    validate_document_streaming,
+    validate_documents,
 )
+from ESSArch_Core.util import ValueAccessor, get_accessor, get_value_from_path
 from ESSArch_Core.WorkflowEngine.models import ProcessTask
 
 
@@ -166,6 +177,332 @@ class FindFilesTestCase(TestCase):
         self.assertEqual(len(found), len(expected))
         self.assertItemsEqual(found, expected)
 
+    def test_namespaced_elements(self):
+        xmlfile = os.path.join(self.datadir, "test.xml")
+
+        with open(xmlfile, 'w') as xml:
+            xml.write('''<?xml version="1.0" encoding="UTF-8" ?>
+            <mets:mets xmlns:mets="http://www.loc.gov/METS/" xmlns:xlink="http://www.w3.org/1999/xlink">
+                <mets:fileSec>
+                    <mets:fileGrp>
+                        <mets:file CHECKSUM="abc" CHECKSUMTYPE="MD5" FILEFORMATNAME="Plain Text">
+                            <mets:FLocat xlink:href="file:///1.txt"/>
+                        </mets:file>
+                        <mets:file CHECKSUM="def" CHECKSUMTYPE="MD5">
+                            <mets:FLocat xlink:href="file:///2.txt"/>
+                        </mets:file>
+                    </mets:fileGrp>
+                </mets:fileSec>
+            </mets:mets>
+            ''')
+
+        found = sorted(find_files(xmlfile, rootdir=self.datadir), key=lambda f: f.path)
+
+        self.assertEqual(
+            [(f.path, f.checksum, f.checksum_type, f.format) for f in found],
+            [('1.txt', 'abc', 'MD5', 'Plain Text'), ('2.txt', 'def', 'MD5', None)],
+        )
+
+    def test_nested_file_elements(self):
+        xmlfile = os.path.join(self.datadir, "test.xml")
+
+        with open(xmlfile, 'w') as xml:
+            xml.write('''<?xml version="1.0" encoding="UTF-8" ?>
+            <root>
+                <file CHECKSUM="outer">
+                    <file CHECKSUM="inner"><FLocat href="1.txt"/></file>
+                </file>
+                <file><FLocat href="2.txt"/></file>
+            </root>
+            ''')
+
+        found = find_files(xmlfile, rootdir=self.datadir)
+
+        # the outer element gets its path from the inner element, as
+        # FLocat is searched for among all descendants
+        self.assertItemsEqual(found, ['1.txt', '2.txt'])
+        self.assertEqual(len(found), 2)
+
+
+class ValidateDocumentsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.datadir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.datadir)
+
+        self.schema = os.path.join(self.datadir, 'test.xsd')
+        with open(self.schema, 'w') as f:
+            f.write('''<?xml version="1.0" encoding="UTF-8" ?>
+            <xsd:schema xmlns:xsd="http://www.w3.org/2001/XMLSchema">
+                <xsd:element name="foo" type="xsd:integer"/>
+                <xsd:attribute name="href" type="xsd:string"/>
+                <xsd:element name="mptr">
+                    <xsd:complexType>
+                        <xsd:attribute ref="href" use="required"/>
+                    </xsd:complexType>
+                </xsd:element>
+                <xsd:element name="root">
+                    <xsd:complexType>
+                        <xsd:sequence>
+                            <xsd:element minOccurs="0" ref="foo"/>
+                            <xsd:element minOccurs="0" maxOccurs="unbounded" ref="mptr"/>
+                        </xsd:sequence>
+                    </xsd:complexType>
+                </xsd:element>
+            </xsd:schema>
+            ''')
+
+        self.main = self.write('main.xml', '<root><foo>1</foo><mptr href="sub/a.xml"/><mptr href="b.xml"/></root>')
+        os.mkdir(os.path.join(self.datadir, 'sub'))
+        # pointers in sub documents are relative to the sub document
+        self.a = self.write('sub/a.xml', '<root><foo>2</foo><mptr href="c.xml"/><mptr href="../main.xml"/></root>')
+        self.b = self.write('b.xml', '<foo>3</foo>')
+        self.c = self.write('sub/c.xml', '<foo>4</foo>')
+
+    def write(self, name, content):
+        path = os.path.join(self.datadir, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_find_documents(self):
+        self.assertEqual(find_documents(self.main), [
+            self.main,
+            os.path.join(self.datadir, 'sub/a.xml'),
+            os.path.join(self.datadir, 'b.xml'),
+            os.path.join(self.datadir, 'sub/c.xml'),
+        ])
+
+    def test_valid(self):
+        for pool_size in [1, 4]:
+            errors = validate_documents(self.main, self.schema, pool_size=pool_size)
+            self.assertEqual(len(errors), 4)
+            self.assertTrue(all(e == [] for e in errors.values()))
+
+    def test_errors_per_document(self):
+        self.write('b.xml', '<foo>bar</foo>')
+        self.write('sub/c.xml', '<foo>baz</foo>')
+
+        for pool_size in [1, 4]:
+            errors = validate_documents(self.main, self.schema, pool_size=pool_size)
+
+            self.assertEqual(errors.keys()[0], self.main)
+            self.assertEqual(errors[self.main], [])
+            self.assertEqual(errors[os.path.join(self.datadir, 'sub/a.xml')], [])
+            self.assertEqual(len(errors[os.path.join(self.datadir, 'b.xml')]), 1)
+            self.assertIn("'bar' is not a valid value", errors[os.path.join(self.datadir, 'b.xml')][0])
+            self.assertEqual(len(errors[os.path.join(self.datadir, 'sub/c.xml')]), 1)
+            self.assertIn("'baz' is not a valid value", errors[os.path.join(self.datadir, 'sub/c.xml')][0])
+
+    @override_settings(XML_VALIDATION_POOL_SIZE=4)
+    def test_validate_against_schema_in_parallel(self):
+        self.assertTrue(validate_against_schema(self.main, self.schema, parallel=True))
+
+        self.write('b.xml', '<foo>bar</foo>')
+        self.write('sub/c.xml', '<foo>baz</foo>')
+
+        with self.assertRaises(etree.DocumentInvalid) as e:
+            validate_against_schema(self.main, self.schema, parallel=True)
+
+        self.assertIn("'bar'", str(e.exception))
+        self.assertIn("'baz'", str(e.exception))
+
+    def test_single_pool(self):
+        pool = get_validation_pool()
+        self.assertIs(get_validation_pool(), pool)
+
+        with mock.patch('ESSArch_Core.essxml.util.ThreadPool') as ThreadPool:
+            validate_documents(self.main, self.schema, pool_size=4)
+            validate_documents(self.c, self.schema, pool_size=4, streaming=True)
+
+        ThreadPool.assert_not_called()
+
+    def test_missing_document(self):
+        os.remove(self.c)
+
+        with self.assertRaises(IOError):
+            validate_documents(self.main, self.schema, pool_size=4)
+
+    def test_streaming(self):
+        self.write('b.xml', '<root>\n<foo>bar</foo>\n<mptr/>\n</root>')
+
+        errors = validate_document_streaming(os.path.join(self.datadir, 'b.xml'), self.schema)
+
+        self.assertEqual(len(errors), 2)
+        self.assertIn(':2:0:ERROR:SCHEMASV:', errors[0])
+        self.assertIn("'bar' is not a valid value", errors[0])
+        self.assertIn(':3:0:ERROR:SCHEMASV:', errors[1])
+        self.assertIn("attribute 'href' is required", errors[1])
+
+        # the same errors are found when the tree is built
+        self.assertEqual(
+            [e.split(':ERROR:', 1)[1] for e in errors],
+            [e.split(':ERROR:', 1)[1] for e in validate_document(os.path.join(self.datadir, 'b.xml'), self.schema)],
+        )
+
+    def test_streaming_valid(self):
+        self.assertEqual(validate_document_streaming(self.main, self.schema), [])
+
+    def test_streaming_not_well_formed(self):
+        self.write('b.xml', '<foo>3</fo>')
+
+        with self.assertRaises(etree.XMLSyntaxError):
+            validate_document_streaming(os.path.join(self.datadir, 'b.xml'), self.schema)
+
+    def test_streaming_schema_locations(self):
+        schema = os.path.join(self.datadir, 'ns.xsd')
+        with open(schema, 'w') as f:
+            f.write('''<xsd:schema xmlns:xsd="http://www.w3.org/2001/XMLSchema"
+                targetNamespace="urn:test" elementFormDefault="qualified">
+                <xsd:element name="foo" type="xsd:integer"/>
+            </xsd:schema>''')
+
+        doc = self.write('ns.xml', '''<foo xmlns="urn:test"
+            xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+            xsi:schemaLocation="urn:test %s">bar</foo>''' % schema)
+
+        self.assertEqual(get_schema_locations(doc), set([('urn:test', schema)]))
+
+        errors = validate_document_streaming(doc)
+        self.assertEqual(len(errors), 1)
+        self.assertIn(':3:0:ERROR:SCHEMASV:', errors[0])
+
+    @override_settings(XML_VALIDATION_STREAMING_THRESHOLD=90)
+    def test_streaming_threshold(self):
+        self.write('b.xml', '<foo>bar</foo>')
+        self.write('sub/c.xml', '<foo>baz</foo>' + ' ' * 100)
+
+        with mock.patch('ESSArch_Core.essxml.util.validate_document_streaming',
+                        wraps=validate_document_streaming) as streaming:
+            errors = validate_documents(self.main, self.schema, pool_size=1)
+
+        streaming.assert_called_once_with(self.c, self.schema, locations=[])
+        self.assertIn("'bar' is not a valid value", errors[self.b][0])
+        self.assertIn("'baz' is not a valid value", errors[self.c][0])
+
+    def test_cached_result(self):
+        self.write('b.xml', '<foo>bar</foo>')
+        expected = validate_documents(self.main, self.schema, pool_size=1)
+
+        with mock.patch('ESSArch_Core.essxml.util.validate_document') as validate:
+            self.assertEqual(validate_documents(self.main, self.schema, pool_size=1), expected)
+            self.assertEqual(validate_documents(self.main, self.schema, pool_size=4), expected)
+
+        validate.assert_not_called()
+
+    def test_cached_result_only_reads_digest(self):
+        expected = validate_documents(self.main, self.schema, pool_size=1)
+
+        with mock.patch('ESSArch_Core.essxml.util.etree.iterparse') as iterparse:
+            with mock.patch('ESSArch_Core.essxml.util.get_file_digest', wraps=get_file_digest) as digest:
+                self.assertEqual(validate_documents(self.main, self.schema, pool_size=1), expected)
+
+        iterparse.assert_not_called()
+        self.assertEqual(digest.call_count, 4)
+
+    def test_cached_result_at_other_path(self):
+        self.write('b.xml', '<foo>bar</foo>')
+        validate_documents(self.b, self.schema)
+
+        other = self.write('other.xml', '<foo>bar</foo>')
+
+        with mock.patch('ESSArch_Core.essxml.util.validate_document') as validate:
+            errors = validate_documents(other, self.schema)
+
+        validate.assert_not_called()
+        self.assertEqual(len(errors[other]), 1)
+        self.assertTrue(errors[other][0].startswith('%s:1:' % other))
+
+    def test_force(self):
+        validate_documents(self.main, self.schema, pool_size=1)
+
+        with mock.patch('ESSArch_Core.essxml.util.validate_document', return_value=[]) as validate:
+            validate_documents(self.main, self.schema, pool_size=1, force=True)
+
+        self.assertEqual(validate.call_count, 4)
+
+    def test_cache_key(self):
+        key = get_validation_cache_key(self.b, self.schema)
+        self.assertEqual(get_validation_cache_key(self.b, self.schema), key)
+
+        # the key only depends on the content of the files
+        other = self.write('other.xml', '<foo>3</foo>')
+        self.assertEqual(get_validation_cache_key(other, self.schema), key)
+
+        self.write('other.xml', '<foo>4</foo>')
+        self.assertNotEqual(get_validation_cache_key(other, self.schema), key)
+
+    def test_cache_key_changes_with_imported_schema(self):
+        imported = os.path.join(self.datadir, 'imported.xsd')
+        with open(imported, 'w') as f:
+            f.write('''<xsd:schema xmlns:xsd="http://www.w3.org/2001/XMLSchema">
+                <xsd:element name="bar" type="xsd:integer"/>
+            </xsd:schema>''')
+
+        schema = os.path.join(self.datadir, 'including.xsd')
+        with open(schema, 'w') as f:
+            f.write('''<xsd:schema xmlns:xsd="http://www.w3.org/2001/XMLSchema">
+                <xsd:include schemaLocation="imported.xsd"/>
+            </xsd:schema>''')
+
+        key = get_validation_cache_key(self.b, schema)
+
+        with open(imported, 'w') as f:
+            f.write('''<xsd:schema xmlns:xsd="http://www.w3.org/2001/XMLSchema">
+                <xsd:element name="bar" type="xsd:string"/>
+            </xsd:schema>''')
+        os.utime(imported, (0, 0))
+
+        self.assertNotEqual(get_validation_cache_key(self.b, schema), key)
+
+
+class GetValueFromPathTestCase(TestCase):
+    def setUp(self):
+        self.el = etree.fromstring('''
+            <object xmlns:xlink="http://www.w3.org/1999/xlink" xlink:href="file:///foo.txt" TYPE="obj">text
+                <FLocat xlink:href="file:///bar.txt"/>
+                <storage><contentLocation><contentLocationValue>baz.txt</contentLocationValue></contentLocation></storage>
+            </object>
+        ''')
+
+    def test_paths(self):
+        self.assertIsNone(get_value_from_path(self.el, None))
+        self.assertEqual(get_value_from_path(self.el, '.').strip(), 'text')
+        self.assertEqual(get_value_from_path(self.el, '@href'), 'file:///foo.txt')
+        self.assertEqual(get_value_from_path(self.el, '@TYPE'), 'obj')
+        self.assertEqual(get_value_from_path(self.el, 'FLocat@href'), 'file:///bar.txt')
+        self.assertEqual(get_value_from_path(self.el, 'storage/contentLocation/contentLocationValue'), 'baz.txt')
+        self.assertIsNone(get_value_from_path(self.el, '@missing'))
+
+    def test_missing_nested_element_uses_element(self):
+        self.assertEqual(get_value_from_path(self.el, 'missing@href'), 'file:///foo.txt')
+        self.assertEqual(get_value_from_path(self.el, 'missing').strip(), 'text')
+
+    def test_attribute_in_other_namespace(self):
+        accessor = ValueAccessor('@href')
+        self.assertEqual(accessor(self.el), 'file:///foo.txt')
+
+        self.assertEqual(accessor(etree.fromstring('<object href="plain"/>')), 'plain')
+        self.assertEqual(accessor(etree.fromstring('<object xmlns:a="urn:a" a:href="other"/>')), 'other')
+        self.assertEqual(
+            accessor(etree.fromstring('<object xmlns:a="urn:a" href="first" a:href="second"/>')), 'first'
+        )
+        self.assertIsNone(accessor(etree.fromstring('<object/>')))
+
+    def test_attribute_order_independent_of_previous_elements(self):
+        accessor = ValueAccessor('@href')
+        self.assertEqual(accessor(etree.fromstring('<object xmlns:a="urn:a" a:href="other"/>')), 'other')
+
+        self.assertEqual(
+            accessor(etree.fromstring('<object xmlns:a="urn:a" href="first" a:href="second"/>')), 'first'
+        )
+        self.assertEqual(
+            accessor(etree.fromstring('<object xmlns:a="urn:a" a:href="first" href="second"/>')), 'first'
+        )
+
+    def test_accessors_are_reused(self):
+        self.assertIs(get_accessor('FLocat@href'), get_accessor('FLocat@href'))
+
 
 class GetAltrecordidTestCase(TestCase):
     def test_existing(self):
@@ -379,14 +716,13 @@ class ParseSubmitDescriptionTestCase(TestCase):
         self.assertEqual(ip['create_date'], '456')
 
     @mock.patch('ESSArch_Core.essxml.util.os.stat')
-    @mock.patch('ESSArch_Core.essxml.util.get_objectpath')
-    def test_objpath(self, mock_objectpath, mock_os_stat):
-        mock_objectpath.return_value = 'foo'
+    def test_objpath(self, mock_os_stat):
         mock_os_stat.return_value = mock.Mock(**{'st_size': 24})
 
         self.xmlfile.write('''
             <root OBJID="123">
                 <metsHdr CREATEDATE="456"></metsHdr>
+                <fileSec><fileGrp><file><FLocat href="file:///foo"/></file></fileGrp></fileSec>
             </root>
         ''')
         self.xmlfile.close()
@@ -459,3 +795,53 @@ class ParseSubmitDescriptionTestCase(TestCase):
         ip = parse_submit_description(self.xmlfile.name)
 
         self.assertEqual(ip['information_class'], 123)
+
+    def test_agents(self):
+        self.xmlfile.write('''
+            <mets:mets xmlns:mets="http://www.loc.gov/METS/" OBJID="UUID:123">
+                <mets:metsHdr CREATEDATE="456">
+                    <mets:agent ROLE="ARCHIVIST" TYPE="ORGANIZATION">
+                        <mets:name>archivist</mets:name>
+                    </mets:agent>
+                    <mets:agent ROLE="OTHER" OTHERROLE="SUBMITTER" TYPE="INDIVIDUAL">
+                        <mets:name>submitter</mets:name>
+                    </mets:agent>
+                    <mets:agent ROLE="ARCHIVIST" TYPE="OTHER" OTHERTYPE="SOFTWARE">
+                        <mets:name>system</mets:name>
+                        <mets:note>1.0</mets:note>
+                        <mets:note>type</mets:note>
+                    </mets:agent>
+                    <mets:altRecordID TYPE="REFERENCECODE">a/b</mets:altRecordID>
+                </mets:metsHdr>
+            </mets:mets>
+        ''')
+        self.xmlfile.close()
+
+        ip = parse_submit_description(self.xmlfile.name)
+
+        self.assertEqual(ip['id'], '123')
+        self.assertEqual(ip['archivist_organization'], {'name': 'archivist'})
+        self.assertEqual(ip['submitter_individual'], 'submitter')
+        self.assertNotIn('submitter_organization', ip)
+        self.assertEqual(ip['system_name'], 'system')
+        self.assertEqual(ip['system_version'], ('1.0',))
+        self.assertEqual(ip['system_type'], ('type',))
+        self.assertEqual(ip['altrecordids'], {'REFERENCECODE': ['a/b']})
+        self.assertEqual(ip['reference_codes'], [['a', 'b']])
+
+    @mock.patch('ESSArch_Core.essxml.util.os.stat')
+    def test_stops_at_first_flocat(self, mock_os_stat):
+        mock_os_stat.return_value = mock.Mock(**{'st_size': 24})
+
+        # the document is not well-formed after the first FLocat
+        self.xmlfile.write('''
+            <root OBJID="123">
+                <metsHdr CREATEDATE="456"></metsHdr>
+                <fileSec><fileGrp><file><FLocat href="foo"/><FLocat href="bar"></foo>
+        ''')
+        self.xmlfile.close()
+
+        ip = parse_submit_description(self.xmlfile.name, srcdir='src')
+
+        self.assertEqual(ip['create_date'], '456')
+        self.assertEqual(ip['object_path'], os.path.join('src', 'foo'))
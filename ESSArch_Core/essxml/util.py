@@ -24,11 +24,28 @@
 
 from __future__ import absolute_import
 
+import hashlib
+import multiprocessing
 import os
+import threading
+
+from collections import OrderedDict, deque
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+from django.core.cache import cache
 
 from lxml import etree
 
-from ESSArch_Core.util import getSchemas, get_value_from_path, remove_prefix
+from ESSArch_Core.essxml.schemas import (
+    get_import_schema,
+    get_schema,
+    get_schema_digest,
+    get_thread_schema_cache,
+    resolve_locations,
+    warm_up,
+)
+from ESSArch_Core.util import compile_xpath, get_accessor, getSchemas, get_value_from_path, remove_prefix
 
 XSD_NAMESPACE = "http://www.w3.org/2001/XMLSchema"
 XSI_NAMESPACE = "http://www.w3.org/2001/XMLSchema-instance"
@@ -64,36 +81,53 @@ PTR_ELEMENTS = {
     }
 }
 
+_validation_pool = None
+_validation_pool_pid = None
+_validation_pool_lock = threading.Lock()
+_local = threading.local()
+
+VALIDATION_CACHE_KEY = 'xml_validation_%s'
+DOCUMENT_CACHE_KEY = 'xml_document_%s'
+
+# the maximum number of bytes fed to the parser at once when validating
+# while reading
+STREAMING_READ_SIZE = 65536
+
 
 def get_agent(el, ROLE=None, OTHERROLE=None, TYPE=None, OTHERTYPE=None):
     s = ".//*[local-name()='agent']"
+    variables = {}
 
     if ROLE:
-        s += "[@ROLE='%s']" % ROLE
+        s += "[@ROLE=$role]"
+        variables['role'] = ROLE
 
     if OTHERROLE:
-        s += "[@OTHERROLE='%s']" % OTHERROLE
+        s += "[@OTHERROLE=$otherrole]"
+        variables['otherrole'] = OTHERROLE
 
     if TYPE:
-        s += "[@TYPE='%s']" % TYPE
+        s += "[@TYPE=$type]"
+        variables['type'] = TYPE
 
     if OTHERTYPE:
-        s += "[@OTHERTYPE='%s']" % OTHERTYPE
+        s += "[@OTHERTYPE=$othertype]"
+        variables['othertype'] = OTHERTYPE
 
     try:
-        first = el.xpath(s)[0]
+        first = compile_xpath(s)(el, **variables)[0]
     except IndexError:
         return None
 
     return {
-        'name': first.xpath("*[local-name()='name']")[0].text,
-        'notes': [note.text for note in first.xpath("*[local-name()='note']")]
+        'name': compile_xpath("*[local-name()='name']")(first)[0].text,
+        'notes': [note.text for note in compile_xpath("*[local-name()='note']")(first)]
     }
 
 
 def get_altrecordids(el):
     dct = {}
-    for i in el.xpath(".//*[local-name()='altRecordID']"):
+    for i in compile_xpath(".//*[local-name()='altRecordID']")(el):
         try:
             dct[i.get('TYPE')].append(i.text)
         except KeyError:
@@ -103,18 +137,21 @@ def get_altrecordids(el):
 
 
 def get_altrecordid(el, TYPE):
-    return [e.text for e in el.xpath(".//*[local-name()='altRecordID'][@TYPE='%s']" % TYPE)]
+    return [e.text for e in compile_xpath(".//*[local-name()='altRecordID'][@TYPE=$type]")(el, type=TYPE)]
+
+
+def strip_file_uri(val):
+    try:
+        return val.split('file:///')[1]
+    except IndexError:
+        return val
 
 
 def get_objectpath(el):
     try:
-        e = el.xpath('.//*[local-name()="%s"]' % "FLocat")[0]
+        e = compile_xpath(".//*[local-name()='FLocat']")(el)[0]
         if e is not None:
-            val = get_value_from_path(e, "@href")
-            try:
-                return val.split('file:///')[1]
-            except IndexError:
-                return val
+            return strip_file_uri(get_value_from_path(e, "@href"))
     except IndexError:
         return None
 
@@ -123,10 +160,92 @@ def parse_reference_code(code):
     return code.strip('/ ').split('/')
 
 
+class SubmitDescriptionHeader(object):
+    """
+    The parts of a submit description needed to describe its package: the
+    attributes of the root, the agents and altRecordIDs of the header and
+    the path of the first FLocat.
+
+    The document is only read until the first FLocat, which in a METS
+    document is in the fileSec following the header, and elements are
+    cleared as soon as they have been indexed.
+    """
+
+    AGENT_ATTRIBUTES = ('ROLE', 'OTHERROLE', 'TYPE', 'OTHERTYPE')
+
+    def __init__(self, xmlfile):
+        self.root = None
+        self.create_date = None
+        self.objectpath = None
+        self.agents = []
+        self.altrecordids = {}
+
+        self.parse(xmlfile)
+
+    def parse(self, xmlfile):
+        depth = 0
+
+        for event, el in etree.iterparse(xmlfile, events=('start', 'end'), huge_tree=True):
+            name = el.tag.rsplit('}', 1)[-1]
+
+            if event == 'start':
+                if depth == 0:
+                    # a childless copy of the root, to get its attributes the
+                    # same way as from the parsed document
+                    self.root = etree.Element(el.tag, attrib=dict(el.attrib), nsmap=el.nsmap)
+                elif name == 'metsHdr':
+                    self.create_date = el.get('CREATEDATE')
+                elif name == 'FLocat':
+                    self.objectpath = strip_file_uri(get_value_from_path(el, '@href'))
+                    break
+
+                depth += 1
+                continue
+
+            depth -= 1
+
+            if name == 'agent':
+                self.add_agent(el)
+            elif name == 'altRecordID':
+                self.altrecordids.setdefault(el.get('TYPE'), []).append(el.text)
+
+            if depth == 1:
+                el.clear()
+                while el.getprevious() is not None:
+                    del el.getparent()[0]
+
+    def add_agent(self, el):
+        agent = {attr: el.get(attr) for attr in self.AGENT_ATTRIBUTES}
+        agent['name'] = None
+        agent['notes'] = []
+
+        for child in el.iterchildren(tag=etree.Element):
+            child_name = child.tag.rsplit('}', 1)[-1]
+
+            if child_name == 'name' and agent['name'] is None:
+                agent['name'] = child.text
+            elif child_name == 'note':
+                agent['notes'].append(child.text)
+
+        self.agents.append(agent)
+
+    def get_agent(self, **attrs):
+        """
+        Equivalent to get_agent on the parsed document, returns the first
+        agent with the given attributes
+        """
+
+        for agent in self.agents:
+            if all(agent[attr] == val for attr, val in attrs.iteritems() if val):
+                return {'name': agent['name'], 'notes': agent['notes']}
+
+        return None
+
+
 def parse_submit_description(xmlfile, srcdir=''):
     ip = {}
-    doc = etree.parse(xmlfile)
-    root = doc.getroot()
+    header = SubmitDescriptionHeader(xmlfile)
+    root = header.root
 
     try:
         ip['id'] = root.get('OBJID').split(':')[1]
@@ -135,9 +254,9 @@ def parse_submit_description(xmlfile, srcdir=''):
 
     ip['object_identifier_value'] = ip['id']
     ip['label'] = root.get('LABEL')
-    ip['create_date'] = root.find("{*}metsHdr").get('CREATEDATE')
+    ip['create_date'] = header.create_date
 
-    objpath = get_objectpath(root)
+    objpath = header.objectpath
 
     if objpath:
         ip['object_path'] = os.path.join(srcdir, objpath)
@@ -145,7 +264,7 @@ def parse_submit_description(xmlfile, srcdir=''):
 
     ip['information_class'] = get_value_from_path(root, '@INFORMATIONCLASS')
 
-    ip['altrecordids'] = get_altrecordids(root)
+    ip['altrecordids'] = header.altrecordids
 
     codes = ip['altrecordids'].get('REFERENCECODE', [])
     ip['reference_codes'] = [parse_reference_code(code) for code in codes]
@@ -163,58 +282,58 @@ def parse_submit_description(xmlfile, srcdir=''):
 
     try:
         ip['archivist_organization'] = {
-            'name': get_agent(root, ROLE='ARCHIVIST', TYPE='ORGANIZATION')['name']
+            'name': header.get_agent(ROLE='ARCHIVIST', TYPE='ORGANIZATION')['name']
         }
     except TypeError:
         pass
 
     try:
-        ip['creator_organization'] = get_agent(root, ROLE='CREATOR', TYPE='ORGANIZATION')['name']
+        ip['creator_organization'] = header.get_agent(ROLE='CREATOR', TYPE='ORGANIZATION')['name']
     except TypeError:
         pass
 
     try:
-        ip['submitter_organization'] = get_agent(root, ROLE='OTHER', OTHERROLE='SUBMITTER', TYPE='ORGANIZATION')['name']
+        ip['submitter_organization'] = header.get_agent(ROLE='OTHER', OTHERROLE='SUBMITTER', TYPE='ORGANIZATION')['name']
     except TypeError:
         pass
 
     try:
-        ip['submitter_individual'] = get_agent(root, ROLE='OTHER', OTHERROLE='SUBMITTER', TYPE='INDIVIDUAL')['name']
+        ip['submitter_individual'] = header.get_agent(ROLE='OTHER', OTHERROLE='SUBMITTER', TYPE='INDIVIDUAL')['name']
     except TypeError:
         pass
 
     try:
-        ip['producer_organization'] = get_agent(root, ROLE='OTHER', OTHERROLE='PRODUCER', TYPE='ORGANIZATION')['name']
+        ip['producer_organization'] = header.get_agent(ROLE='OTHER', OTHERROLE='PRODUCER', TYPE='ORGANIZATION')['name']
     except TypeError:
         pass
 
     try:
-        ip['producer_individual'] = get_agent(root, ROLE='OTHER', OTHERROLE='PRODUCER', TYPE='INDIVIDUAL')['name']
+        ip['producer_individual'] = header.get_agent(ROLE='OTHER', OTHERROLE='PRODUCER', TYPE='INDIVIDUAL')['name']
     except TypeError:
         pass
 
     try:
-        ip['ipowner_organization'] = get_agent(root, ROLE='IPOWNER', TYPE='ORGANIZATION')['name']
+        ip['ipowner_organization'] = header.get_agent(ROLE='IPOWNER', TYPE='ORGANIZATION')['name']
     except TypeError:
         pass
 
     try:
-        ip['preservation_organization'] = get_agent(root, ROLE='PRESERVATION', TYPE='ORGANIZATION')['name']
+        ip['preservation_organization'] = header.get_agent(ROLE='PRESERVATION', TYPE='ORGANIZATION')['name']
     except TypeError:
         pass
 
     try:
-        ip['system_name'] = get_agent(root, ROLE='ARCHIVIST', TYPE='OTHER', OTHERTYPE='SOFTWARE')['name']
+        ip['system_name'] = header.get_agent(ROLE='ARCHIVIST', TYPE='OTHER', OTHERTYPE='SOFTWARE')['name']
     except TypeError:
         pass
 
     try:
-        ip['system_version'] = get_agent(root, ROLE='ARCHIVIST', TYPE='OTHER', OTHERTYPE='SOFTWARE')['notes'][0],
+        ip['system_version'] = header.get_agent(ROLE='ARCHIVIST', TYPE='OTHER', OTHERTYPE='SOFTWARE')['notes'][0],
     except TypeError:
         pass
 
     try:
-        ip['system_type'] = get_agent(root, ROLE='ARCHIVIST', TYPE='OTHER', OTHERTYPE='SOFTWARE')['notes'][1],
+        ip['system_type'] = header.get_agent(ROLE='ARCHIVIST', TYPE='OTHER', OTHERTYPE='SOFTWARE')['notes'][1],
     except TypeError:
         pass
 
@@ -229,7 +348,7 @@ class XMLFileElement():
             props: 'dict with properties from FILE_ELEMENTS'
         '''
 
-        self.path = get_value_from_path(el, props.get('path', ''))
+        self.path = get_accessor(props.get('path', ''))(el)
         self.path_prefix = props.get('pathprefix', [])
         for prefix in sorted(self.path_prefix, key=len, reverse=True):
             no_prefix = remove_prefix(self.path, prefix)
@@ -240,10 +359,10 @@ class XMLFileElement():
 
         self.path = self.path.lstrip('/ ')
 
-        self.checksum = get_value_from_path(el, props.get('checksum', ''))
-        self.checksum_type = get_value_from_path(el, props.get('checksumtype', ''))
+        self.checksum = get_accessor(props.get('checksum', ''))(el)
+        self.checksum_type = get_accessor(props.get('checksumtype', ''))(el)
 
-        self.format = get_value_from_path(el, props.get('format', ''))
+        self.format = get_accessor(props.get('format', ''))(el)
 
     def __eq__(self, other):
         '''
@@ -260,37 +379,457 @@ class XMLFileElement():
         return hash(self.path)
 
 
+def iter_file_elements(xmlfile, elements, schema_locations=None):
+    """
+    Finds the file elements in the document in a single pass without
+    keeping the whole document in memory. Each element is cleared once it
+    and all its ancestors that are file elements have been read.
+
+    Args:
+        xmlfile: The path to the document
+        elements: A dict of file elements, such as FILE_ELEMENTS
+        schema_locations: A set that the (namespace, location) pairs of the
+            schema locations in the document are added to, if any
+
+    Yields:
+        The name of each found element and the XMLFileElement created from it
+    """
+
+    depth = 0
+    schema_location = '{%s}schemaLocation' % XSI_NAMESPACE
+
+    for event, el in etree.iterparse(xmlfile, events=('start', 'end'), huge_tree=True):
+        name = el.tag.rsplit('}', 1)[-1]
+
+        if event == 'start':
+            if schema_locations is not None:
+                ns_locs = el.get(schema_location, '').split()
+                schema_locations.update(zip(ns_locs[::2], ns_locs[1::2]))
+
+            if name in elements:
+                depth += 1
+            continue
+
+        if name in elements:
+            depth -= 1
+            yield name, XMLFileElement(el, elements[name])
+
+        # elements within file elements are kept until the outermost file
+        # element has been read since it might get its values from them
+        if depth == 0:
+            el.clear()
+
+            parent = el.getparent()
+            if parent is not None:
+                while el.getprevious() is not None:
+                    del parent[0]
+
+
 def find_pointers(xmlfile):
-    doc = etree.ElementTree(file=xmlfile)
+    for _, ptr in iter_file_elements(xmlfile, PTR_ELEMENTS):
+        yield ptr
 
-    for elname, props in PTR_ELEMENTS.iteritems():
-        for ptr in doc.xpath('.//*[local-name()="%s"]' % elname):
-            yield XMLFileElement(ptr, props)
 
+def iter_files(xmlfile, rootdir='', prefix=''):
+    """
+    Finds the files in the document and in the documents it points to,
+    including the pointed to documents themselves. The same file is found
+    more than once if it is referenced more than once.
+    """
 
-def find_files(xmlfile, rootdir='', prefix=''):
-    doc = etree.ElementTree(file=xmlfile)
-    files = set()
+    elements = dict(FILE_ELEMENTS, **PTR_ELEMENTS)
+
+    for name, file_el in iter_file_elements(xmlfile, elements):
+        if name in PTR_ELEMENTS:
+            pointer_prefix = os.path.split(file_el.path)[0]
+            yield file_el
 
-    for elname, props in FILE_ELEMENTS.iteritems():
-        for el in doc.xpath('.//*[local-name()="%s"]' % elname):
-            file_el = XMLFileElement(el, props)
+            for f in iter_files(os.path.join(rootdir, file_el.path), rootdir, pointer_prefix):
+                yield f
+        else:
             file_el.path = os.path.join(prefix, file_el.path)
-            files.add(file_el)
+            yield file_el
+
+
+def find_files(xmlfile, rootdir='', prefix=''):
+    return set(iter_files(xmlfile, rootdir, prefix))
+
+
+def get_validation_pool_size():
+    return max(getattr(settings, 'XML_VALIDATION_POOL_SIZE', None) or multiprocessing.cpu_count(), 1)
+
+
+def get_validation_pool():
+    """
+    Gets the thread pool of the process, with XML_VALIDATION_POOL_SIZE
+    threads. The pool lives as long as the process so that each thread
+    keeps the schemas it has compiled, a forked process creates a pool of
+    its own.
+    """
+
+    global _validation_pool, _validation_pool_pid
+
+    with _validation_pool_lock:
+        if _validation_pool is None or _validation_pool_pid != os.getpid():
+            _validation_pool = ThreadPool(get_validation_pool_size(), _init_validation_thread)
+            _validation_pool_pid = os.getpid()
+
+        return _validation_pool
+
+
+class StreamingErrorLog(etree.PyErrorLog):
+    """
+    Receives the errors of all parsers in the thread as they occur and passes
+    them on to the collector of the current validation, if any
+    """
+
+    def __init__(self):
+        super(StreamingErrorLog, self).__init__()
+        self.collector = None
+
+    def receive(self, entry):
+        if self.collector is not None:
+            self.collector(entry)
+
+
+def _init_validation_thread():
+    # this replaces the global error log of the thread which is why
+    # streaming validation is only done in the threads of the pool
+    _local.error_log = StreamingErrorLog()
+    etree.use_global_python_log(_local.error_log)
+
+    warm_up()
+
+
+def warm_up_validation(**kwargs):
+    """
+    Compiles the schemas kept in the catalog in the current thread and starts
+    the validation pool, whose threads compile them as they start. Used as a
+    handler of the worker_process_init signal of celery.
+    """
+
+    warm_up()
+    get_validation_pool()
+
+
+def get_file_digest(path):
+    h = hashlib.sha256()
+
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(STREAMING_READ_SIZE), b''):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+
+def get_document_info(xmlfile):
+    """
+    Gets the digest of the content of the document, the paths of the
+    documents that it points to and its schema locations. The pointers and
+    schema locations are found in a single pass and cached by the digest,
+    reading a known document again only costs calculating its digest.
+
+    Returns:
+        A dict with the digest, pointers and (namespace, location) pairs of
+        the schema locations of the document
+    """
+
+    digest = get_file_digest(xmlfile)
+    key = DOCUMENT_CACHE_KEY % digest
+    info = cache.get(key)
+
+    if info is None:
+        locations = set()
+        pointers = [ptr.path for _, ptr in iter_file_elements(xmlfile, PTR_ELEMENTS, locations)]
+        info = {'pointers': pointers, 'locations': sorted(locations)}
+        cache.set(key, info, get_validation_cache_timeout())
+
+    info['digest'] = digest
+    return info
+
+
+def _find_documents(xmlfile, rootdir=None):
+    documents = [(xmlfile, get_document_info(xmlfile))]
+    seen = set([os.path.abspath(xmlfile)])
+
+    if rootdir is None:
+        rootdir = os.path.split(xmlfile)[0]
+
+    queue = deque([(documents[0], rootdir)])
+
+    while queue:
+        (path, info), directory = queue.popleft()
+
+        for ptr in info['pointers']:
+            ptr_path = os.path.join(directory, ptr)
+
+            if os.path.abspath(ptr_path) in seen:
+                continue
+
+            seen.add(os.path.abspath(ptr_path))
+            document = (ptr_path, get_document_info(ptr_path))
+            documents.append(document)
+            queue.append((document, os.path.split(ptr_path)[0]))
+
+    return documents
+
+
+def find_documents(xmlfile, rootdir=None):
+    """
+    Finds the document and all documents that it points to, directly or
+    through other documents
+
+    Args:
+        xmlfile: The path to the document
+        rootdir: The directory that the pointers in the document are relative
+            to, defaults to the directory of the document. Pointers in other
+            documents are always relative to the directory of the document.
+
+    Returns:
+        The paths of the documents, starting with xmlfile
+    """
+
+    return [path for path, info in _find_documents(xmlfile, rootdir)]
+
+
+def validate_document(xmlfile, schema=None, cache=None):
+    """
+    Validates a single document against the given schema or the schemas
+    specified in the document
+
+    Returns:
+        A list of the validation errors of the document
+    """
+
+    doc = etree.parse(xmlfile)
+
+    if schema:
+        xmlschema = get_schema(schema, cache)
+    else:
+        xmlschema = getSchemas(doc=doc, cache=cache)
+
+    if xmlschema.validate(doc):
+        return []
+
+    return [str(error) for error in xmlschema.error_log]
+
+
+def get_schema_locations(xmlfile):
+    """
+    Finds the schema locations in the document without keeping the whole
+    document in memory
+
+    Returns:
+        A set of (namespace, location) pairs
+    """
+
+    locations = set()
+    schema_location = '{%s}schemaLocation' % XSI_NAMESPACE
+
+    for _, el in etree.iterparse(xmlfile, events=('end',), huge_tree=True):
+        ns_locs = el.get(schema_location, '').split()
+        locations.update(zip(ns_locs[::2], ns_locs[1::2]))
+
+        el.clear()
+        while el.getprevious() is not None:
+            del el.getparent()[0]
+
+    return locations
+
+
+def use_streaming_validation(xmlfile):
+    threshold = getattr(settings, 'XML_VALIDATION_STREAMING_THRESHOLD', None)
+    return threshold is not None and os.path.getsize(xmlfile) >= threshold
+
+
+def validate_document_streaming(xmlfile, schema=None, cache=None, locations=None):
+    """
+    Validates a single document while it is read, without building the tree
+    of the document. Memory use is bounded by the size of the schema and the
+    longest line of the document, up to STREAMING_READ_SIZE bytes.
+
+    The document is fed to the parser one line at a time so that the line
+    of each error is known, the validating parser doesn't report it itself.
+    The schema locations of the document are found by reading it unless
+    they are given.
+
+    Returns:
+        A list of the validation errors of the document
+    """
+
+    if getattr(_local, 'error_log', None) is None:
+        return get_validation_pool().apply(validate_document_streaming, (xmlfile, schema, cache, locations))
+
+    if cache is None:
+        cache = get_thread_schema_cache()
+
+    if schema:
+        xmlschema = get_schema(schema, cache)
+    else:
+        if locations is None:
+            locations = get_schema_locations(xmlfile)
+
+        xmlschema = get_import_schema(locations, cache)
+
+    errors = []
+    position = {'line': 1}
+
+    def collect(entry):
+        if entry.domain == etree.ErrorDomains.SCHEMASV:
+            errors.append('%s:%d:0:%s:%s:%s: %s' % (
+                xmlfile, position['line'], entry.level_name, entry.domain_name,
+                entry.type_name, entry.message,
+            ))
+
+    parser = etree.XMLPullParser(events=('end',), schema=xmlschema, huge_tree=True)
+    _local.error_log.collector = collect
+
+    try:
+        with open(xmlfile, 'rb') as f:
+            for data in iter(lambda: f.readline(STREAMING_READ_SIZE), b''):
+                parser.feed(data)
+
+                for _, el in parser.read_events():
+                    el.clear()
+                    while el.getprevious() is not None:
+                        del el.getparent()[0]
+
+                if data.endswith(b'\n'):
+                    position['line'] += 1
+
+            parser.close()
+    except etree.XMLSyntaxError:
+        # the validating parser raises the first validation error when it is
+        # closed, errors that aren't validation errors are raised as usual
+        if not errors:
+            raise
+    finally:
+        _local.error_log.collector = None
+
+    return errors
+
+
+def get_validation_cache_timeout():
+    return getattr(settings, 'XML_VALIDATION_CACHE_TIMEOUT', 7 * 24 * 60 * 60)
+
+
+def get_validation_cache_key(xmlfile, schema=None, info=None):
+    """
+    Gets the key of the cached validation result of the document, based on
+    the content of the document and of all schemas that it is validated
+    against, including the schemas that they import
+
+    Args:
+        xmlfile: The path to the document
+        schema: The path to the schema that the document is validated
+            against, defaults to the schemas specified in the document
+        info: The result of get_document_info for the document, if it has
+            already been read
+    """
+
+    if info is None:
+        info = get_document_info(xmlfile)
+
+    if schema:
+        schema_key = get_schema_digest([os.path.abspath(schema)])
+    else:
+        locations = resolve_locations(info['locations'])
+        schema_key = '%s %s' % (
+            hashlib.sha256(repr(sorted(locations))).hexdigest(),
+            get_schema_digest([loc for ns, loc in locations]),
+        )
+
+    key = '%s %s %s' % (info['digest'], schema_key, etree.LIBXML_VERSION)
+    return VALIDATION_CACHE_KEY % hashlib.sha256(key).hexdigest()
+
+
+def _validate(job):
+    xmlfile, schema, streaming, force, info = job
+    key = get_validation_cache_key(xmlfile, schema, info)
+
+    if not force:
+        cached = cache.get(key)
+
+        if cached is not None:
+            # the same document might have been validated at another path
+            prefix = '%s:' % cached['path']
+            return [
+                '%s:%s' % (xmlfile, error[len(prefix):]) if error.startswith(prefix) else error
+                for error in cached['errors']
+            ]
+
+    if streaming:
+        errors = validate_document_streaming(xmlfile, schema, locations=info['locations'])
+    elif getattr(_local, 'error_log', None) is not None:
+        errors = validate_document(xmlfile, schema, get_thread_schema_cache())
+    else:
+        errors = validate_document(xmlfile, schema)
+
+    cache.set(key, {'path': xmlfile, 'errors': errors}, get_validation_cache_timeout())
+    return errors
+
+
+def validate_documents(xmlfile, schema=None, rootdir=None, pool_size=None, streaming=None, force=False):
+    """
+    Validates the document and all documents that it points to. All
+    documents are found before any of them is validated, the documents are
+    then validated concurrently, each of them once.
+
+    The result of each validation is cached for XML_VALIDATION_CACHE_TIMEOUT
+    seconds, see get_validation_cache_key.
+
+    Args:
+        xmlfile: The path to the document
+        schema: The path to the schema to validate against, defaults to the
+            schemas specified in each document
+        rootdir: The directory that the pointers in the document are relative
+            to, defaults to the directory of the document
+        pool_size: If 1, the documents are validated one at a time in the
+            current thread, otherwise they are validated concurrently on the
+            validation pool, see get_validation_pool. Defaults to
+            XML_VALIDATION_POOL_SIZE or the number of CPUs
+        streaming: If documents are validated while they are read, see
+            validate_document_streaming. Defaults to streaming documents
+            larger than XML_VALIDATION_STREAMING_THRESHOLD bytes.
+        force: If true, documents are validated even if the result of an
+            earlier validation of the same content is cached
+
+    Returns:
+        An OrderedDict with the validation errors of each document
+    """
+
+    documents = _find_documents(xmlfile, rootdir)
+
+    if pool_size is None:
+        pool_size = get_validation_pool_size()
+
+    if streaming is None:
+        jobs = [(doc, schema, use_streaming_validation(doc), force, info) for doc, info in documents]
+    else:
+        jobs = [(doc, schema, streaming, force, info) for doc, info in documents]
+
+    if (pool_size == 1 or len(documents) == 1) and not any(job[2] for job in jobs):
+        errors = [_validate(job) for job in jobs]
+    else:
+        errors = get_validation_pool().map(_validate, jobs, chunksize=1)
+
+    return OrderedDict(zip([doc for doc, info in documents], errors))
+
 
-    for pointer in find_pointers(xmlfile):
-        pointer_prefix = os.path.split(pointer.path)[0]
-        files.add(pointer)
-        files |= find_files(os.path.join(rootdir, pointer.path), rootdir, pointer_prefix)
+def validate_against_schema(xmlfile, schema=None, rootdir=None, parallel=False, streaming=None, force=False):
+    if parallel or streaming:
+        errors = validate_documents(xmlfile, schema, rootdir, streaming=streaming, force=force)
+        invalid = [error for doc_errors in errors.values() for error in doc_errors]
 
-    return files
+        if invalid:
+            raise etree.DocumentInvalid('\n'.join(invalid))
 
+        return True
 
-def validate_against_schema(xmlfile, schema=None, rootdir=None):
     doc = etree.ElementTree(file=xmlfile)
 
     if schema:
-        xmlschema = etree.XMLSchema(etree.parse(schema))
+        xmlschema = get_schema(schema)
     else:
         xmlschema = getSchemas(doc=doc)
 
@@ -303,4 +842,4 @@ def validate_against_schema(xmlfile, schema=None, rootdir=None):
         if not validate_against_schema(os.path.join(rootdir, ptr.path), schema):
             return False
 
-    return xmlschema.validate(doc)
+    return True
@@ -6,6 +6,10 @@ class FileFormatNotAllowed(Exception):
     pass
 
 
+class SchemaNotAvailable(Exception):
+    pass
+
+
 class Conflict(APIException):
     status_code = status.HTTP_409_CONFLICT
     default_detail = 'The request could not be completed due to a conflict with the target resource'
@@ -0,0 +1,249 @@
+"""
+    ESSArch is an open source archiving and digital preservation system
+
+    ESSArch Core
+    Copyright (C) 2005-2017 ES Solutions AB
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+    Contact information:
+    Web - http://www.essolutions.se
+    Email - essarch@essolutions.se
+"""
+
+from __future__ import absolute_import
+
+import heapq
+import json
+import os
+import tempfile
+
+from django.conf import settings
+
+from scandir import walk
+
+from ESSArch_Core.essxml.util import iter_files
+from ESSArch_Core.util import remove_prefix, win_to_posix
+
+
+def get_memory_limit():
+    return max(getattr(settings, 'FILE_COMPARISON_MEMORY_LIMIT', 100000) or 1, 1)
+
+
+def get_report_limit():
+    return getattr(settings, 'FILE_COMPARISON_REPORT_LIMIT', 1000)
+
+
+def _sort_key(path):
+    if isinstance(path, bytes):
+        # names that aren't valid UTF-8 can't be referenced by the metadata
+        # and are reported as extra files
+        path = path.decode('utf-8', 'replace')
+
+    return path.lower(), path
+
+
+def _read_run(f):
+    for line in f:
+        yield tuple(json.loads(line))
+
+
+def sorted_paths(paths, memory_limit=None):
+    """
+    Sorts the paths by their lowercase form and then by the paths
+    themselves, without duplicates. At most memory_limit paths are kept in
+    memory, larger inputs are sorted in runs stored in temporary files that
+    are then merged.
+
+    Yields:
+        (lowercase path, path) tuples in sorted order
+    """
+
+    if memory_limit is None:
+        memory_limit = get_memory_limit()
+
+    runs = []
+    current = set()
+
+    try:
+        for path in paths:
+            current.add(_sort_key(path))
+
+            if len(current) >= memory_limit:
+                run = tempfile.TemporaryFile()
+                for key in sorted(current):
+                    run.write(json.dumps(key) + '\n')
+                run.seek(0)
+                runs.append(run)
+                current = set()
+
+        keys = sorted(current)
+        del current
+
+        if runs:
+            keys = heapq.merge(keys, *[_read_run(f) for f in runs])
+
+        last = None
+        for key in keys:
+            if key != last:
+                yield key
+                last = key
+    finally:
+        for run in runs:
+            run.close()
+
+
+def _group(keys):
+    # groups the sorted keys by their lowercase form
+    group, lower = [], None
+
+    for key in keys:
+        if key[0] != lower and group:
+            yield lower, group
+            group = []
+
+        lower = key[0]
+        group.append(key[1])
+
+    if group:
+        yield lower, group
+
+
+class ComparisonReport(object):
+    """
+    The differences between the logical and physical representation of a
+    set of files. At most limit paths of each kind are kept, all of them
+    are counted.
+    """
+
+    def __init__(self, limit=None):
+        self.limit = get_report_limit() if limit is None else limit
+        self.logical_count = 0
+        self.physical_count = 0
+        self.counts = {'missing': 0, 'extra': 0, 'case_mismatch': 0}
+        self.missing = []
+        self.extra = []
+        self.case_mismatch = []
+
+    def add(self, kind, value):
+        self.counts[kind] += 1
+        values = getattr(self, kind)
+
+        if len(values) < self.limit:
+            values.append(value)
+
+    def is_valid(self):
+        return not any(self.counts.values())
+
+    def to_dict(self):
+        return {
+            'logical_count': self.logical_count,
+            'physical_count': self.physical_count,
+            'counts': dict(self.counts),
+            'missing': list(self.missing),
+            'extra': list(self.extra),
+            'case_mismatch': [list(pair) for pair in self.case_mismatch],
+        }
+
+    def __unicode__(self):
+        lines = [
+            u'the logical representation differs from the physical: '
+            '%(missing)d missing, %(extra)d extra and %(case_mismatch)d case mismatched files' % self.counts
+        ]
+
+        lines.extend(u'missing: %s' % path for path in self.missing)
+        lines.extend(u'extra: %s' % path for path in self.extra)
+        lines.extend(u'case mismatch: %s != %s' % pair for pair in self.case_mismatch)
+
+        return u'\n'.join(lines)
+
+    def __str__(self):
+        return unicode(self).encode('utf-8')
+
+
+def compare_paths(logical, physical, memory_limit=None, report_limit=None):
+    """
+    Compares the paths of the logical representation with the paths of the
+    physical representation using a merge of the sorted paths
+
+    Args:
+        logical: Iterable of the paths referenced in the metadata
+        physical: Iterable of the paths that exist
+
+    Returns:
+        A ComparisonReport with the missing paths, that only exist in the
+        logical representation, the extra paths, that only exist in the
+        physical representation, and the (logical, physical) pairs of paths
+        that only differ in case
+    """
+
+    report = ComparisonReport(report_limit)
+
+    def count(paths, attr):
+        for path in paths:
+            setattr(report, attr, getattr(report, attr) + 1)
+            yield path
+
+    logical_groups = _group(sorted_paths(count(logical, 'logical_count'), memory_limit))
+    physical_groups = _group(sorted_paths(count(physical, 'physical_count'), memory_limit))
+
+    l_lower, l_paths = next(logical_groups, (None, None))
+    p_lower, p_paths = next(physical_groups, (None, None))
+
+    while l_lower is not None or p_lower is not None:
+        if p_lower is None or (l_lower is not None and l_lower < p_lower):
+            for path in l_paths:
+                report.add('missing', path)
+            l_lower, l_paths = next(logical_groups, (None, None))
+        elif l_lower is None or p_lower < l_lower:
+            for path in p_paths:
+                report.add('extra', path)
+            p_lower, p_paths = next(physical_groups, (None, None))
+        else:
+            missing = [path for path in l_paths if path not in p_paths]
+            extra = [path for path in p_paths if path not in l_paths]
+
+            for pair in zip(missing, extra):
+                report.add('case_mismatch', pair)
+
+            for path in missing[len(extra):]:
+                report.add('missing', path)
+
+            for path in extra[len(missing):]:
+                report.add('extra', path)
+
+            l_lower, l_paths = next(logical_groups, (None, None))
+            p_lower, p_paths = next(physical_groups, (None, None))
+
+    return report
+
+
+def iter_physical_paths(dirname, exclude=None):
+    """
+    Finds the paths of all files in the directory, relative to the directory
+    """
+
+    for root, dirs, filenames in walk(dirname):
+        reldir = os.path.relpath(root, dirname)
+
+        for f in filenames:
+            relfile = remove_prefix(win_to_posix(os.path.join(reldir, f)), "./")
+
+            if relfile != exclude:
+                yield relfile
+
+
+def iter_logical_paths(xmlfile, rootdir=''):
+    for f in iter_files(xmlfile, rootdir):
+        yield f.path
@@ -0,0 +1,142 @@
+"""
+    ESSArch is an open source archiving and digital preservation system
+
+    ESSArch Core
+    Copyright (C) 2005-2017 ES Solutions AB
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+    Contact information:
+    Web - http://www.essolutions.se
+    Email - essarch@essolutions.se
+"""
+
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase
+
+from ESSArch_Core.fixity.comparison import (
+    compare_paths,
+    iter_logical_paths,
+    iter_physical_paths,
+    sorted_paths,
+)
+
+
+class SortedPathsTestCase(TestCase):
+    def test_in_memory(self):
+        self.assertEqual(list(sorted_paths(['b', 'A', 'a', 'b'], memory_limit=10)), [
+            (u'a', u'A'), (u'a', u'a'), (u'b', u'b'),
+        ])
+
+    def test_spilled_to_disk(self):
+        paths = ['%03d/%s.txt' % (i % 97, i) for i in range(500)]
+        paths.extend(paths[:100])
+
+        self.assertEqual(
+            list(sorted_paths(paths, memory_limit=7)),
+            sorted(set((p.lower(), p) for p in paths)),
+        )
+
+    def test_mixed_str_and_unicode(self):
+        self.assertEqual(list(sorted_paths([u'\xe5.txt', u'\xe5.txt'.encode('utf-8')], memory_limit=1)), [
+            (u'\xe5.txt', u'\xe5.txt'),
+        ])
+
+
+class ComparePathsTestCase(TestCase):
+    def test_equal(self):
+        report = compare_paths(['a', 'b/c', 'b/c'], ['b/c', 'a'], memory_limit=1)
+
+        self.assertTrue(report.is_valid())
+        self.assertEqual(report.logical_count, 3)
+        self.assertEqual(report.physical_count, 2)
+
+    def test_differences(self):
+        for memory_limit in [1, 2, 100]:
+            report = compare_paths(
+                ['a', 'B.txt', 'd/e', 'missing'],
+                ['a', 'b.txt', 'd/e', 'extra', 'f'],
+                memory_limit=memory_limit,
+            )
+
+            self.assertFalse(report.is_valid())
+            self.assertEqual(report.missing, ['missing'])
+            self.assertEqual(report.extra, ['extra', 'f'])
+            self.assertEqual(report.case_mismatch, [('B.txt', 'b.txt')])
+            self.assertEqual(report.counts, {'missing': 1, 'extra': 2, 'case_mismatch': 1})
+
+    def test_case_variants_on_both_sides(self):
+        report = compare_paths(['A', 'a'], ['a', 'A'])
+        self.assertTrue(report.is_valid())
+
+        report = compare_paths(['A', 'a'], ['a'])
+        self.assertEqual(report.missing, ['A'])
+        self.assertEqual(report.case_mismatch, [])
+
+    def test_report_limit(self):
+        report = compare_paths(['%d' % i for i in range(10)], [], report_limit=3)
+
+        self.assertEqual(report.counts['missing'], 10)
+        self.assertEqual(len(report.missing), 3)
+        self.assertIn('10 missing', str(report))
+
+    def test_to_dict(self):
+        report = compare_paths(['A'], ['a', 'b'])
+
+        self.assertEqual(report.to_dict(), {
+            'logical_count': 1,
+            'physical_count': 2,
+            'counts': {'missing': 0, 'extra': 1, 'case_mismatch': 1},
+            'missing': [],
+            'extra': ['b'],
+            'case_mismatch': [['A', 'a']],
+        })
+
+    def test_undecodable_physical_path(self):
+        report = compare_paths([u'caf\xe9.txt'], [b'caf\xe9.txt'])
+
+        self.assertEqual(report.missing, [u'caf\xe9.txt'])
+        self.assertEqual(report.extra, [u'caf\ufffd.txt'])
+
+
+class IterPathsTestCase(TestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.datadir)
+
+    def test_physical_paths(self):
+        os.makedirs(os.path.join(self.datadir, 'a', 'b'))
+        for name in ['1.txt', 'a/2.txt', 'a/b/3.txt', 'mets.xml']:
+            open(os.path.join(self.datadir, name), 'w').close()
+
+        self.assertItemsEqual(
+            iter_physical_paths(self.datadir, exclude='mets.xml'),
+            ['1.txt', 'a/2.txt', 'a/b/3.txt'],
+        )
+
+    def test_physical_path_not_utf8(self):
+        open(os.path.join(self.datadir, b'caf\xe9.txt'), 'w').close()
+
+        report = compare_paths([], iter_physical_paths(self.datadir))
+        self.assertEqual(report.extra, [u'caf\ufffd.txt'])
+
+    def test_logical_paths(self):
+        xmlfile = os.path.join(self.datadir, 'mets.xml')
+        with open(xmlfile, 'w') as f:
+            f.write('<root><file><FLocat href="file:///1.txt"/></file><file><FLocat href="a/2.txt"/></file></root>')
+
+        self.assertEqual(list(iter_logical_paths(xmlfile, self.datadir)), ['1.txt', 'a/2.txt'])
@@ -0,0 +1,241 @@
+"""
+    ESSArch is an open source archiving and digital preservation system
+
+    ESSArch Core
+    Copyright (C) 2005-2017 ES Solutions AB
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+    Contact information:
+    Web - http://www.essolutions.se
+    Email - essarch@essolutions.se
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from ESSArch_Core.fixity.validation import get_fido, identify_format, read_file, validate_file, validate_files
+from ESSArch_Core.ip.models import FileValidation, FileValidationFailure, InformationPackage
+from ESSArch_Core.WorkflowEngine.models import ProcessStep, ProcessTask
+
+
+class ValidationTestCase(TestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.datadir)
+
+        self.fname = os.path.join(self.datadir, 'test.txt')
+        with open(self.fname, 'w') as f:
+            f.write('foo')
+
+    def test_read_file(self):
+        content = os.urandom(1000)
+        with open(self.fname, 'wb') as f:
+            f.write(content)
+
+        digests, bof, eof, size = read_file(self.fname, ['MD5', 'SHA-256'], bufsize=300)
+
+        self.assertEqual(digests, {
+            'MD5': hashlib.md5(content).hexdigest(),
+            'SHA-256': hashlib.sha256(content).hexdigest(),
+        })
+        self.assertEqual(bof, content[:300])
+        self.assertEqual(eof, content[-300:])
+        self.assertEqual(size, 1000)
+
+    def test_read_file_without_checksums(self):
+        for length in [1000, 400]:
+            content = os.urandom(length)
+            with open(self.fname, 'wb') as f:
+                f.write(content)
+
+            digests, bof, eof, size = read_file(self.fname, bufsize=300)
+
+            self.assertEqual(digests, {})
+            self.assertEqual(bof, content[:300])
+            self.assertEqual(eof, content[-300:])
+            self.assertEqual(size, length)
+
+    def test_read_small_file(self):
+        digests, bof, eof, size = read_file(self.fname, bufsize=300)
+
+        self.assertEqual(digests, {})
+        self.assertEqual(bof, 'foo')
+        self.assertEqual(eof, 'foo')
+        self.assertEqual(size, 3)
+
+    def test_identify_format_as_fido(self):
+        identified = []
+        fid = get_fido()
+        fid.handle_matches = lambda fullname, matches, delta_t, matchtype='': identified.extend(matches)
+        fid.identify_file(self.fname)
+
+        f = identified[-1][0]
+        expected = (f.find('name').text, f.find('version').text, f.find('puid').text)
+        self.assertEqual(identify_format(self.fname, *read_file(self.fname)[1:]), expected)
+
+    def test_validate_file(self):
+        checksum = hashlib.md5('foo').hexdigest()
+
+        self.assertEqual(validate_file(self.fname, 'Plain Text File', checksum, 'MD5'), (3, []))
+
+        size, failures = validate_file(self.fname, 'Rich Text Format', 'abc', 'MD5')
+        self.assertEqual(size, 3)
+        self.assertEqual([f[:3] for f in failures], [
+            (FileValidationFailure.CHECKSUM, 'abc', checksum),
+            (FileValidationFailure.FORMAT, 'Rich Text Format', 'Plain Text File'),
+        ])
+
+    def test_validate_unknown_algorithm(self):
+        size, failures = validate_file(self.fname, 'Rich Text Format', 'abc', 'foo')
+
+        self.assertEqual(size, 3)
+        self.assertEqual([f[:3] for f in failures], [
+            (FileValidationFailure.CHECKSUM, 'abc', ''),
+            (FileValidationFailure.FORMAT, 'Rich Text Format', 'Plain Text File'),
+        ])
+        self.assertIn('Algorithm foo does not exist', failures[0][3])
+
+    def test_validate_missing_file(self):
+        size, failures = validate_file(os.path.join(self.datadir, 'missing.txt'), checksum='abc', algorithm='MD5')
+
+        self.assertEqual(size, 0)
+        self.assertEqual(failures[0][0], FileValidationFailure.MISSING)
+
+    def test_validate_files(self):
+        validation = FileValidation.objects.create(xmlfile='test.xml')
+        other = os.path.join(self.datadir, 'other.txt')
+        with open(other, 'w') as f:
+            f.write('bar')
+
+        failures = validate_files([
+            {'filename': self.fname, 'checksum': hashlib.md5('foo').hexdigest(), 'algorithm': 'MD5'},
+            {'filename': other, 'checksum': 'abc', 'algorithm': 'MD5', 'format_name': 'Rich Text Format'},
+        ], str(validation.pk))
+
+        self.assertEqual(len(failures), 2)
+
+        validation.refresh_from_db()
+        self.assertEqual(validation.file_count, 2)
+        self.assertEqual(validation.failed_count, 1)
+        self.assertEqual(validation.bytes_read, 6)
+        self.assertEqual(
+            list(validation.failures.values_list('filename', 'validator')),
+            [(other, FileValidationFailure.CHECKSUM), (other, FileValidationFailure.FORMAT)],
+        )
+
+    def test_validate_batch_again(self):
+        validation = FileValidation.objects.create(xmlfile='test.xml')
+        files = [{'filename': self.fname, 'checksum': 'abc', 'algorithm': 'MD5'}]
+
+        validate_files(files, str(validation.pk), 0)
+        validate_files(files, str(validation.pk), 1)
+        validate_files(files, str(validation.pk), 0)
+
+        validation.refresh_from_db()
+        self.assertEqual(validation.file_count, 2)
+        self.assertEqual(validation.failed_count, 2)
+        self.assertEqual(validation.bytes_read, 6)
+        self.assertEqual(validation.failures.count(), 2)
+
+        files[0]['checksum'] = hashlib.md5('foo').hexdigest()
+        self.assertEqual(validate_files(files, str(validation.pk), 0), [])
+
+        validation.refresh_from_db()
+        self.assertEqual(validation.file_count, 2)
+        self.assertEqual(validation.failed_count, 1)
+        self.assertEqual(validation.bytes_read, 6)
+        self.assertEqual(list(validation.failures.values_list('batch__batch', flat=True)), [1])
+
+
+class ValidateFilesTestCase(TransactionTestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.datadir)
+        self.ip = InformationPackage.objects.create()
+        self.xmlfile = os.path.join(self.datadir, 'test.xml')
+
+        files = []
+        for i in range(3):
+            with open(os.path.join(self.datadir, '%d.txt' % i), 'w') as f:
+                f.write('%d' % i)
+
+            files.append(
+                '<file CHECKSUM="%s" CHECKSUMTYPE="MD5" FILEFORMATNAME="Plain Text File">'
+                '<FLocat href="%d.txt"/></file>' % (hashlib.md5('%d' % i).hexdigest(), i)
+            )
+
+        with open(self.xmlfile, 'w') as f:
+            f.write('<root>%s</root>' % ''.join(files))
+
+    def run_task(self):
+        return ProcessTask.objects.create(
+            name='ESSArch_Core.tasks.ValidateFiles',
+            params={'ip': self.ip.pk, 'xmlfile': self.xmlfile, 'rootdir': self.datadir},
+        ).run().get()
+
+    @override_settings(FILE_VALIDATION_BATCH_SIZE=2)
+    def test_one_task_per_batch(self):
+        res = self.run_task()
+
+        self.assertItemsEqual(res, [os.path.join(self.datadir, '%d.txt' % i) for i in range(3)])
+
+        step = ProcessStep.objects.get(name='Validate Files')
+        self.assertEqual(step.tasks.filter(name='ESSArch_Core.tasks.ValidateFileBatch').count(), 2)
+        self.assertEqual(step.tasks.count(), 2)
+
+        validation = FileValidation.objects.get(information_package=self.ip)
+        self.assertEqual(validation.file_count, 3)
+        self.assertEqual(validation.failed_count, 0)
+        self.assertIsNotNone(validation.time_done)
+        self.assertFalse(validation.failures.exists())
+
+    def test_failures_are_recorded(self):
+        with open(os.path.join(self.datadir, '1.txt'), 'w') as f:
+            f.write('changed')
+
+        with self.assertRaisesRegexp(AssertionError, 'checksum for .*1.txt is not valid'):
+            self.run_task()
+
+        validation = FileValidation.objects.get(information_package=self.ip)
+        self.assertEqual(validation.file_count, 3)
+        self.assertEqual(validation.failed_count, 1)
+        self.assertIsNotNone(validation.time_done)
+
+        failure = validation.failures.get()
+        self.assertEqual(failure.filename, os.path.join(self.datadir, '1.txt'))
+        self.assertEqual(failure.validator, FileValidationFailure.CHECKSUM)
+        self.assertEqual(failure.expected, hashlib.md5('1').hexdigest())
+        self.assertEqual(failure.actual, hashlib.md5('changed').hexdigest())
+
+    def test_retried_batch(self):
+        with open(os.path.join(self.datadir, '1.txt'), 'w') as f:
+            f.write('changed')
+
+        with self.assertRaises(AssertionError):
+            self.run_task()
+
+        with open(os.path.join(self.datadir, '1.txt'), 'w') as f:
+            f.write('1')
+
+        ProcessTask.objects.get(name='ESSArch_Core.tasks.ValidateFileBatch').retry()
+
+        validation = FileValidation.objects.get(information_package=self.ip)
+        self.assertEqual(validation.file_count, 3)
+        self.assertEqual(validation.failed_count, 0)
+        self.assertFalse(validation.failures.exists())
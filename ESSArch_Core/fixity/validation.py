@@ -0,0 +1,255 @@
+"""
+    ESSArch is an open source archiving and digital preservation system
+
+    ESSArch Core
+    Copyright (C) 2005-2017 ES Solutions AB
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+    Contact information:
+    Web - http://www.essolutions.se
+    Email - essarch@essolutions.se
+"""
+
+from __future__ import absolute_import
+
+import os
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from fido.fido import Fido
+
+from ESSArch_Core.ip.models import FileValidation, FileValidationBatch, FileValidationFailure
+from ESSArch_Core.util import alg_from_str
+
+_local = threading.local()
+
+
+def get_batch_size():
+    return max(getattr(settings, 'FILE_VALIDATION_BATCH_SIZE', 100) or 1, 1)
+
+
+def get_fido():
+    """
+    Gets a Fido instance for the current thread, loading the signatures
+    takes a while and the instance keeps the state of the current file
+    """
+
+    try:
+        return _local.fido
+    except AttributeError:
+        _local.fido = Fido(quiet=True)
+        return _local.fido
+
+
+def read_file(filename, algorithms=(), bufsize=None):
+    """
+    Reads the file once, calculating the checksums with the given
+    algorithms and keeping the buffers needed to identify its format. Without
+    any algorithms only the first and the last bufsize bytes are read.
+
+    Returns:
+        A dict with the hexadecimal digest of each algorithm, the first and
+        the last bufsize bytes of the file and the size of the file
+    """
+
+    if bufsize is None:
+        bufsize = get_fido().bufsize
+
+    hashes = dict((alg, alg_from_str(alg)()) for alg in set(algorithms))
+    bof = None
+    previous = last = b''
+    size = 0
+
+    with open(filename, 'rb') as f:
+        if not hashes:
+            bof = f.read(bufsize)
+            size = os.fstat(f.fileno()).st_size
+
+            if size > len(bof):
+                f.seek(max(size - bufsize, len(bof)))
+                eof = (bof + f.read())[-bufsize:]
+            else:
+                eof = bof[-bufsize:]
+
+            return {}, bof, eof, size
+
+        for data in iter(lambda: f.read(bufsize), b''):
+            for h in hashes.values():
+                h.update(data)
+
+            if bof is None:
+                bof = data
+
+            previous, last = last, data
+            size += len(data)
+
+    bof = bof or b''
+    eof = (previous + last)[-bufsize:]
+    digests = dict((alg, h.hexdigest()) for alg, h in hashes.items())
+    return digests, bof, eof, size
+
+
+def identify_format(filename, bof, eof, size):
+    """
+    Identifies the format of a file from the buffers returned by read_file,
+    the same way as the IdentifyFileFormat task. Containers are identified
+    by reading the file again.
+
+    Returns:
+        A tuple with the format name, version and registry key
+    """
+
+    fid = get_fido()
+    identified = []
+
+    def handle_matches(fullname, matches, delta_t, matchtype=''):
+        identified[:] = matches
+
+    fid.handle_matches = handle_matches
+    fid.current_file = filename
+    fid.current_filesize = size
+
+    matches = fid.match_formats(bof, eof)
+
+    if fid.container_type(matches) in ('zip', 'ole'):
+        fid.identify_file(filename)
+        matches = identified
+    elif not matches or size == 0:
+        matches = fid.match_extensions(filename)
+
+    if not matches:
+        raise ValueError("No matches for %s" % filename)
+
+    f = matches[-1][0]
+    return tuple(
+        el.text if el is not None else None
+        for el in (f.find('name'), f.find('version'), f.find('puid'))
+    )
+
+
+def validate_file(filename, format_name=None, checksum=None, algorithm=None):
+    """
+    Validates the format and checksum of a file, reading it once
+
+    Returns:
+        The number of bytes read and a list of (validator, expected, actual,
+        message) tuples of the checks that failed
+    """
+
+    algorithms = []
+    failures = []
+
+    if checksum is not None:
+        try:
+            alg_from_str(algorithm)
+        except KeyError as e:
+            failures.append((
+                FileValidationFailure.CHECKSUM, checksum, '',
+                "checksum for %s could not be validated: %s" % (filename, e.args[0]),
+            ))
+        else:
+            algorithms.append(algorithm)
+
+    try:
+        digests, bof, eof, size = read_file(filename, algorithms)
+    except IOError as e:
+        return 0, [(FileValidationFailure.MISSING, '', '', "%s could not be read: %s" % (filename, e))]
+
+    if algorithms and digests[algorithm] != checksum:
+        failures.append((
+            FileValidationFailure.CHECKSUM, checksum, digests[algorithm],
+            "checksum for %s is not valid (%s != %s)" % (filename, digests[algorithm], checksum),
+        ))
+
+    if format_name:
+        try:
+            actual_format_name = identify_format(filename, bof, eof, size)[0]
+        except ValueError as e:
+            failures.append((FileValidationFailure.FORMAT, format_name, '', str(e)))
+        else:
+            if actual_format_name != format_name:
+                failures.append((
+                    FileValidationFailure.FORMAT, format_name, actual_format_name or '',
+                    "format name for %s is not valid, (%s != %s)" % (filename, format_name, actual_format_name),
+                ))
+
+    return size, failures
+
+
+def validate_files(files, validation=None, batch=0):
+    """
+    Validates a batch of files and records the outcome. Validating the same
+    batch again replaces the outcome of the previous validation of the batch.
+
+    Args:
+        files: Dicts with the filename and optionally the format_name,
+            checksum and algorithm of each file
+        validation: The primary key of the FileValidation to record the
+            outcome in
+        batch: The number of the batch in the validation
+
+    Returns:
+        The FileValidationFailure objects of the files that failed
+    """
+
+    failures = []
+    bytes_read = 0
+    failed_count = 0
+
+    for f in files:
+        size, file_failures = validate_file(
+            f['filename'], f.get('format_name'), f.get('checksum'), f.get('algorithm')
+        )
+        bytes_read += size
+
+        if file_failures:
+            failed_count += 1
+
+        failures.extend(
+            FileValidationFailure(
+                validation_id=validation, filename=f['filename'], validator=validator,
+                expected=expected, actual=actual, message=message,
+            ) for validator, expected, actual, message in file_failures
+        )
+
+    if validation is not None:
+        with transaction.atomic():
+            record, _ = FileValidationBatch.objects.select_for_update().get_or_create(
+                validation_id=validation, batch=batch,
+            )
+            record.failures.all().delete()
+
+            # other batches are recorded concurrently, only the difference
+            # from the previous outcome of this batch is applied
+            FileValidation.objects.filter(pk=validation).update(
+                file_count=F('file_count') + len(files) - record.file_count,
+                failed_count=F('failed_count') + failed_count - record.failed_count,
+                bytes_read=F('bytes_read') + bytes_read - record.bytes_read,
+            )
+
+            record.file_count = len(files)
+            record.failed_count = failed_count
+            record.bytes_read = bytes_read
+            record.save()
+
+            for failure in failures:
+                failure.batch = record
+
+            FileValidationFailure.objects.bulk_create(failures)
+
+    return failures
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class IPConfig(AppConfig):
+    name = 'ESSArch_Core.ip'
+    label = 'ip'
+
+    def ready(self):
+        import ESSArch_Core.ip.signals  # noqa
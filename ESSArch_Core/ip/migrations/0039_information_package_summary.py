@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-19 17:51
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ip', '0038_auto_20170608_1329'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InformationPackageSummary',
+            fields=[
+                ('ip', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='ip.InformationPackage')),
+                ('step_state', models.CharField(default=b'PENDING', max_length=50)),
+                ('step_progress', models.FloatField(default=0)),
+                ('profile_progress', models.FloatField(default=0)),
+                ('time_updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-19 18:38
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WorkflowEngine', '0067_task_archive'),
+        ('ip', '0039_information_package_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileValidation',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('xmlfile', models.TextField()),
+                ('file_count', models.IntegerField(default=0)),
+                ('failed_count', models.IntegerField(default=0)),
+                ('bytes_read', models.BigIntegerField(default=0)),
+                ('time_started', models.DateTimeField(auto_now_add=True)),
+                ('time_done', models.DateTimeField(null=True)),
+                ('information_package', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='file_validations', to='ip.InformationPackage')),
+                ('task', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='file_validations', to='WorkflowEngine.ProcessTask')),
+            ],
+            options={
+                'ordering': ['time_started'],
+            },
+        ),
+        migrations.CreateModel(
+            name='FileValidationFailure',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('filename', models.TextField()),
+                ('validator', models.CharField(choices=[(b'checksum', b'Checksum'), (b'format', b'Format'), (b'missing', b'Missing')], max_length=50)),
+                ('expected', models.TextField(blank=True)),
+                ('actual', models.TextField(blank=True)),
+                ('message', models.TextField()),
+                ('validation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='failures', to='ip.FileValidation')),
+            ],
+            options={
+                'ordering': ['filename'],
+            },
+        ),
+    ]
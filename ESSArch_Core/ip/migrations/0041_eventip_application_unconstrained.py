@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-19 19:20
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ip', '0040_file_validation'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='eventip',
+            name='eventApplication',
+            field=models.OneToOneField(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='event', to='WorkflowEngine.ProcessTask'),
+        ),
+    ]
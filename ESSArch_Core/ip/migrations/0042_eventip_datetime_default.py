@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-19 19:26
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ip', '0041_eventip_application_unconstrained'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='eventip',
+            name='eventDateTime',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
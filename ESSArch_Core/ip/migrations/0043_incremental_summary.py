@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-19 19:33
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def delete_summaries(apps, schema_editor):
+    # the existing summaries have no step counts, they are rebuilt from all
+    # steps the next time their IPs are updated
+    InformationPackageSummary = apps.get_model("ip", "InformationPackageSummary")
+    db_alias = schema_editor.connection.alias
+    InformationPackageSummary.objects.using(db_alias).all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WorkflowEngine', '0067_task_archive'),
+        ('ip', '0042_eventip_datetime_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InformationPackageStepState',
+            fields=[
+                ('step', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ip_state', serialize=False, to='WorkflowEngine.ProcessStep')),
+                ('status', models.CharField(max_length=50)),
+                ('progress', models.FloatField(default=0)),
+                ('ip', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='step_states', to='ip.InformationPackage')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='informationpackagesummary',
+            name='failed_steps',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='informationpackagesummary',
+            name='pending_steps',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='informationpackagesummary',
+            name='started_steps',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='informationpackagesummary',
+            name='step_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='informationpackagesummary',
+            name='step_progress_sum',
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunPython(delete_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-19 19:51
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ip', '0043_incremental_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileValidationBatch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch', models.IntegerField()),
+                ('file_count', models.IntegerField(default=0)),
+                ('failed_count', models.IntegerField(default=0)),
+                ('bytes_read', models.BigIntegerField(default=0)),
+                ('validation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='batches', to='ip.FileValidation')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='filevalidationfailure',
+            name='batch',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='failures', to='ip.FileValidationBatch'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='filevalidationbatch',
+            unique_together=set([('validation', 'batch')]),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-19 20:03
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ip', '0044_file_validation_batches'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='informationpackagesummary',
+            name='steps_dirty',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-19 20:15
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def clear_missing_applications(apps, schema_editor):
+    # events of archived or deleted tasks refer to tasks that no longer
+    # exist, archived tasks refer to their events instead
+    EventIP = apps.get_model("ip", "EventIP")
+    ProcessTask = apps.get_model("WorkflowEngine", "ProcessTask")
+    db_alias = schema_editor.connection.alias
+
+    EventIP.objects.using(db_alias).filter(eventApplication__isnull=False).exclude(
+        eventApplication__in=ProcessTask.objects.using(db_alias).values('pk'),
+    ).update(eventApplication=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WorkflowEngine', '0067_task_archive'),
+        ('ip', '0045_summary_steps_dirty'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_missing_applications, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='eventip',
+            name='eventApplication',
+            field=models.OneToOneField(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='event', to='WorkflowEngine.ProcessTask'),
+        ),
+    ]
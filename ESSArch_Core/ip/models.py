@@ -25,7 +25,6 @@
 from __future__ import division
 
 import datetime
-import mimetypes
 import os
 import re
 import tarfile
@@ -35,13 +34,15 @@ from operator import itemgetter
 
 from celery import states as celery_states
 
-from django.db import models
+from django.core.cache import cache
+from django.db import models, transaction
 from django.http.response import HttpResponse
+from django.utils import timezone
 
 from rest_framework import exceptions, filters, permissions, status
 from rest_framework.response import Response
 
-from ESSArch_Core.configuration.models import Path
+from ESSArch_Core.configuration.cache import get_mimetypes
 
 from ESSArch_Core.profiles.models import (
     SubmissionAgreement as SA,
@@ -58,6 +59,8 @@ from ESSArch_Core.util import (
 import math
 import uuid
 
+PROFILES_CACHE_KEY = '%s_profiles'
+
 MESSAGE_DIGEST_ALGORITHM_CHOICES = (
     ('MD5', 'MD5'),
     ('SHA-1', 'SHA-1'),
@@ -251,10 +254,45 @@ class InformationPackage(models.Model):
         if self.last_changed_local is not None and self.last_changed_external is not None:
             return (self.last_changed_local-self.last_changed_external).total_seconds() == 0
 
+    @property
+    def cache_profiles_key(self):
+        return PROFILES_CACHE_KEY % self.pk
+
+    def get_profile_rels(self):
+        """
+        Gets the profile relations of the IP and their profiles, by profile
+        type. They are all loaded with a single query and are then kept on
+        the IP and in the cache until the profiles of the IP are changed.
+        """
+
+        try:
+            return self._profile_rels
+        except AttributeError:
+            pass
+
+        rels = cache.get(self.cache_profiles_key)
+
+        if rels is None:
+            rels = {}
+
+            for rel in self.profileip_set.select_related('profile').order_by('pk'):
+                rels.setdefault(rel.profile.profile_type, rel)
+
+            cache.set(self.cache_profiles_key, rels)
+
+        self._profile_rels = rels
+        return rels
+
+    def clear_profile_cache(self):
+        cache.delete(self.cache_profiles_key)
+
+        try:
+            del self._profile_rels
+        except AttributeError:
+            pass
+
     def get_profile_rel(self, profile_type):
-        return self.profileip_set.filter(
-            profile__profile_type=profile_type
-        ).first()
+        return self.get_profile_rels().get(profile_type)
 
     def profile_locked(self, profile_type):
         rel = self.get_profile_rel(profile_type)
@@ -284,13 +322,17 @@ class InformationPackage(models.Model):
         except ProfileIP.DoesNotExist:
             ProfileIP.objects.create(ip=self, profile=new_profile)
 
+        self.clear_profile_cache()
+
     def unlock_profile(self, ptype):
         ProfileIP.objects.filter(
             ip=self, profile__profile_type=ptype
         ).update(LockedBy=None)
+        self.clear_profile_cache()
 
         self.state = 'Preparing'
         self.save(update_fields=['state'])
+        self.update_profile_progress()
 
     def get_container_format(self):
         try:
@@ -318,6 +360,178 @@ class InformationPackage(models.Model):
         except:
             return None
 
+    def get_summary(self):
+        """
+        Gets the precalculated state and progress of the IP, if any. The step
+        state and progress of the summary are outdated if steps_dirty is set
+        """
+
+        try:
+            return self.summary
+        except InformationPackageSummary.DoesNotExist:
+            return None
+
+    def calculate_step_state(self):
+        """
+        Calculates the state and progress of the IP based on its steps
+
+        Returns:
+            A tuple with the state and the progress
+        """
+
+        from ESSArch_Core.WorkflowEngine.util import get_step_states
+
+        pks = list(self.steps.values_list('pk', flat=True))
+        summary = InformationPackageSummary()
+
+        if pks:
+            for state in get_step_states(pks).itervalues():
+                summary.add_step(state['status'], state['progress'])
+
+        summary.update_step_state()
+        return summary.step_state, summary.step_progress
+
+    def calculate_profile_progress(self):
+        """
+        Calculates the progress of the IP while it is being prepared, based
+        on the submission agreement and the profiles locked to the IP
+        """
+
+        if not self.submission_agreement_locked:
+            return 33
+
+        progress = 66
+
+        try:
+            sa_profiles = ProfileSA.objects.filter(
+                submission_agreement=self.submission_agreement
+            )
+
+            ip_profiles_locked = ProfileIP.objects.filter(
+                ip=self, LockedBy__isnull=False,
+                profile__profile_type__in=sa_profiles.values(
+                    "profile__profile_type"
+                )
+            )
+
+            progress += math.ceil(ip_profiles_locked.count() * ((100-progress) / sa_profiles.count()))
+
+        except ZeroDivisionError:
+            pass
+
+        return progress
+
+    def lock(self):
+        """
+        Locks the IP until the end of the current transaction, used when
+        updating the summary of the IP since there might not be a summary to
+        lock yet
+        """
+
+        list(InformationPackage.objects.select_for_update().filter(pk=self.pk).values_list('pk', flat=True))
+
+    def update_summary(self):
+        """
+        Recalculates the state and progress of the IP from all of its steps
+        and profiles and stores them in its summary. Once there is a summary
+        it is kept up to date using update_step_summary and
+        update_profile_progress instead
+        """
+
+        from ESSArch_Core.WorkflowEngine.util import get_step_states
+
+        with transaction.atomic():
+            self.lock()
+
+            pks = list(self.steps.values_list('pk', flat=True))
+            states = get_step_states(pks) if pks else {}
+
+            summary = InformationPackageSummary(ip=self, profile_progress=self.calculate_profile_progress())
+
+            InformationPackageStepState.objects.filter(ip=self).delete()
+            InformationPackageStepState.objects.bulk_create([
+                InformationPackageStepState(step_id=pk, ip=self, status=s['status'], progress=s['progress'])
+                for pk, s in states.iteritems()
+            ])
+
+            for s in states.itervalues():
+                summary.add_step(s['status'], s['progress'])
+
+            summary.update_step_state()
+            summary.save()
+
+        self.summary = summary
+        return summary
+
+    def update_step_summary(self, steps):
+        """
+        Applies the changes of the state and progress of the given steps of
+        the IP to its summary, without recalculating any other steps. The
+        summary is recalculated from all steps if there is no summary or if
+        steps have been added since it was calculated.
+
+        Args:
+            steps: The ids of the changed steps
+        """
+
+        from ESSArch_Core.WorkflowEngine.util import get_step_states
+
+        with transaction.atomic():
+            self.lock()
+
+            summary = InformationPackageSummary.objects.filter(ip=self).first()
+            if summary is None or summary.steps_dirty:
+                return self.update_summary()
+
+            states = get_step_states(steps)
+            previous = dict(
+                (s.step_id, s) for s in InformationPackageStepState.objects.select_for_update().filter(step__in=steps)
+            )
+
+            for pk, state in states.iteritems():
+                step_state = previous.get(pk)
+
+                if step_state is None:
+                    step_state = InformationPackageStepState(step_id=pk, ip=self)
+                elif step_state.ip_id != self.pk:
+                    # the step has been moved from another IP
+                    InformationPackageSummary.objects.filter(ip=step_state.ip_id).update(steps_dirty=True)
+                    step_state.ip = self
+                else:
+                    if (step_state.status, step_state.progress) == (state['status'], state['progress']):
+                        continue
+
+                    summary.add_step(step_state.status, step_state.progress, -1)
+
+                step_state.status = state['status']
+                step_state.progress = state['progress']
+                step_state.save()
+
+                summary.add_step(state['status'], state['progress'])
+
+            summary.update_step_state()
+            summary.save()
+
+        self.summary = summary
+        return summary
+
+    def update_profile_progress(self):
+        """
+        Recalculates the profile progress of the IP and stores it in its
+        summary
+        """
+
+        summary = InformationPackageSummary.objects.filter(ip=self).first()
+
+        if summary is None:
+            return self.update_summary()
+
+        summary.profile_progress = self.calculate_profile_progress()
+        summary.save(update_fields=['profile_progress', 'time_updated'])
+
+        self.summary = summary
+        return summary
+
     @property
     def step_state(self):
         """
@@ -337,26 +551,16 @@ class InformationPackage(models.Model):
             * If a step has started, then STARTED.
             * If a step has failed, then FAILURE.
             * If all steps have succeeded, then SUCCESS.
-        """
 
-        steps = self.steps.all()
-        state = celery_states.SUCCESS
-
-        if not steps:
-            return celery_states.PENDING
+            The state is read from the summary of the IP if there is one
+        """
 
-        for step in steps:
-            step_status = step.status
+        summary = self.get_summary()
 
-            if step_status == celery_states.STARTED:
-                state = step_status
-            if (step_status == celery_states.PENDING and
-                    state != celery_states.STARTED):
-                state = step_status
-            if step_status == celery_states.FAILURE:
-                return step_status
+        if summary is not None and not summary.steps_dirty:
+            return summary.step_state
 
-        return state
+        return self.calculate_step_state()[0]
 
     def status(self):
         if self.state in ["Prepared", "Uploaded", "Created", "Submitted", "Received", "Transferred", 'Archived']:
@@ -366,49 +570,23 @@ class InformationPackage(models.Model):
             if not self.submission_agreement_locked:
                 return 33
 
-            progress = 66
+            summary = self.get_summary()
 
-            try:
-                sa_profiles = ProfileSA.objects.filter(
-                    submission_agreement=self.submission_agreement
-                )
+            if summary is not None:
+                return summary.profile_progress
 
-                ip_profiles_locked = ProfileIP.objects.filter(
-                    ip=self, LockedBy__isnull=False,
-                    profile__profile_type__in=sa_profiles.values(
-                        "profile__profile_type"
-                    )
-                )
-
-                progress += math.ceil(ip_profiles_locked.count() * ((100-progress) / sa_profiles.count()))
-
-            except ZeroDivisionError:
-                pass
-
-            return progress
+            return self.calculate_profile_progress()
 
         if self.state in ["Uploading", "Creating", "Submitting", "Receiving", "Transferring"]:
-            steps = self.steps.all()
+            summary = self.get_summary()
 
-            if steps:
-                try:
-                    progress = sum([s.progress for s in steps])
-                    return progress / len(steps)
-                except:
-                    return 0
+            if summary is not None and not summary.steps_dirty:
+                return summary.step_progress
 
-            return 0
+            return self.calculate_step_state()[1]
 
     def files(self, path=''):
-        mimetypes.suffix_map = {}
-        mimetypes.encodings_map = {}
-        mimetypes.types_map = {}
-        mimetypes.common_types = {}
-        mimetypes_file = Path.objects.get(
-            entity="path_mimetypes_definitionfile"
-        ).value
-        mimetypes.init(files=[mimetypes_file])
-        mtypes = mimetypes.types_map
+        mtypes = get_mimetypes()
 
         MAX_FILE_SIZE = 100000000 # 100 MB
 
@@ -605,6 +783,203 @@ class InformationPackage(models.Model):
         }
 
 
+class InformationPackageSummary(models.Model):
+    """
+    The state and progress of an IP, updated when the tasks of its steps
+    finish and when its profiles are locked or unlocked
+    """
+
+    ip = models.OneToOneField(
+        InformationPackage, on_delete=models.CASCADE, primary_key=True,
+        related_name='summary'
+    )
+    step_state = models.CharField(max_length=50, default=celery_states.PENDING)
+    step_progress = models.FloatField(default=0)
+    profile_progress = models.FloatField(default=0)
+    time_updated = models.DateTimeField(auto_now=True)
+
+    # the step state and progress are calculated from these, each step of
+    # the IP is counted using its InformationPackageStepState
+    step_count = models.IntegerField(default=0)
+    step_progress_sum = models.FloatField(default=0)
+    pending_steps = models.IntegerField(default=0)
+    started_steps = models.IntegerField(default=0)
+    failed_steps = models.IntegerField(default=0)
+
+    # set when steps or tasks are added to the IP, the summary is then
+    # recalculated from all steps on the next change of the state of a task
+    steps_dirty = models.BooleanField(default=False)
+
+    def __unicode__(self):
+        return unicode(self.ip_id)
+
+    def add_step(self, status, progress, count=1):
+        """
+        Adds a step with the given status and progress to the counts, or
+        removes it if count is -1
+        """
+
+        self.step_count += count
+        self.step_progress_sum += progress * count
+
+        if status == celery_states.PENDING:
+            self.pending_steps += count
+        elif status == celery_states.STARTED:
+            self.started_steps += count
+        elif status == celery_states.FAILURE:
+            self.failed_steps += count
+
+    def update_step_state(self):
+        if self.step_count <= 0:
+            self.step_state, self.step_progress = celery_states.PENDING, 0
+            return
+
+        self.step_progress = self.step_progress_sum / self.step_count
+
+        if self.failed_steps:
+            self.step_state = celery_states.FAILURE
+        elif self.started_steps:
+            self.step_state = celery_states.STARTED
+        elif self.pending_steps:
+            self.step_state = celery_states.PENDING
+        else:
+            self.step_state = celery_states.SUCCESS
+
+
+class InformationPackageStepState(models.Model):
+    """
+    The state and progress of a step as counted in the summary of its IP
+    """
+
+    step = models.OneToOneField(
+        'WorkflowEngine.ProcessStep', on_delete=models.CASCADE, primary_key=True,
+        related_name='ip_state'
+    )
+    ip = models.ForeignKey(
+        InformationPackage, on_delete=models.CASCADE,
+        related_name='step_states'
+    )
+    status = models.CharField(max_length=50)
+    progress = models.FloatField(default=0)
+
+    def __unicode__(self):
+        return unicode(self.step_id)
+
+
+def update_step_summaries(step):
+    """
+    Updates the summaries of the IPs of the step and its ancestors, since
+    the state of an IP depends on all of its steps, including the ancestors
+    of steps belonging to other IPs
+    """
+
+    steps = {}
+
+    while step is not None:
+        if step.information_package_id is not None:
+            steps.setdefault(step.information_package_id, []).append(step.pk)
+        step = step.parent_step
+
+    for ip in InformationPackage.objects.filter(pk__in=steps.keys()):
+        ip.update_step_summary(steps[ip.pk])
+
+
+def invalidate_step_summaries(step):
+    """
+    Marks the step state of the summaries of the IPs of the step and its
+    ancestors as outdated, used when steps and tasks are created so that
+    creating many of them only costs a single update each
+    """
+
+    ips = set()
+
+    while step is not None:
+        if step.information_package_id is not None:
+            ips.add(step.information_package_id)
+        step = step.parent_step
+
+    if ips:
+        InformationPackageSummary.objects.filter(ip__in=ips, steps_dirty=False).update(steps_dirty=True)
+
+
+class FileValidation(models.Model):
+    """
+    The outcome of a validation of the files referenced in a document, the
+    files that failed are stored as FileValidationFailure objects
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    information_package = models.ForeignKey(
+        InformationPackage, on_delete=models.CASCADE, null=True,
+        related_name='file_validations'
+    )
+    task = models.ForeignKey(
+        'WorkflowEngine.ProcessTask', on_delete=models.SET_NULL, null=True,
+        related_name='file_validations'
+    )
+    xmlfile = models.TextField()
+    file_count = models.IntegerField(default=0)
+    failed_count = models.IntegerField(default=0)
+    bytes_read = models.BigIntegerField(default=0)
+    time_started = models.DateTimeField(auto_now_add=True)
+    time_done = models.DateTimeField(null=True)
+
+    class Meta:
+        ordering = ['time_started']
+
+    def __unicode__(self):
+        return '%s (%s)' % (self.xmlfile, self.id)
+
+
+class FileValidationBatch(models.Model):
+    """
+    The outcome of a batch of files in a file validation, the counts of the
+    file validation are the sums of the counts of its batches
+    """
+
+    validation = models.ForeignKey(FileValidation, on_delete=models.CASCADE, related_name='batches')
+    batch = models.IntegerField()
+    file_count = models.IntegerField(default=0)
+    failed_count = models.IntegerField(default=0)
+    bytes_read = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('validation', 'batch')
+
+    def __unicode__(self):
+        return '%s (%d)' % (self.validation_id, self.batch)
+
+
+class FileValidationFailure(models.Model):
+    """
+    A file that failed a check during a file validation
+    """
+
+    CHECKSUM = 'checksum'
+    FORMAT = 'format'
+    MISSING = 'missing'
+
+    VALIDATOR_CHOICES = (
+        (CHECKSUM, 'Checksum'),
+        (FORMAT, 'Format'),
+        (MISSING, 'Missing'),
+    )
+
+    validation = models.ForeignKey(FileValidation, on_delete=models.CASCADE, related_name='failures')
+    batch = models.ForeignKey(FileValidationBatch, on_delete=models.CASCADE, null=True, related_name='failures')
+    filename = models.TextField()
+    validator = models.CharField(max_length=50, choices=VALIDATOR_CHOICES)
+    expected = models.TextField(blank=True)
+    actual = models.TextField(blank=True)
+    message = models.TextField()
+
+    class Meta:
+        ordering = ['filename']
+
+    def __unicode__(self):
+        return self.message
+
+
 class InformationPackageMetadata(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     ip = models.ForeignKey(InformationPackage, on_delete=models.PROTECT)
@@ -640,11 +1015,11 @@ class EventIP(models.Model):
         'configuration.EventType',
         on_delete=models.CASCADE
     )
-    eventDateTime = models.DateTimeField(auto_now_add=True)
+    eventDateTime = models.DateTimeField(default=timezone.now)
     eventApplication = models.OneToOneField(
-        'WorkflowEngine.ProcessTask', on_delete=models.CASCADE, null=True,
+        'WorkflowEngine.ProcessTask', on_delete=models.SET_NULL, null=True,
         related_name='event',
-    ) # The task that generated the event
+    ) # The task that generated the event, see ArchivedProcessTask.event once it is archived
     eventVersion = models.CharField(max_length=255) # The version number of the application (from versioneer)
     eventOutcome = models.IntegerField(choices=OUTCOME_CHOICES, null=True, default=None) # Success (0) or Fail (1)
     eventOutcomeDetailNote = models.CharField(max_length=1024) # Result or traceback from IP
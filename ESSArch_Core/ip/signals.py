@@ -0,0 +1,72 @@
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from ESSArch_Core.ip.models import (
+    PROFILES_CACHE_KEY,
+    InformationPackage,
+    InformationPackageSummary,
+    invalidate_step_summaries,
+)
+from ESSArch_Core.profiles.models import Profile, ProfileIP
+from ESSArch_Core.WorkflowEngine.models import ProcessStep, ProcessTask
+
+# the fields of the IP that the profile progress depends on
+SUMMARY_FIELDS = {'submission_agreement', 'submission_agreement_locked'}
+
+
+def delete_summary(ip_id):
+    # deletes can be part of deleting the IP itself, the summary is instead
+    # recalculated the next time the IP is updated
+    InformationPackageSummary.objects.filter(ip=ip_id).delete()
+
+
+@receiver(post_save, sender=InformationPackage)
+def ip_post_save(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        instance.update_summary()
+    elif update_fields is None or SUMMARY_FIELDS.intersection(update_fields):
+        instance.update_profile_progress()
+
+
+@receiver(post_save, sender=Profile)
+def profile_post_save(sender, instance, created, **kwargs):
+    if not created:
+        keys = [PROFILES_CACHE_KEY % ip for ip in ProfileIP.objects.filter(
+            profile=instance
+        ).values_list('ip', flat=True)]
+
+        if keys:
+            cache.delete_many(keys)
+
+
+@receiver(post_save, sender=ProfileIP)
+def profile_ip_post_save(sender, instance, created, **kwargs):
+    instance.ip.clear_profile_cache()
+    instance.ip.update_profile_progress()
+
+
+@receiver(post_delete, sender=ProfileIP)
+def profile_ip_post_delete(sender, instance, **kwargs):
+    cache.delete(PROFILES_CACHE_KEY % instance.ip_id)
+    delete_summary(instance.ip_id)
+
+
+@receiver(post_save, sender=ProcessStep)
+def step_post_save(sender, instance, created, **kwargs):
+    if instance.information_package_id is not None or instance.parent_step_id is not None:
+        invalidate_step_summaries(instance)
+
+
+@receiver(post_save, sender=ProcessTask)
+def task_post_save(sender, instance, created, **kwargs):
+    # a new task can change the state of its step, changes of existing
+    # tasks are applied by the task itself when its state changes
+    if created and instance.processstep_id is not None:
+        invalidate_step_summaries(instance.processstep)
+
+
+@receiver(post_delete, sender=ProcessStep)
+def step_post_delete(sender, instance, **kwargs):
+    if instance.information_package_id is not None:
+        delete_summary(instance.information_package_id)
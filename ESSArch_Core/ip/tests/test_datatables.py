@@ -0,0 +1,135 @@
+"""
+    ESSArch is an open source archiving and digital preservation system
+
+    ESSArch Core
+    Copyright (C) 2005-2017 ES Solutions AB
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+    Contact information:
+    Web - http://www.essolutions.se
+    Email - essarch@essolutions.se
+"""
+
+import json
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework.test import APIRequestFactory
+
+from ESSArch_Core.configuration.models import EventType
+from ESSArch_Core.ip.models import EventIP, InformationPackage
+from ESSArch_Core.views.datatables import DatatableBaseView, get_column_plan
+from ESSArch_Core.WorkflowEngine.models import ProcessStep
+
+
+class EventDatatable(DatatableBaseView):
+    model = EventIP
+    columns = ['eventType.eventDetail', 'linkingObjectIdentifierValue.label', 'eventOutcome']
+    order_columns = columns
+
+
+class StepDatatable(DatatableBaseView):
+    model = ProcessStep
+    columns = ['name', 'child_steps']
+    order_columns = columns
+
+
+class test_column_plan(TestCase):
+    def test_related_fields(self):
+        select, prefetch, only = get_column_plan(EventIP, EventDatatable.columns)
+
+        self.assertEqual(select, {'eventType', 'linkingObjectIdentifierValue'})
+        self.assertEqual(prefetch, set())
+        self.assertEqual(only, {'eventType__eventDetail', 'linkingObjectIdentifierValue__label', 'eventOutcome'})
+
+    def test_related_managers(self):
+        select, prefetch, only = get_column_plan(ProcessStep, StepDatatable.columns)
+
+        self.assertEqual(select, set())
+        self.assertIn('child_steps', prefetch)
+        self.assertIn('child_steps__child_steps', prefetch)
+        self.assertEqual(only, {'name'})
+
+    def test_unknown_column(self):
+        select, prefetch, only = get_column_plan(EventIP, ['eventType.eventDetail', 'foo'])
+
+        self.assertEqual(select, {'eventType'})
+        self.assertIsNone(only)
+
+
+class test_datatable_view(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+
+    def get(self, view, **params):
+        params.setdefault('draw', 1)
+        response = view.as_view()(self.factory.get('/', params))
+        self.assertEqual(response.status_code, 200)
+        return json.loads(''.join(response.streaming_content))
+
+    def create_events(self, count):
+        event_type = EventType.objects.get_or_create(eventType=1, eventDetail='foo')[0]
+
+        for i in range(count):
+            ip = InformationPackage.objects.create(label='ip %d' % i)
+            EventIP.objects.create(eventType=event_type, linkingObjectIdentifierValue=ip, eventOutcome=0)
+
+    def test_related_columns(self):
+        self.create_events(2)
+
+        # total count, filtered count and the rows
+        with self.assertNumQueries(3):
+            data = self.get(EventDatatable)
+
+        self.create_events(10)
+
+        with self.assertNumQueries(3):
+            data = self.get(EventDatatable)
+
+        self.assertEqual(data['recordsTotal'], 12)
+        self.assertEqual(len(data['data']), 10)
+        self.assertEqual(data['data'][0]['eventType.eventDetail'], 'foo')
+        self.assertEqual(data['data'][0]['eventOutcome'], 'Success')
+
+    def test_related_managers(self):
+        for i in range(2):
+            ProcessStep.objects.create(name='step %d' % i, parent_step=ProcessStep.objects.create(name='parent %d' % i))
+
+        with CaptureQueriesContext(connection) as few:
+            self.get(StepDatatable)
+
+        for i in range(2, 10):
+            ProcessStep.objects.create(name='step %d' % i, parent_step=ProcessStep.objects.create(name='parent %d' % i))
+
+        with CaptureQueriesContext(connection) as many:
+            data = self.get(StepDatatable, length=-1)
+
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(len(data['data']), 20)
+
+        parent = [row for row in data['data'] if row['name'] == 'parent 0'][0]
+        self.assertEqual(parent['child_steps'], [{'name': 'step 0', 'child_steps': []}])
+
+    def test_streamed_in_chunks(self):
+        self.create_events(5)
+
+        class ChunkedEventDatatable(EventDatatable):
+            chunk_size = 2
+
+        data = self.get(ChunkedEventDatatable, length=-1)
+        self.assertEqual(len(data['data']), 5)
+        self.assertEqual(len(set(row['linkingObjectIdentifierValue.label'] for row in data['data'])), 5)
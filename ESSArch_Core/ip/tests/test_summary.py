@@ -0,0 +1,266 @@
+"""
+    ESSArch is an open source archiving and digital preservation system
+
+    ESSArch Core
+    Copyright (C) 2005-2017 ES Solutions AB
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+    Contact information:
+    Web - http://www.essolutions.se
+    Email - essarch@essolutions.se
+"""
+
+import mock
+
+from celery import states as celery_states
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError
+from django.test import TestCase, override_settings
+
+from ESSArch_Core.ip.models import InformationPackage, InformationPackageStepState, InformationPackageSummary
+from ESSArch_Core.profiles.models import Profile, ProfileIP, ProfileSA, SubmissionAgreement
+from ESSArch_Core.WorkflowEngine.models import ProcessStep, ProcessTask
+from ESSArch_Core.WorkflowEngine.util import get_step_states
+
+
+@override_settings(CELERY_ALWAYS_EAGER=True, CELERY_EAGER_PROPAGATES_EXCEPTIONS=True)
+class InformationPackageSummaryTestCase(TestCase):
+    def setUp(self):
+        self.ip = InformationPackage.objects.create(state='Creating')
+
+    def get_summary(self):
+        return InformationPackageSummary.objects.get(ip=self.ip)
+
+    def test_created_with_ip(self):
+        summary = self.get_summary()
+
+        self.assertEqual(summary.step_state, celery_states.PENDING)
+        self.assertEqual(summary.step_progress, 0)
+        self.assertEqual(summary.profile_progress, 33)
+
+    def test_new_step(self):
+        step = ProcessStep.objects.create(information_package=self.ip)
+        ProcessTask.objects.create(
+            name="ESSArch_Core.WorkflowEngine.tests.tasks.First",
+            processstep=step,
+        )
+        ProcessStep.objects.create(information_package=self.ip)
+
+        self.assertTrue(self.get_summary().steps_dirty)
+
+        ip = InformationPackage.objects.get(pk=self.ip.pk)
+        self.assertEqual(ip.step_state, celery_states.PENDING)
+
+    def test_creating_tasks_does_not_calculate_steps(self):
+        step = ProcessStep.objects.create(information_package=self.ip)
+        child = ProcessStep.objects.create(parent_step=step)
+
+        with mock.patch('ESSArch_Core.WorkflowEngine.util.get_step_states') as states:
+            for i in range(3):
+                ProcessTask.objects.create(
+                    name="ESSArch_Core.WorkflowEngine.tests.tasks.First",
+                    processstep=child,
+                )
+
+        states.assert_not_called()
+        self.assertTrue(self.get_summary().steps_dirty)
+
+    def test_recalculated_when_task_started(self):
+        step = ProcessStep.objects.create(information_package=self.ip)
+        task = ProcessTask.objects.create(
+            name="ESSArch_Core.WorkflowEngine.tests.tasks.First",
+            processstep=step,
+        )
+        ProcessStep.objects.create(information_package=self.ip)
+
+        task.run().get()
+
+        summary = self.get_summary()
+        self.assertFalse(summary.steps_dirty)
+        self.assertEqual(summary.step_count, 2)
+        self.assertEqual(summary.step_state, celery_states.SUCCESS)
+
+    def test_summary_failure_does_not_fail_task(self):
+        step = ProcessStep.objects.create(information_package=self.ip)
+        task = ProcessTask.objects.create(
+            name="ESSArch_Core.WorkflowEngine.tests.tasks.First",
+            params={'foo': 123}, processstep=step,
+        )
+
+        with mock.patch.object(InformationPackage, 'update_step_summary', side_effect=IntegrityError):
+            self.assertEqual(task.run().get(), 123)
+
+        task.refresh_from_db()
+        self.assertEqual(task.status, celery_states.SUCCESS)
+
+    def test_task_finished(self):
+        step = ProcessStep.objects.create(information_package=self.ip)
+        ProcessTask.objects.create(
+            name="ESSArch_Core.WorkflowEngine.tests.tasks.First",
+            params={'foo': 123}, processstep=step, information_package=self.ip,
+        )
+        ProcessTask.objects.create(
+            name="ESSArch_Core.WorkflowEngine.tests.tasks.First",
+            params={'foo': 456}, processstep=step, information_package=self.ip,
+        )
+
+        step.run().get()
+
+        summary = self.get_summary()
+        self.assertEqual(summary.step_state, celery_states.SUCCESS)
+        self.assertEqual(summary.step_progress, 100)
+
+    def test_task_failed_in_child_step(self):
+        step = ProcessStep.objects.create(information_package=self.ip)
+        child = ProcessStep.objects.create(parent_step=step)
+        ProcessTask.objects.create(
+            name="ESSArch_Core.WorkflowEngine.tests.tasks.Fail",
+            processstep=child,
+        )
+
+        with self.assertRaises(Exception):
+            step.run().get()
+
+        self.assertEqual(self.get_summary().step_state, celery_states.FAILURE)
+
+    def test_read_from_summary(self):
+        ProcessStep.objects.create(information_package=self.ip)
+        InformationPackageSummary.objects.filter(ip=self.ip).update(
+            step_state=celery_states.STARTED, step_progress=50, steps_dirty=False,
+        )
+
+        ip = InformationPackage.objects.select_related('summary').get(pk=self.ip.pk)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(ip.step_state, celery_states.STARTED)
+            self.assertEqual(ip.status(), 50)
+
+    def test_calculated_without_summary(self):
+        step = ProcessStep.objects.create(information_package=self.ip)
+        ProcessTask.objects.create(
+            name="ESSArch_Core.WorkflowEngine.tests.tasks.First",
+            processstep=step, status=celery_states.STARTED, progress=50,
+        )
+        InformationPackageSummary.objects.all().delete()
+
+        ip = InformationPackage.objects.get(pk=self.ip.pk)
+        self.assertEqual(ip.step_state, celery_states.STARTED)
+        self.assertEqual(ip.status(), 50)
+
+    def test_step_deleted(self):
+        step = ProcessStep.objects.create(information_package=self.ip)
+        step.delete()
+
+        self.assertFalse(InformationPackageSummary.objects.filter(ip=self.ip).exists())
+
+        ip = InformationPackage.objects.get(pk=self.ip.pk)
+        self.assertEqual(ip.step_state, celery_states.PENDING)
+
+    def test_profile_locked(self):
+        user = User.objects.create(username='user')
+        sa = SubmissionAgreement.objects.create()
+        p1 = Profile.objects.create(profile_type='transfer_project')
+        p2 = Profile.objects.create(profile_type='submit_description')
+        ProfileSA.objects.create(profile=p1, submission_agreement=sa)
+        ProfileSA.objects.create(profile=p2, submission_agreement=sa)
+
+        self.ip.state = 'Preparing'
+        self.ip.submission_agreement = sa
+        self.ip.submission_agreement_locked = True
+        self.ip.save()
+        self.assertEqual(self.get_summary().profile_progress, 66)
+
+        ProfileIP.objects.create(ip=self.ip, profile=p1, LockedBy=user)
+        self.assertEqual(self.get_summary().profile_progress, 83)
+
+        ProfileIP.objects.create(ip=self.ip, profile=p2, LockedBy=user)
+        self.assertEqual(self.get_summary().profile_progress, 100)
+
+        self.ip.unlock_profile('submit_description')
+        self.assertEqual(self.get_summary().profile_progress, 83)
+
+        ip = InformationPackage.objects.get(pk=self.ip.pk)
+        self.assertEqual(ip.status(), 83)
+
+    def test_task_started(self):
+        step = ProcessStep.objects.create(information_package=self.ip)
+        task = ProcessTask.objects.create(
+            name="ESSArch_Core.WorkflowEngine.tests.tasks.First",
+            processstep=step,
+        )
+        states = []
+
+        def run(*args, **kwargs):
+            summary = self.get_summary()
+            states.append((summary.step_state, summary.started_steps))
+
+        with mock.patch('ESSArch_Core.WorkflowEngine.tests.tasks.First.run', side_effect=run):
+            task.run().get()
+
+        self.assertEqual(states, [(celery_states.STARTED, 1)])
+        self.assertEqual(self.get_summary().step_state, celery_states.SUCCESS)
+
+    def test_only_changed_steps_are_calculated(self):
+        done = ProcessStep.objects.create(information_package=self.ip)
+        step = ProcessStep.objects.create(information_package=self.ip)
+        task = ProcessTask.objects.create(
+            name="ESSArch_Core.WorkflowEngine.tests.tasks.First",
+            processstep=step,
+        )
+
+        summary = self.ip.update_summary()
+        self.assertEqual(summary.step_count, 2)
+        self.assertEqual(summary.step_state, celery_states.PENDING)
+        self.assertEqual(summary.step_progress, 50)
+
+        with mock.patch('ESSArch_Core.WorkflowEngine.util.get_step_states', wraps=get_step_states) as states:
+            task.run().get()
+
+        self.assertTrue(states.called)
+        for call in states.call_args_list:
+            self.assertNotIn(done.pk, call[0][0])
+
+        summary = self.get_summary()
+        self.assertEqual(summary.step_state, celery_states.SUCCESS)
+        self.assertEqual(summary.step_progress, 100)
+        self.assertEqual(summary.step_count, 2)
+        self.assertEqual(InformationPackageStepState.objects.get(step=step).status, celery_states.SUCCESS)
+
+    def test_rebuilt_without_summary(self):
+        step = ProcessStep.objects.create(information_package=self.ip)
+        task = ProcessTask.objects.create(
+            name="ESSArch_Core.WorkflowEngine.tests.tasks.First",
+            processstep=step,
+        )
+        InformationPackageSummary.objects.all().delete()
+
+        task.run().get()
+
+        summary = self.get_summary()
+        self.assertEqual(summary.step_state, celery_states.SUCCESS)
+        self.assertEqual(summary.step_count, 1)
+
+    def test_profile_change_does_not_calculate_steps(self):
+        ProcessStep.objects.create(information_package=self.ip)
+        sa = SubmissionAgreement.objects.create()
+
+        with mock.patch('ESSArch_Core.WorkflowEngine.util.get_step_states') as states:
+            self.ip.submission_agreement = sa
+            self.ip.submission_agreement_locked = True
+            self.ip.save()
+
+        states.assert_not_called()
+        self.assertEqual(self.get_summary().profile_progress, 66)
@@ -22,31 +22,161 @@
     Email - essarch@essolutions.se
 """
 
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models.sql.datastructures import EmptyResultSet
+from django.utils.functional import cached_property
+
 from rest_framework import pagination
 from rest_framework.response import Response
 
+DEFAULT_COUNT_TIMEOUT = 60  # seconds
+
+
+def get_count_timeout():
+    return getattr(settings, 'PAGINATION_COUNT_TIMEOUT', DEFAULT_COUNT_TIMEOUT)
+
+
+def get_count(queryset, exact=False):
+    """
+    Gets the number of rows in the queryset. Unless exact is set, the count
+    is cached for PAGINATION_COUNT_TIMEOUT seconds for each unique query,
+    i.e. for each combination of filters, and might therefore be slightly
+    out of date.
+    """
+
+    if exact or not hasattr(queryset, 'query'):
+        return queryset.count() if hasattr(queryset, 'count') else len(queryset)
+
+    try:
+        sql = unicode(queryset.query).encode('utf-8')
+    except EmptyResultSet:
+        return 0
+
+    key = 'pagination_count_%s' % hashlib.md5(sql).hexdigest()
+    count = cache.get(key)
+
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, get_count_timeout())
+
+    return count
+
+
+def is_exact_count_requested(request):
+    return request.query_params.get('exact_count') in ['True', 'true', '1']
+
+
+def get_link_header(next_url, previous_url):
+    if next_url is not None and previous_url is not None:
+        link = '<{next_url}>; rel="next", <{previous_url}>; rel="prev"'
+    elif next_url is not None:
+        link = '<{next_url}>; rel="next"'
+    elif previous_url is not None:
+        link = '<{previous_url}>; rel="prev"'
+    else:
+        link = ''
+
+    return link.format(next_url=next_url, previous_url=previous_url)
+
+
+class CachedCountPaginator(Paginator):
+    exact = False
+
+    @cached_property
+    def count(self):
+        return get_count(self.object_list, self.exact)
+
+
+class ExactCountPaginator(CachedCountPaginator):
+    exact = True
+
 
 class LinkHeaderPagination(pagination.PageNumberPagination):
+    """
+    Page number based pagination with the links to the next and previous
+    pages in the Link header and the total number of rows in the Count
+    header.
+
+    The count is exact unless cached_count is set on the view or the class.
+    A cached count also decides the number of pages and might therefore
+    hide new rows until it expires, "exact_count=true" can be passed in
+    the query string to always get an exact count.
+    """
+
     page_size_query_param = 'page_size'
+    cached_count = False
 
-    def get_paginated_response(self, data):
-        next_url = self.get_next_link()
-        previous_url = self.get_previous_link()
-
-        if next_url is not None and previous_url is not None:
-            link = '<{next_url}>; rel="next", <{previous_url}>; rel="prev"'
-        elif next_url is not None:
-            link = '<{next_url}>; rel="next"'
-        elif previous_url is not None:
-            link = '<{previous_url}>; rel="prev"'
+    def paginate_queryset(self, queryset, request, view=None):
+        cached = getattr(view, 'cached_count', self.cached_count)
+
+        if cached and not is_exact_count_requested(request):
+            self.django_paginator_class = CachedCountPaginator
         else:
-            link = ''
+            self.django_paginator_class = ExactCountPaginator
 
-        link = link.format(next_url=next_url, previous_url=previous_url)
+        return super(LinkHeaderPagination, self).paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        link = get_link_header(self.get_next_link(), self.get_previous_link())
         headers = {'Link': link, 'Count': self.page.paginator.count} if link else {}
 
         return Response(data, headers=headers)
 
+
+class LinkHeaderCursorPagination(pagination.CursorPagination):
+    """
+    Cursor based pagination with the same headers as LinkHeaderPagination.
+
+    Unlike page numbers, cursors don't use OFFSET and are therefore as fast
+    for the last page as for the first one. The rows are ordered by the
+    cursor_ordering attribute of the view, if any, otherwise by the ordering
+    of the class.
+    """
+
+    ordering = '-pk'
+    page_size_query_param = 'page_size'
+    max_page_size = None
+    exact_count = False
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                return pagination._positive_int(
+                    request.query_params[self.page_size_query_param],
+                    strict=True, cutoff=self.max_page_size
+                )
+            except (KeyError, ValueError):
+                pass
+
+        return self.page_size
+
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, 'cursor_ordering', None)
+
+        if ordering is not None:
+            return (ordering,) if isinstance(ordering, basestring) else tuple(ordering)
+
+        return super(LinkHeaderCursorPagination, self).get_ordering(request, queryset, view)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page = super(LinkHeaderCursorPagination, self).paginate_queryset(queryset, request, view)
+
+        if page is not None:
+            self.count = get_count(queryset, self.exact_count or is_exact_count_requested(request))
+
+        return page
+
+    def get_paginated_response(self, data):
+        link = get_link_header(self.get_next_link(), self.get_previous_link())
+        headers = {'Link': link, 'Count': self.count} if link else {}
+
+        return Response(data, headers=headers)
+
+
 class NoPagination(pagination.BasePagination):
     display_page_controls = False
 
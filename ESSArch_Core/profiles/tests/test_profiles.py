@@ -22,10 +22,11 @@
     Email - essarch@essolutions.se
 """
 
+from django.contrib.auth.models import User
 from django.test import TestCase
 
 from ESSArch_Core.ip.models import InformationPackage
-from ESSArch_Core.profiles.models import Profile, ProfileSA, SubmissionAgreement
+from ESSArch_Core.profiles.models import Profile, ProfileIP, ProfileSA, SubmissionAgreement
 
 
 class SubmissionAgreementTestCase(TestCase):
@@ -43,3 +44,67 @@ class SubmissionAgreementTestCase(TestCase):
         self.assertEqual(new.name, name)
         self.assertEqual(new.archivist_organization, data['archivist_organization'])
         self.assertTrue(ProfileSA.objects.filter(submission_agreement=new, profile=profile).exists())
+
+
+class ProfileIPTestCase(TestCase):
+    def setUp(self):
+        self.ip = InformationPackage.objects.create()
+        self.transfer_project = Profile.objects.create(
+            profile_type='transfer_project',
+            specification_data={'container_format': 'zip'},
+        )
+        self.sip = Profile.objects.create(profile_type='sip')
+
+        ProfileIP.objects.create(ip=self.ip, profile=self.transfer_project)
+        ProfileIP.objects.create(ip=self.ip, profile=self.sip)
+
+    def test_fill_specification_data(self):
+        ip = InformationPackage.objects.get(pk=self.ip.pk)
+
+        with self.assertNumQueries(1):
+            data = self.sip.fill_specification_data(ip=ip)
+
+        self.assertEqual(data['_PROFILE_TRANSFER_PROJECT_ID'], str(self.transfer_project.pk))
+        self.assertEqual(data['_PROFILE_SIP_ID'], str(self.sip.pk))
+        self.assertNotIn('_PROFILE_AIP_ID', data)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(ip.get_container_format(), 'zip')
+            self.assertFalse(ip.profile_locked('sip'))
+
+    def test_shared_between_instances(self):
+        InformationPackage.objects.get(pk=self.ip.pk).get_profile_rels()
+        ip = InformationPackage.objects.get(pk=self.ip.pk)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(ip.get_profile('sip'), self.sip)
+
+    def test_change_profile(self):
+        self.ip.get_profile_rels()
+
+        new = Profile.objects.create(profile_type='sip')
+        self.ip.change_profile(new)
+
+        self.assertEqual(self.ip.get_profile('sip'), new)
+        self.assertEqual(InformationPackage.objects.get(pk=self.ip.pk).get_profile('sip'), new)
+
+    def test_lock_and_unlock(self):
+        user = User.objects.create(username='user')
+        self.ip.get_profile_rels()
+
+        ProfileIP.objects.get(ip=self.ip, profile=self.sip).lock(user)
+        self.assertTrue(InformationPackage.objects.get(pk=self.ip.pk).profile_locked('sip'))
+
+        self.ip.unlock_profile('sip')
+        self.assertFalse(self.ip.profile_locked('sip'))
+        self.assertFalse(InformationPackage.objects.get(pk=self.ip.pk).profile_locked('sip'))
+
+    def test_profile_changed(self):
+        ip = InformationPackage.objects.get(pk=self.ip.pk)
+        ip.get_profile_rels()
+
+        self.transfer_project.specification_data = {'container_format': 'tar'}
+        self.transfer_project.save()
+
+        ip = InformationPackage.objects.get(pk=self.ip.pk)
+        self.assertEqual(ip.get_container_format(), 'tar')
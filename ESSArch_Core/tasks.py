@@ -23,10 +23,10 @@
 """
 
 import errno
+import logging
 import os
 import shutil
 import tarfile
-import urllib
 import uuid
 import zipfile
 
@@ -40,6 +40,7 @@ from django.core.exceptions import ValidationError
 from django.core.mail import EmailMessage
 from django.conf import settings
 from django.db.models import F
+from django.utils import timezone
 
 from ESSArch_Core.util import (
     alg_from_str,
@@ -47,13 +48,16 @@ from ESSArch_Core.util import (
     get_tree_size_and_count,
 )
 
-from ESSArch_Core.configuration.models import Path
+from ESSArch_Core.configuration.cache import get_path
 from ESSArch_Core.essxml.Generator.xmlGenerator import (
     findElementWithoutNamespace,
     XMLGenerator
 )
+from ESSArch_Core.essxml.schemas import get_catalog, get_store, place as place_schema
 from ESSArch_Core.essxml.util import FILE_ELEMENTS, find_files, find_pointers, validate_against_schema
-from ESSArch_Core.ip.models import EventIP, InformationPackage
+from ESSArch_Core.fixity.comparison import compare_paths, iter_logical_paths, iter_physical_paths
+from ESSArch_Core.fixity.validation import get_batch_size, validate_files
+from ESSArch_Core.ip.models import EventIP, FileValidation, InformationPackage
 from ESSArch_Core.storage.models import StorageMedium, TapeDrive
 from ESSArch_Core.storage.tape import (
     DEFAULT_TAPE_BLOCK_SIZE,
@@ -75,10 +79,13 @@ from ESSArch_Core.WorkflowEngine.models import (
     ProcessStep,
     ProcessTask,
 )
+from ESSArch_Core.WorkflowEngine.archival import archive_tasks
 from ESSArch_Core.WorkflowEngine.dbtask import DBTask
 from ESSArch_Core.util import (
+    chunks,
     creation_date,
     find_destination,
+    flatten,
     get_value_from_path,
     remove_prefix,
     timestamp_to_datetime,
@@ -89,6 +96,8 @@ from fido.fido import Fido
 from lxml import etree
 from scandir import walk
 
+logger = logging.getLogger('code.exceptions')
+
 
 class CalculateChecksum(DBTask):
     queue = 'file_operation'
@@ -512,7 +521,7 @@ class CopySchemas(DBTask):
         """
 
         src, dst = self.createSrcAndDst(schema, root, structure)
-        urllib.urlretrieve(src, dst)
+        place_schema(src, dst)
 
     def undo(self, schema={}, root=None, structure=None):
         pass
@@ -589,8 +598,7 @@ class CreateZIP(DBTask):
 
 class ValidateFiles(DBTask):
     hidden = True
-    fileformat_task = "ESSArch_Core.tasks.ValidateFileFormat"
-    checksum_task = "ESSArch_Core.tasks.ValidateIntegrity"
+    batch_task = "ESSArch_Core.tasks.ValidateFileBatch"
 
     def run(self, ip=None, xmlfile=None, validate_fileformat=True, validate_integrity=True, rootdir=None):
         step = ProcessStep.objects.create(
@@ -599,42 +607,54 @@ class ValidateFiles(DBTask):
             parent_step_id=self.step
         )
 
+        validation = None
+
         if any([validate_fileformat, validate_integrity]):
             if rootdir is None:
                 rootdir = InformationPackage.objects.values_list('object_path', flat=True).get(pk=ip)
 
-            tasks = []
+            validation = FileValidation.objects.create(
+                information_package_id=ip, task_id=self.task_id, xmlfile=xmlfile,
+            )
+
+            files = []
 
             for f in find_files(xmlfile, rootdir):
+                checks = {}
+
                 if validate_fileformat and f.format is not None:
-                    tasks.append(ProcessTask(
-                        name=self.fileformat_task,
-                        params={
-                            "filename": os.path.join(rootdir, f.path),
-                            "format_name": f.format,
-                        },
-                        information_package_id=ip,
-                        responsible_id=self.responsible,
-                        processstep=step,
-                    ))
+                    checks['format_name'] = f.format
 
                 if validate_integrity and f.checksum is not None and f.checksum_type is not None:
-                    tasks.append(ProcessTask(
-                        name=self.checksum_task,
-                        params={
-                            "filename": os.path.join(rootdir, f.path),
-                            "checksum": f.checksum,
-                            "algorithm": f.checksum_type,
-                        },
-                        information_package_id=ip,
-                        responsible_id=self.responsible,
-                        processstep=step,
-                    ))
+                    checks['checksum'] = f.checksum
+                    checks['algorithm'] = f.checksum_type
+
+                if checks:
+                    checks['filename'] = os.path.join(rootdir, f.path)
+                    files.append(checks)
+
+            # each batch of files is validated by a single task, reading each
+            # file once for all checks
+            ProcessTask.objects.bulk_create([
+                ProcessTask(
+                    name=self.batch_task,
+                    params={
+                        "files": batch,
+                        "validation": str(validation.pk),
+                        "batch": i,
+                    },
+                    information_package_id=ip,
+                    responsible_id=self.responsible,
+                    processstep=step,
+                ) for i, batch in enumerate(chunks(files, get_batch_size()))
+            ])
 
-            ProcessTask.objects.bulk_create(tasks)
-
-        with allow_join_result():
-            return step.run().get()
+        try:
+            with allow_join_result():
+                return flatten(step.run().get())
+        finally:
+            if validation is not None:
+                FileValidation.objects.filter(pk=validation.pk).update(time_done=timezone.now())
 
     def undo(self, ip=None, xmlfile=None, validate_fileformat=True, validate_integrity=True, rootdir=None):
         pass
@@ -643,6 +663,37 @@ class ValidateFiles(DBTask):
         return "Validated files in %s" % xmlfile
 
 
+class ValidateFileBatch(DBTask):
+    queue = 'validation'
+
+    def run(self, files=[], validation=None, batch=0):
+        """
+        Validates the format and integrity of a batch of files, each file is
+        read once. All files are validated before the task fails if any of
+        them is invalid. A retried task replaces the outcome of the batch.
+
+        Args:
+            files: Dicts with the filename and optionally the format_name,
+                checksum and algorithm of each file
+            validation: The primary key of the FileValidation to record the
+                outcome in
+            batch: The number of the batch in the validation
+        """
+
+        failures = validate_files(files, validation, batch)
+
+        if failures:
+            raise AssertionError('\n'.join(failure.message for failure in failures))
+
+        return [f['filename'] for f in files]
+
+    def undo(self, files=[], validation=None, batch=0):
+        pass
+
+    def event_outcome_success(self, files=[], validation=None, batch=0):
+        return "Validated %d files" % len(files)
+
+
 class ValidateFileFormat(DBTask):
     queue = 'validation'
 
@@ -724,18 +775,22 @@ class ValidateIntegrity(DBTask):
 class ValidateXMLFile(DBTask):
     queue = 'validation'
 
-    def run(self, xml_filename=None, schema_filename=None, rootdir=None):
+    def run(self, xml_filename=None, schema_filename=None, rootdir=None, force=False):
         """
-        Validates (using LXML) an XML file using a specified schema file
+        Validates (using LXML) an XML file using a specified schema file. The
+        cached result of an earlier validation of the same content is used
+        unless force is true.
         """
 
-        assert validate_against_schema(xmlfile=xml_filename, schema=schema_filename, rootdir=rootdir)
+        assert validate_against_schema(
+            xmlfile=xml_filename, schema=schema_filename, rootdir=rootdir, parallel=True, force=force
+        )
         return "Success"
 
-    def undo(self, xml_filename=None, schema_filename=None, rootdir=None):
+    def undo(self, xml_filename=None, schema_filename=None, rootdir=None, force=False):
         pass
 
-    def event_outcome_success(self, xml_filename=None, schema_filename=None, rootdir=None):
+    def event_outcome_success(self, xml_filename=None, schema_filename=None, rootdir=None, force=False):
         return "Validated %s against schema" % xml_filename
 
 
@@ -744,9 +799,9 @@ class ValidateLogicalPhysicalRepresentation(DBTask):
     Validates the logical and physical representation of objects.
 
     The comparison checks if the lists contains the same elements (though not
-    the order of the elements).
-
-    See http://stackoverflow.com/a/7829388/1523238
+    the order of the elements). The paths are compared as sorted streams so
+    that the number of paths kept in memory is bounded, see
+    ESSArch_Core.fixity.comparison.
     """
 
     queue = 'validation'
@@ -758,31 +813,24 @@ class ValidateLogicalPhysicalRepresentation(DBTask):
         else:
             xmlrelpath = xmlfile
 
-        logical_files = find_files(xmlfile, rootdir)
-        physical_files = set()
+        def physical_files():
+            if dirname:
+                for relfile in iter_physical_paths(dirname, exclude=xmlrelpath):
+                    yield relfile
 
-        if dirname:
-            for root, dirs, filenames in walk(dirname):
-                for f in filenames:
-                    reldir = os.path.relpath(root, dirname)
-                    relfile = os.path.join(reldir, f)
-                    relfile = win_to_posix(relfile)
-                    relfile = remove_prefix(relfile, "./")
-
-                    if relfile != xmlrelpath:
-                        physical_files.add(relfile)
-
-        for f in files:
-            if files_reldir:
-                if f == files_reldir:
-                    physical_files.add(os.path.basename(f))
-                    continue
-
-                f = os.path.relpath(f, files_reldir)
-            physical_files.add(f)
-
-        assert logical_files == physical_files, "the logical representation differs from the physical"
-        return "Success"
+            for f in files:
+                if files_reldir:
+                    if f == files_reldir:
+                        yield os.path.basename(f)
+                        continue
+
+                    f = os.path.relpath(f, files_reldir)
+                yield f
+
+        report = compare_paths(iter_logical_paths(xmlfile, rootdir), physical_files())
+
+        assert report.is_valid(), str(report)
+        return report.to_dict()
 
     def undo(self, dirname=None, files=[], files_reldir=None, xmlfile=None, rootdir=''):
         pass
@@ -1078,19 +1126,35 @@ class DownloadSchemas(DBTask):
             )
             dirname = os.path.join(root, dirname)
 
+        catalog = get_catalog()
+        store = get_store()
+
         for schema in template.get('-schemasToPreserve', []):
             dst = os.path.join(dirname, os.path.basename(schema))
 
-            t = ProcessTask.objects.create(
-                name="ESSArch_Core.tasks.DownloadFile",
-                params={'src': schema, 'dst': dst},
-                processstep_id=self.step,
-                processstep_pos=self.step_pos,
-                responsible_id=self.responsible,
-                information_package_id=self.ip,
-            )
+            if store is not None:
+                # schemas are downloaded once and then linked into each IP
+                store.place(schema, dst)
+            else:
+                t = ProcessTask.objects.create(
+                    name="ESSArch_Core.tasks.DownloadFile",
+                    params={'src': schema, 'dst': dst},
+                    processstep_id=self.step,
+                    processstep_pos=self.step_pos,
+                    responsible_id=self.responsible,
+                    information_package_id=self.ip,
+                )
+
+                t.run().get()
 
-            t.run().get()
+            if catalog is not None:
+                # the catalog is only used to speed up validation, failing
+                # to add a schema must not fail the download
+                try:
+                    with open(dst, 'rb') as f:
+                        catalog.add(schema, content=f.read())
+                except Exception:
+                    logger.exception('Failed to add %s to schema catalog' % schema)
 
     def undo(self, template=None, dirname=None, structure=[], root="", task=None):
         pass
@@ -1134,7 +1198,7 @@ class MountTape(DBTask):
         wait_to_come_online(tape_drive.device, timeout)
 
         if medium.format not in [100, 101]:
-            label_root = Path.objects.get(entity='label').value
+            label_root = get_path('label')
             xmlpath = os.path.join(label_root, '%s_label.xml' % medium.medium_id)
 
             if tape_empty(tape_drive.device):
@@ -1342,3 +1406,28 @@ class ConvertFile(DBTask):
 
     def event_outcome_success(self, filepath, new_format):
         pass
+
+
+class ArchiveProcessTasks(DBTask):
+    hidden = True
+
+    def run(self, retention=None, batch_size=None):
+        """
+        Moves finished tasks to the task archive
+
+        Args:
+            retention: Number of days to keep finished tasks, defaults to the
+                WORKFLOW_TASK_RETENTION setting
+            batch_size: Number of tasks to archive in each transaction
+
+        Returns:
+            The number of archived tasks
+        """
+
+        return archive_tasks(retention=retention, batch_size=batch_size)
+
+    def undo(self, retention=None, batch_size=None):
+        pass
+
+    def event_outcome_success(self, retention=None, batch_size=None):
+        pass
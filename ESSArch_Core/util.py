@@ -48,6 +48,8 @@ from subprocess import Popen, PIPE
 
 import requests
 
+from ESSArch_Core.essxml.schemas import get_import_schema
+
 XSD_NAMESPACE = "http://www.w3.org/2001/XMLSchema"
 XSI_NAMESPACE = "http://www.w3.org/2001/XMLSchema-instance"
 
@@ -65,9 +67,93 @@ def remove_prefix(text, prefix):
     return text
 
 
+_xpaths = {}
+
+
+def compile_xpath(expr):
+    """
+    Returns a compiled version of the XPath expression, compiled expressions
+    are cached and reused on subsequent calls
+    """
+
+    try:
+        return _xpaths[expr]
+    except KeyError:
+        xpath = _xpaths[expr] = etree.XPath(expr)
+        return xpath
+
+
+def local_name_xpath(path):
+    return ".//" + "/".join(["*[local-name()='%s']" % e for e in path.split("/")])
+
+
 def get_elements_without_namespace(root, path):
-    els = path.split("/")
-    return root.xpath(".//" + "/".join(["*[local-name()='%s']" % e for e in els]))
+    return compile_xpath(local_name_xpath(path))(root)
+
+
+class ValueAccessor(object):
+    """
+    A precompiled equivalent of get_value_from_path for a single path.
+
+    Attributes are matched on their local name by comparing the names of
+    the attributes of each element as strings, an element can have
+    attributes with the same local name in several namespaces so the first
+    one in document order is used.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.attr = None
+        self.xpath = None
+        self.suffix = None
+
+        if path is None:
+            return
+
+        nested = path
+        if "@" in path:
+            if path.count("@") == 1:
+                nested, self.attr = path.split("@")
+            else:
+                nested, self.attr = '', path[1:]
+
+        if nested:
+            self.xpath = compile_xpath(local_name_xpath(nested))
+
+        if self.attr is not None:
+            self.suffix = '}' + self.attr
+
+    def get_attribute(self, el):
+        for a in el.keys():
+            if a == self.attr or a.endswith(self.suffix):
+                return el.get(a)
+
+        return None
+
+    def __call__(self, el):
+        if self.path is None or el is None:
+            return None
+
+        if self.xpath is not None:
+            found = self.xpath(el)
+            if found:
+                el = found[0]
+
+        if self.attr is not None:
+            return self.get_attribute(el)
+
+        return el.text
+
+
+_accessors = {}
+
+
+def get_accessor(path):
+    try:
+        return _accessors[path]
+    except KeyError:
+        accessor = _accessors[path] = ValueAccessor(path)
+        return accessor
 
 
 def get_value_from_path(el, path):
@@ -92,35 +178,7 @@ def get_value_from_path(el, path):
         path: The path to the text or attribute
     """
 
-    if path is None:
-        return None
-
-    if "@" in path:
-        try:
-            nested, attr = path.split('@')
-            try:
-                el = get_elements_without_namespace(el, nested)[0]
-            except IndexError:
-                pass
-
-            if el is None:
-                return None
-        except (ValueError, SyntaxError):
-            attr = path[1:]
-
-        for a, val in el.attrib.iteritems():
-            if re.sub(r'{.*}', '', a) == attr:
-                return val
-    else:
-        try:
-            el = get_elements_without_namespace(el, path)[0]
-        except IndexError:
-            pass
-
-        try:
-            return el.text
-        except AttributeError:
-            pass
+    return get_accessor(path)(el)
 
 
 def available_tasks():
@@ -173,10 +231,11 @@ def create_event(eventType, eventOutcome, eventOutcomeDetailNote, version, agent
     return e
 
 
-def getSchemas(doc=None, filename=None):
+def getSchemas(doc=None, filename=None, cache=None):
     """
         Creates a schema based on the schemas specified in the provided XML
-        file's schemaLocation attribute
+        file's schemaLocation attribute, the compiled schema is cached for
+        each set of schema locations
     """
 
     if filename:
@@ -187,27 +246,16 @@ def getSchemas(doc=None, filename=None):
         except IOError:
             raise
 
-    res = []
     root = doc.getroot()
     xsi_NS = "%s" % root.nsmap['xsi']
 
-    xsd_NS = "{%s}" % XSD_NAMESPACE
-    NSMAP = {'xsd': XSD_NAMESPACE}
-
-    root = etree.Element(xsd_NS + "schema", nsmap=NSMAP)
-    root.attrib["elementFormDefault"] = "qualified"
-
+    locations = set()
     schema_locations = set(doc.xpath("//*/@xsi:schemaLocation", namespaces={'xsi': xsi_NS}))
     for schema_location in schema_locations:
         ns_locs = schema_location.split()
-        for ns, loc in zip(ns_locs[:-1], ns_locs[1:]):
-            res.append([ns, loc])
-            etree.SubElement(root, xsd_NS + "import", attrib={
-                "namespace": ns,
-                "schemaLocation": loc
-            })
-
-    return etree.XMLSchema(root)
+        locations.update(zip(ns_locs[::2], ns_locs[1::2]))
+
+    return get_import_schema(locations, cache)
 
 
 def creation_date(path_to_file):
@@ -22,15 +22,111 @@
     Email - essarch@essolutions.se
 """
 
+import itertools
+import json
+
+from django.http import StreamingHttpResponse
+
 from django_datatables_view.base_datatable_view import DatatableMixin
 from rest_framework import viewsets, mixins, permissions, views
 from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+# the number of levels of related managers that are prefetched, related
+# managers are rendered recursively using the same columns as the rows
+MAX_PREFETCH_DEPTH = 2
+
+
+def _get_fields_by_accessor(model):
+    fields = {}
+
+    for field in model._meta.get_fields():
+        if field.auto_created and not field.concrete:
+            # reverse relations are accessed using their accessor name,
+            # e.g. foo_set
+            fields[field.get_accessor_name()] = field
+        else:
+            fields[field.name] = field
+
+    return fields
+
+
+def get_column_plan(model, columns, depth=0):
+    """
+    Derives the related objects and fields needed to render the given
+    columns of rows of the model.
+
+    Related objects used in column paths (e.g. "foo.bar") are selected,
+    related managers (e.g. "foo_set") are prefetched together with the
+    related objects needed to render their items.
+
+    Returns:
+        A tuple with the lookups to select, the lookups to prefetch and the
+        fields to load. The fields are None if any column isn't a field
+        (e.g. a property or method) or is a related object, since those
+        might need any field.
+    """
+
+    select, prefetch, only = set(), set(), set()
+    complete = True
+
+    for column in columns:
+        fields = _get_fields_by_accessor(model)
+        parts = column.split('.')
+        path = []
+
+        for i, part in enumerate(parts):
+            field = fields.get(part)
+            last = i == len(parts) - 1
+
+            if field is None:
+                complete = False
+                break
+
+            path.append(part)
+            lookup = '__'.join(path)
+
+            if not field.is_relation:
+                if last:
+                    only.add(lookup)
+                else:
+                    complete = False
+                break
+
+            if field.many_to_many or field.one_to_many:
+                if last:
+                    prefetch.add(lookup)
+
+                    if depth < MAX_PREFETCH_DEPTH:
+                        nested = get_column_plan(field.related_model, columns, depth + 1)
+                        prefetch.update('%s__%s' % (lookup, l) for l in nested[0] | nested[1])
+                else:
+                    complete = False
+                break
+
+            select.add(lookup)
+
+            if last:
+                complete = False
+                break
+
+            fields = _get_fields_by_accessor(field.related_model)
+
+    return select, prefetch, only if complete else None
+
 
 class DatatableBaseView(views.APIView, DatatableMixin):
     
     absolute_url_link_flag = False
     qs = None
 
+    # only load the fields used by the columns, subclasses rendering
+    # columns using other fields should disable this
+    defer_unused_fields = True
+
+    # the number of rows to fetch at a time when streaming the rows
+    chunk_size = 100
+
     def get_initial_queryset(self):
         if self.qs:
             return self.qs
@@ -76,14 +172,78 @@ class DatatableBaseView(views.APIView, DatatableMixin):
 
     is_clean = False
 
+    def plan_queryset(self, qs):
+        """
+        Selects, prefetches and restricts the fields of the queryset based
+        on the columns, to avoid queries when rendering each row
+        """
+
+        select, prefetch, only = get_column_plan(qs.model, self.get_columns())
+
+        if select:
+            qs = qs.select_related(*select)
+
+        if prefetch:
+            qs = qs.prefetch_related(*prefetch)
+
+        if only and self.defer_unused_fields and not self.absolute_url_link_flag:
+            qs = qs.only(*only)
+
+        return qs
+
+    def paging(self, qs):
+        return super(DatatableBaseView, self).paging(self.plan_queryset(qs))
+
+    def iter_chunks(self, qs):
+        start = 0
+        stop = None
+
+        if qs.query.high_mark is not None:
+            stop = qs.query.high_mark - qs.query.low_mark
+
+        while stop is None or start < stop:
+            end = start + self.chunk_size
+            if stop is not None:
+                end = min(end, stop)
+
+            chunk = list(qs[start:end])
+            if not chunk:
+                break
+
+            yield chunk
+
+            if len(chunk) < end - start:
+                break
+
+            start = end
+
+    def render_row(self, row):
+        d = {}
+        for column in self.get_columns():
+            d[column] = self.render_column(row, column)
+        return d
+
     def prepare_results(self, qs):
-        data = []
-        for item in qs:
-            d={}
-            for column in self.get_columns():
-                d[column]=self.render_column(item, column)
-            data.append(d)
-        return data
+        # the first chunk is rendered immediately to report errors in the
+        # response, the rest are rendered while the response is streamed
+        chunks = self.iter_chunks(qs)
+        first = [self.render_row(item) for item in next(chunks, [])]
+        rest = (self.render_row(item) for chunk in chunks for item in chunk)
+        return itertools.chain(first, rest)
+
+    def stream_response(self, response, rows_key):
+        rows = response.pop(rows_key)
+        head = json.dumps(response, cls=JSONEncoder)[:-1]
+
+        def content():
+            yield '%s%s"%s": [' % (head, ', ' if response else '', rows_key)
+
+            for i, row in enumerate(rows):
+                yield '%s%s' % (', ' if i else '', json.dumps(row, cls=JSONEncoder))
+
+            yield ']}'
+
+        return StreamingHttpResponse(content(), content_type='application/json')
 
     def post(self, *args, **kwargs):
         return self.get(*args, **kwargs)
@@ -117,4 +277,8 @@ class DatatableBaseView(views.APIView, DatatableMixin):
                         'sError': msg,
                         'text': msg}
 
+        for rows_key in ['data', 'aaData']:
+            if isinstance(response, dict) and rows_key in response and not isinstance(response[rows_key], list):
+                return self.stream_response(response, rows_key)
+
         return Response(response)
\ No newline at end of file